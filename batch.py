@@ -0,0 +1,231 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import json
+import os
+import time
+
+from engine import STRATEGIES, rewrite_to_fixpoint
+from graph_io import GRAPH_FORMATS, load_graph_manager, save_graph_binary, save_graph_manager
+from journal import JOURNAL_EXTENSION, DerivationJournal
+from store import DEFAULT_STORE_PATH
+from utils.file_operations import load_rules
+
+# Rules and options of the worker process, set once by _init_worker
+_worker_rules = None
+_worker_options = None
+
+def _init_worker(rules, options):
+    global _worker_rules, _worker_options
+    _worker_rules = rules
+    _worker_options = options
+
+def _rewrite_file(graph_path):
+    """Rewrite a single graph file and write the result to the output directory."""
+    options = _worker_options
+    start = time.monotonic()
+    try:
+        host_graph_manager = load_graph_manager(graph_path)
+        name = os.path.splitext(os.path.basename(graph_path))[0]
+        journal = None
+        if options['journal']:
+            journal_path = os.path.join(options['output_dir'], name + JOURNAL_EXTENSION)
+            journal = DerivationJournal(journal_path, host_graph_manager, {'graph': graph_path})
+        try:
+            stats = rewrite_to_fixpoint(
+                host_graph_manager,
+                _worker_rules,
+                strategy=options['strategy'],
+                max_steps=options['max_steps'],
+                timeout=options['timeout'],
+                max_rounds=options['max_rounds'],
+                persist_node_id=options['persist_node_id'],
+                shared_patterns=options['shared_patterns'],
+                journal=journal,
+            )
+        finally:
+            if journal is not None:
+                journal.close()
+        output_format = options['output_format']
+        output_path = os.path.join(options['output_dir'], name + GRAPH_FORMATS[output_format])
+        if output_format == 'binary':
+            save_graph_binary(host_graph_manager, output_path, {'timestamp': datetime.now().isoformat(), 'stats': stats})
+        elif output_format != 'json':
+            save_graph_manager(host_graph_manager, output_path, output_format)
+        else:
+            with open(output_path, 'w') as f:
+                # Same format as the graphs saved from the UI, so results can be loaded there
+                json.dump({
+                    'elements': host_graph_manager.elements,
+                    'timestamp': datetime.now().isoformat(),
+                    'stats': stats,
+                }, f)
+        return graph_path, output_path, stats['steps'], stats['stopped'], time.monotonic() - start, None
+    except Exception as e:
+        return graph_path, None, 0, None, time.monotonic() - start, str(e)
+
+def collect_graph_files(paths):
+    """
+    Expand graph file and directory arguments into a list of graph files.
+
+    Parameters
+    ----------
+    paths : list
+        Graph files, or directories whose files with the extension of one of
+        the `GRAPH_FORMATS` are used.
+
+    Returns
+    -------
+    list
+        Paths of the graph files, sorted per directory.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                os.path.join(path, filename) for filename in os.listdir(path)
+                if filename.endswith(tuple(GRAPH_FORMATS.values()))
+            ))
+        else:
+            files.append(path)
+    return files
+
+def run_batch(graph_files, rules, output_dir, workers=None, strategy='parallel', max_steps=None,
+              timeout=None, max_rounds=1, persist_node_id=True, shared_patterns=False, output_format='json',
+              journal=False):
+    """
+    Apply a rule set to many graphs in a process pool.
+
+    Each result is written to `output_dir` under the name of its input file as
+    soon as it is ready, together with the statistics of its derivation.
+    Input files can be in any of the `GRAPH_FORMATS` of `graph_io`.
+
+    Parameters
+    ----------
+    graph_files : list
+        Paths of the graph files, as written by `save_graph_to_file` or
+        `save_graph_manager`.
+    rules : list
+        The rule data dicts.
+    output_dir : str
+        Directory where the rewritten graphs are written.
+    workers : int, optional
+        Number of worker processes; defaults to the number of CPUs. With 1 the
+        graphs are rewritten in this process.
+    strategy : str, optional
+        One of `engine.STRATEGIES`.
+    max_steps : int, optional
+        Maximum number of rule applications per graph.
+    timeout : float, optional
+        Time budget in seconds per graph.
+    max_rounds : int, optional
+        Maximum number of passes over the rules per graph. The default of one
+        parallel round matches the "Apply Rules" button; None rewrites to a
+        fixpoint.
+    persist_node_id : bool, optional
+        Whether LHS nodes may only be matched to host nodes with the same ID,
+        as done by the "Apply Rules" button.
+    shared_patterns : bool, optional
+        Whether to match the rules with a `PatternNetwork`, sharing the
+        sub-patterns they have in common.
+    output_format : str, optional
+        ``'json'`` to write graphs like the UI saves them, or another key of
+        `GRAPH_FORMATS`. Only JSON and binary files keep the statistics.
+    journal : bool, optional
+        Whether to write the derivation of each graph to a `DerivationJournal`
+        next to its result, which `journal.py` can replay.
+
+    Returns
+    -------
+    dict
+        Totals of the run: ``graphs``, ``failed``, ``applications`` and
+        ``elapsed`` seconds.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    options = {
+        'output_dir': output_dir,
+        'strategy': strategy,
+        'max_steps': max_steps,
+        'timeout': timeout,
+        'max_rounds': max_rounds,
+        'persist_node_id': persist_node_id,
+        'shared_patterns': shared_patterns,
+        'output_format': output_format,
+        'journal': journal,
+    }
+
+    start = time.monotonic()
+    totals = {'graphs': 0, 'failed': 0, 'applications': 0}
+
+    def report(result):
+        graph_path, output_path, steps, stopped, elapsed, error = result
+        if error is not None:
+            totals['failed'] += 1
+            print(f"FAILED {graph_path}: {error}")
+            return
+        totals['graphs'] += 1
+        totals['applications'] += steps
+        print(f"{graph_path} -> {output_path}: {steps} applications ({stopped}) in {elapsed:.3f}s")
+
+    if workers == 1:
+        _init_worker(rules, options)
+        for graph_path in graph_files:
+            report(_rewrite_file(graph_path))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rules, options)) as executor:
+            futures = [executor.submit(_rewrite_file, graph_path) for graph_path in graph_files]
+            for future in as_completed(futures):
+                report(future.result())
+
+    totals['elapsed'] = time.monotonic() - start
+    return totals
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply saved DPO rules to graph files without the UI.")
+    parser.add_argument('graphs', nargs='+', help="graph files in any format, or directories containing them")
+    parser.add_argument('--rules', '--rules-dir', dest='rules', default=DEFAULT_STORE_PATH,
+                        help=f"rule store database or directory of rule files (default: {DEFAULT_STORE_PATH})")
+    parser.add_argument('--output-dir', default='batch_output', help="directory for the rewritten graphs (default: batch_output)")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument('--strategy', choices=STRATEGIES, default='parallel', help="rewriting strategy (default: parallel)")
+    parser.add_argument('--max-rounds', type=int, default=1, help="passes over the rules per graph, 0 for no limit (default: 1)")
+    parser.add_argument('--max-steps', type=int, default=None, help="maximum rule applications per graph")
+    parser.add_argument('--timeout', type=float, default=None, help="time budget per graph in seconds")
+    parser.add_argument('--match-structure', action='store_true',
+                        help="match LHS nodes to any host nodes instead of only to nodes with the same ID")
+    parser.add_argument('--shared-patterns', action='store_true',
+                        help="match all rules in one network sharing their common sub-patterns")
+    parser.add_argument('--output-format', choices=tuple(GRAPH_FORMATS), default='json',
+                        help="format of the rewritten graphs (default: json)")
+    parser.add_argument('--journal', action='store_true',
+                        help=f"write every rule application to a {JOURNAL_EXTENSION} file next to each result")
+    args = parser.parse_args(argv)
+
+    rules = load_rules(args.rules)
+    if not rules:
+        parser.error(f"no rules found in {args.rules}")
+    graph_files = collect_graph_files(args.graphs)
+
+    totals = run_batch(
+        graph_files,
+        rules,
+        args.output_dir,
+        workers=args.workers,
+        strategy=args.strategy,
+        max_steps=args.max_steps,
+        timeout=args.timeout,
+        max_rounds=args.max_rounds or None,
+        persist_node_id=not args.match_structure,
+        shared_patterns=args.shared_patterns,
+        output_format=args.output_format,
+        journal=args.journal,
+    )
+
+    elapsed = totals['elapsed']
+    print(f"Processed {totals['graphs']} graphs ({totals['failed']} failed) with {len(rules)} rules in {elapsed:.2f}s: "
+          f"{totals['graphs'] / elapsed if elapsed else 0:.1f} graphs/s, "
+          f"{totals['applications'] / elapsed if elapsed else 0:.1f} applications/s")
+    return 1 if totals['failed'] else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,46 +1,124 @@
 import dash
 from dash.dependencies import Input, Output, State, ALL
 from datetime import datetime
-import json
-import base64
 
-from classes import GraphManager
+import graph_session
+from graph_io import read_graph_upload
+from jobs import start_job, get_job, pop_job
 from utils.layout import get_default_graph_layout
-from utils.file_operations import save_graph_to_file
+from utils.file_operations import get_store
+from utils.patch import graph_update
+
+def _load_progress_message(job):
+    progress = job.progress
+    if not progress:
+        return f"Loading graph... ({job.elapsed:.1f}s)"
+    fraction = progress['bytes_read'] / progress['bytes_total'] if progress['bytes_total'] else 1.0
+    return (f"Loading graph: {fraction:.0%} read, {progress['nodes']} nodes and "
+            f"{progress['edges']} edges so far ({job.elapsed:.1f}s)")
+
+def _load_uploaded_graph(job, version, contents, filename):
+    """
+    Build the graph of an upload in a background job.
+
+    Parameters
+    ----------
+    job : RewriteJob
+        The job, used to report progress.
+    version : dict
+        The version of the main graph the page holds.
+    contents : str
+        The contents of the upload.
+    filename : str
+        The name of the uploaded file, which gives the format of text graph files.
+
+    Returns
+    -------
+    tuple
+        The elements of the graph, the alert and the new version of the main graph.
+    """
+    graph_manager, stats = read_graph_upload(contents, progress=job.report, filename=filename)
+    session = graph_session.get_session(version, create=True)
+    with session.lock:
+        version = session.load(graph_manager)
+    message = f"Loaded {stats['nodes']} nodes and {stats['edges']} edges in {job.elapsed:.1f}s"
+    skipped = []
+    if stats['dangling_edges']:
+        skipped.append(f"{stats['dangling_edges']} edges to unknown nodes")
+    if stats['duplicate_edges']:
+        skipped.append(f"{stats['duplicate_edges']} duplicate edges")
+    if skipped:
+        return graph_manager.elements, {'message': f"{message}. Skipped {' and '.join(skipped)}.", 'type': 'error'}, version
+    return graph_manager.elements, {'message': f"{message}.", 'type': 'success'}, version
 
 def register_main_graph_callbacks(app):
     @app.callback(
-        Output('main-graph', 'elements'),
+        [Output('main-graph', 'elements'),
+         Output('main-graph-version', 'data', allow_duplicate=True),
+         Output('main-graph-sync-request', 'data', allow_duplicate=True),
+         Output('alert-store', 'data', allow_duplicate=True)],
         [Input('add-node-button', 'n_clicks'),
         Input('add-edge-button', 'n_clicks'),
         Input('remove-selected-button', 'n_clicks')],
-        [State('main-graph', 'elements'),
+        [State('main-graph-version', 'data'),
         State('main-graph', 'selectedNodeData'),
-        State('main-graph', 'selectedEdgeData')]
+        State('main-graph', 'selectedEdgeData')],
+        prevent_initial_call=True
     )
-    def update_graph(n_clicks_node, n_clicks_edge, n_clicks_remove, elements, selected_nodes, selected_edges):
+    def update_graph(n_clicks_node, n_clicks_edge, n_clicks_remove, version, selected_nodes, selected_edges):
         print("update_graph callback triggered")
         ctx = dash.callback_context
         if not ctx.triggered:
-            return elements
-        
-        main_graph = GraphManager.from_elements(elements)
-        button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-        
-        if button_id == 'add-node-button':
-            node_id = str(len([element for element in main_graph.elements if 'source' not in element['data']]) + 1)
-            main_graph.add_node(node_id)
-        elif button_id == 'add-edge-button':
-            if selected_nodes and len(selected_nodes) >= 2:
-                for i in range(len(selected_nodes)):
-                    for j in range(i + 1, len(selected_nodes)):
-                        source, target = selected_nodes[i]['id'], selected_nodes[j]['id']
-                        main_graph.add_edge(source, target)
-        elif button_id == 'remove-selected-button':
-            main_graph.remove_elements(selected_nodes, selected_edges)
-        
-        return main_graph.elements
-    
+            return (dash.no_update,) * 4
+
+        session = graph_session.get_session(version)
+        if session is None:
+            return dash.no_update, dash.no_update, graph_session.sync_request(), graph_session.OUT_OF_SYNC_ALERT
+        if not session.lock.acquire(blocking=False):
+            return (dash.no_update,) * 3 + ({'message': "Rules are being applied. Try again when they are done.", 'type': 'error'},)
+        try:
+            # The graph is edited on the server, and only the changed elements are sent back
+            history = session.get_history(version)
+            if history is None:
+                return dash.no_update, dash.no_update, graph_session.sync_request(), graph_session.OUT_OF_SYNC_ALERT
+            main_graph = history.graph_manager
+            button_id = ctx.triggered[0]['prop_id'].split('.')[0]
+
+            if button_id == 'add-node-button':
+                with main_graph.begin('Add node') as transaction:
+                    node_id = str(len(main_graph.core) + 1)
+                    main_graph.add_node(node_id)
+            elif button_id == 'add-edge-button':
+                with main_graph.begin('Add edge') as transaction:
+                    if selected_nodes and len(selected_nodes) >= 2:
+                        for i in range(len(selected_nodes)):
+                            for j in range(i + 1, len(selected_nodes)):
+                                source, target = selected_nodes[i]['id'], selected_nodes[j]['id']
+                                main_graph.add_edge(source, target)
+            else:
+                with main_graph.begin('Remove selected') as transaction:
+                    main_graph.remove_elements(selected_nodes, selected_edges)
+
+            if not transaction.changes:
+                return (dash.no_update,) * 4
+            update = graph_update(main_graph, transaction.changes, element_keys=session.element_keys)
+            return update, session.changed(), dash.no_update, dash.no_update
+        finally:
+            session.lock.release()
+
+    @app.callback(
+        Output('main-graph-version', 'data', allow_duplicate=True),
+        Input('main-graph-sync-request', 'data'),
+        [State('main-graph', 'elements'),
+         State('main-graph-version', 'data')],
+        prevent_initial_call='initial_duplicate'
+    )
+    def sync_main_graph(request, elements, version):
+        # Runs when the page is loaded, starting its session, and when the server holds another graph than the page
+        session = graph_session.get_session(version, create=True)
+        with session.lock:
+            return session.sync(elements or [])
+
     @app.callback(
         Output('main-graph', 'layout', allow_duplicate=True),
         Input('reset-view-button', 'n_clicks'),
@@ -53,20 +131,24 @@ def register_main_graph_callbacks(app):
         return dash.no_update
     
     @app.callback(
-        Output('save-graph-button', 'n_clicks', allow_duplicate=True),
+        [Output('save-graph-button', 'n_clicks', allow_duplicate=True),
+         Output('saved-graph-id', 'data', allow_duplicate=True)],
         Input('save-graph-button', 'n_clicks'),
-        State('main-graph', 'elements'),
+        [State('main-graph', 'elements'),
+         State('saved-graph-id', 'data')],
         prevent_initial_call=True
     )
-    def save_graph(n_clicks, elements):
+    def save_graph(n_clicks, elements, graph_id):
         if n_clicks > 0:
             graph_data = {
                 'elements': elements,
                 'timestamp': datetime.now().isoformat()
             }
-            filepath = save_graph_to_file(graph_data)
-            print(f"Graph saved to: {filepath}")
-        return 0  # Reset n_clicks
+            # Saving the same graph again adds a version of it
+            graph_id, version = get_store().save_graph(graph_data, graph_id)
+            print(f"Graph saved as {graph_id}, version {version}")
+            return 0, graph_id  # Reset n_clicks
+        return 0, dash.no_update
     
     # @app.callback(
     #     Output('graph-upload', 'contents'),
@@ -80,24 +162,46 @@ def register_main_graph_callbacks(app):
     #     return dash.no_update
     
     @app.callback(
-        Output('main-graph', 'elements', allow_duplicate=True),
+        [Output('graph-load-job-store', 'data', allow_duplicate=True),
+         Output('graph-load-job-interval', 'disabled', allow_duplicate=True),
+         Output('alert-store', 'data', allow_duplicate=True)],
         Input('graph-upload', 'contents'),
+        State('graph-upload', 'filename'),
+        State('main-graph-version', 'data'),
         prevent_initial_call=True
     )
-    def load_graph(contents):
+    def load_graph(contents, filename, version):
         if contents is None:
-            return dash.no_update
-        
-        try:
-            # Remove the data URL prefix (e.g., "data:application/json;base64,")
-            content_type, content_string = contents.split(',')
-            decoded = base64.b64decode(content_string)
-            graph_data = json.loads(decoded)
-            
-            # Create a GraphManager instance to validate the data
-            graph_manager = GraphManager.from_dict(graph_data)
-            return graph_manager.elements
-            
-        except Exception as e:
-            print(f'Error loading graph: {e}')
-            return dash.no_update
\ No newline at end of file
+            return dash.no_update, dash.no_update, dash.no_update
+
+        # Large graphs take a while to parse, so they are loaded in a job polled for progress
+        job = start_job(_load_uploaded_graph, version, contents, filename, queue=graph_session.job_queue(version))
+        return job.id, False, {'message': "Loading graph...", 'type': 'info'}
+
+    @app.callback(
+        [Output('main-graph', 'elements', allow_duplicate=True),
+         Output('alert-store', 'data', allow_duplicate=True),
+         Output('graph-load-job-store', 'data', allow_duplicate=True),
+         Output('graph-load-job-interval', 'disabled', allow_duplicate=True),
+         Output('saved-graph-id', 'data', allow_duplicate=True),
+         Output('main-graph-version', 'data', allow_duplicate=True)],
+        Input('graph-load-job-interval', 'n_intervals'),
+        State('graph-load-job-store', 'data'),
+        prevent_initial_call=True
+    )
+    def poll_graph_load_job(n_intervals, job_id):
+        job = get_job(job_id) if job_id else None
+        if job is None:
+            return dash.no_update, dash.no_update, None, True, dash.no_update, dash.no_update
+        if not job.is_finished:
+            return (dash.no_update, {'message': _load_progress_message(job), 'type': 'info'},
+                    dash.no_update, dash.no_update, dash.no_update, dash.no_update)
+
+        pop_job(job_id)
+        if job.status == 'failed':
+            print(f'Error loading graph: {job.error}')
+            return (dash.no_update, {'message': f"Loading the graph failed: {job.error}", 'type': 'error'},
+                    None, True, dash.no_update, dash.no_update)
+        elements, alert, version = job.result
+        # The loaded graph is saved as a new graph, not as a version of the one saved before
+        return elements, alert, None, True, None, version
\ No newline at end of file
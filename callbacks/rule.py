@@ -8,8 +8,173 @@ import json
 import uuid
 
 from classes import GraphManager, RuleManager
-from dpo import match_subgraph, apply_dpo_rule, apply_rule_parallel
-from utils.file_operations import save_rule_to_file, load_rules_from_directory, load_saved_rules_list, delete_rule_file
+from dpo import match_subgraph, apply_dpo_rule, apply_rule_parallel, new_delta
+from engine import rewrite_to_fixpoint
+import graph_session
+from jobs import start_job, get_job, pop_job, cancel_job
+from match_index import MatchIndex
+from rule_analysis import analyze_rules
+from rule_plan import compile_rule
+from utils.file_operations import get_store, load_saved_rules_list, saved_rules_page_count
+from utils.patch import graph_update, rule_patch
+
+# Budget of a single "Apply Until Done" click
+FIXPOINT_MAX_STEPS = 10000
+FIXPOINT_TIMEOUT = 30.0
+
+def _progress_message(job):
+    progress = job.progress
+    if not progress:
+        return f"Applying rules... ({job.elapsed:.1f}s)"
+    message = f"Applying rules: {progress['rules_done']}/{progress['rules']} rules done"
+    if progress.get('rounds', 1) > 1:
+        message += f" in round {progress['rounds']}"
+    return f"{message}, {progress['steps']} transformations so far ({job.elapsed:.1f}s)"
+
+def _rewrite_main_graph(job, version, label, rewrite, *args):
+    """
+    Rewrite the main graph in a background job, recording its steps in the history.
+
+    Parameters
+    ----------
+    job : RewriteJob
+        The job.
+    version : dict
+        The version of the main graph the page holds.
+    label : str
+        The label of the history versions.
+    rewrite : callable
+        Called as ``rewrite(job, host_graph_manager, match_indexes, label, *args)``
+        with the match indexes of the session, by rule ID; makes its changes
+        in labelled transactions, each becoming a version of the history, and
+        returns whether the graph should be kept and the alert. If the graph
+        is not kept, the versions are reverted. The rewrite updates the match
+        indexes for its changes or removes them.
+
+    Returns
+    -------
+    tuple
+        The update of the elements of the main graph, the alert, the new
+        version of the main graph and the request to sync it, each
+        ``dash.no_update`` if unchanged.
+    """
+    session = graph_session.get_session(version)
+    if session is None:
+        return dash.no_update, graph_session.OUT_OF_SYNC_ALERT, dash.no_update, graph_session.sync_request()
+    with session.lock:
+        history = session.get_history(version)
+        if history is None:
+            return dash.no_update, graph_session.OUT_OF_SYNC_ALERT, dash.no_update, graph_session.sync_request()
+        host_graph_manager = history.graph_manager
+        match_indexes = session.match_indexes
+        # The indexes are updated in place, so they are only kept along with the changes
+        session.match_indexes = {}
+        with history.keeping_versions() as start:
+            try:
+                keep, alert = rewrite(job, host_graph_manager, match_indexes, label, *args)
+            except BaseException:
+                history.revert(start)
+                raise
+            if not keep:
+                history.revert(start)
+                return dash.no_update, alert, dash.no_update, dash.no_update
+            changes = [operation for step in history.versions[start + 1:] for operation in step.changes]
+        update = graph_update(host_graph_manager, changes, element_keys=session.element_keys)
+        return update, alert, session.changed(match_indexes), dash.no_update
+
+def _apply_rules(job, host_graph_manager, match_indexes, label, rules):
+    """
+    Apply each rule once at all its parallel independent matches, as one version of the history.
+
+    Parameters
+    ----------
+    job : RewriteJob
+        The job, used to report progress and check for cancellation between rules.
+    host_graph_manager : GraphManager
+        The host graph manager.
+    match_indexes : dict
+        The match indexes of the session, by rule ID, reused for rules they
+        were built for and replaced by the indexes of `rules`.
+    label : str
+        The label of the version.
+    rules : list
+        The rule data dicts.
+
+    Returns
+    -------
+    tuple
+        Whether any rule was applied and the job was not cancelled, and the alert.
+    """
+    # Reuse the match indexes of the previous click, which the session keeps while the graph is unchanged
+    indexes = []
+    for rule in rules:
+        plan = compile_rule(rule)
+        index = match_indexes.get(rule['id'])
+        if index is None or not index.attach(host_graph_manager, plan):
+            index = MatchIndex(host_graph_manager, plan)
+        indexes.append((rule['id'], index))
+    match_indexes.clear()
+    match_indexes.update(indexes)
+    # Only the indexes of rules an application can affect need to be updated after it
+    triggers = analyze_rules([index.plan for _, index in indexes])
+
+    total_applications = 0
+    with host_graph_manager.begin(label) as transaction:
+        for rules_done, (_, index) in enumerate(indexes):
+            if job.cancelled:
+                transaction.rollback()
+                return False, {'message': f"Cancelled after {rules_done} of {len(indexes)} rules. The graph was left unchanged.", 'type': 'error'}
+
+            delta = new_delta()
+            successful_applications = apply_rule_parallel(host_graph_manager, index.plan, index.get_matches(), delta)
+            total_applications += successful_applications
+            if successful_applications > 0:
+                for other in triggers.affected_by(rules_done):
+                    indexes[other][1].update(delta)
+            job.report(rules_done=rules_done + 1, rules=len(indexes), steps=total_applications)
+
+    # Return appropriate alert message based on total applications
+    if total_applications > 0:
+        return True, {'message': f"Rules applied successfully! Total transformations: {total_applications}", 'type': 'success'}
+    else:
+        return False, {'message': "No rules could be applied to the current graph. Check if your rules match any part of the graph.", 'type': 'error'}
+
+def _apply_rules_to_fixpoint(job, host_graph_manager, match_indexes, label, rules):
+    """
+    Apply the rules until none of them matches, as one version of the history per round.
+
+    Parameters
+    ----------
+    job : RewriteJob
+        The job, used to report progress and to cancel the derivation.
+    host_graph_manager : GraphManager
+        The host graph manager.
+    match_indexes : dict
+        The match indexes of the session, by rule ID, removed as they are not
+        updated by the derivation.
+    label : str
+        The label of the versions, followed by the round number.
+    rules : list
+        The rule data dicts.
+
+    Returns
+    -------
+    tuple
+        Whether any rule was applied and the job was not cancelled, and the alert.
+    """
+    match_indexes.clear()
+    stats = rewrite_to_fixpoint(host_graph_manager, rules, strategy='parallel',
+                                max_steps=FIXPOINT_MAX_STEPS, timeout=FIXPOINT_TIMEOUT,
+                                progress=job.report, cancel=job.cancel_event, label=label)
+    if stats['stopped'] == 'cancelled':
+        return False, {'message': f"Cancelled after {stats['steps']} transformations. The graph was left unchanged.", 'type': 'error'}
+    if stats['steps'] == 0:
+        return False, {'message': "No rules could be applied to the current graph. Check if your rules match any part of the graph.", 'type': 'error'}
+
+    message = f"Rules applied {stats['steps']} times in {stats['rounds']} rounds ({stats['elapsed']:.2f}s)"
+    if stats['stopped'] == 'fixpoint':
+        return True, {'message': f"{message}. No rule matches anymore.", 'type': 'success'}
+    return True, {'message': f"{message}. Stopped early: budget reached ({stats['stopped']}).", 'type': 'error'}
 
 def register_rule_callbacks(app):
     @app.callback(
@@ -83,50 +248,146 @@ def register_rule_callbacks(app):
 
         return dash.no_update, dash.no_update
 
+    job_started_outputs = [
+        Output('rewrite-job-store', 'data', allow_duplicate=True),
+        Output('rewrite-job-interval', 'disabled', allow_duplicate=True),
+        Output('alert-store', 'data', allow_duplicate=True),
+        Output('apply-rules-button', 'disabled', allow_duplicate=True),
+        Output('apply-rules-fixpoint-button', 'disabled', allow_duplicate=True),
+        Output('cancel-rules-button', 'disabled', allow_duplicate=True),
+    ]
+
+    def start_rewrite_job(label, rewrite, version, rules):
+        # Jobs of a page rewrite the same graph, so they run one after the other
+        job = start_job(_rewrite_main_graph, version, label, rewrite, rules, queue=graph_session.job_queue(version))
+        return job.id, False, {'message': "Applying rules...", 'type': 'info'}, True, True, False
+
     @app.callback(
-        [Output('main-graph', 'elements', allow_duplicate=True),
-         Output('alert-store', 'data', allow_duplicate=True)],
+        job_started_outputs,
         Input('apply-rules-button', 'n_clicks'),
-        [State('main-graph', 'elements'),
+        [State('main-graph-version', 'data'),
          State('rules-store', 'data')],
         prevent_initial_call=True
     )
-    def apply_rules(n_clicks, elements, rules):
+    def apply_rules(n_clicks, version, rules):
         print("apply_rules callback triggered")
         if n_clicks > 0:
             if not rules:
-                return dash.no_update, "No rules available to apply. Please create and save at least one rule first."
-            
-            total_applications = 0
-            for rule in rules:
-                rule_manager = RuleManager.from_dict(rule)
-                host_graph_manager = GraphManager.from_elements(elements)
-
-                print("Host graph nodes:")
-                print(host_graph_manager.graph.nodes())
-                print(host_graph_manager.graph.edges())
-
-                # Find all matches of LHS in the host graph
-                successful_applications = apply_rule_parallel(host_graph_manager, rule_manager)
-                total_applications += successful_applications
-
-                print("Host graph nodes after rule application:")
-                print(host_graph_manager.graph.nodes())
-                print(host_graph_manager.graph.edges())
-
-                if successful_applications > 0:
-                    print(f"Rule applied successfully {successful_applications} times")
-                    elements = host_graph_manager.elements
-                else:
-                    print(f"No applicable match found for rule {rule_manager.id}")
-
-            # Return appropriate alert message based on total applications
-            if total_applications > 0:
-                return elements, {'message': f"Rules applied successfully! Total transformations: {total_applications}", 'type': 'success'}
+                return (dash.no_update, dash.no_update,
+                        "No rules available to apply. Please create and save at least one rule first.",
+                        dash.no_update, dash.no_update, dash.no_update)
+            return start_rewrite_job('Apply Rules', _apply_rules, version, rules)
+
+        return (dash.no_update,) * 6
+
+    @app.callback(
+        job_started_outputs,
+        Input('apply-rules-fixpoint-button', 'n_clicks'),
+        [State('main-graph-version', 'data'),
+         State('rules-store', 'data')],
+        prevent_initial_call=True
+    )
+    def apply_rules_to_fixpoint(n_clicks, version, rules):
+        print("apply_rules_to_fixpoint callback triggered")
+        if n_clicks > 0:
+            if not rules:
+                return (dash.no_update, dash.no_update,
+                        "No rules available to apply. Please create and save at least one rule first.",
+                        dash.no_update, dash.no_update, dash.no_update)
+            return start_rewrite_job('Apply Until Done', _apply_rules_to_fixpoint, version, rules)
+
+        return (dash.no_update,) * 6
+
+    @app.callback(
+        Output('alert-store', 'data', allow_duplicate=True),
+        Input('cancel-rules-button', 'n_clicks'),
+        State('rewrite-job-store', 'data'),
+        prevent_initial_call=True
+    )
+    def cancel_rules(n_clicks, job_id):
+        print("cancel_rules callback triggered")
+        if n_clicks > 0 and job_id and cancel_job(job_id):
+            return {'message': "Cancelling...", 'type': 'info'}
+        return dash.no_update
+
+    @app.callback(
+        [Output('main-graph', 'elements', allow_duplicate=True),
+         Output('alert-store', 'data', allow_duplicate=True),
+         Output('rewrite-job-store', 'data', allow_duplicate=True),
+         Output('rewrite-job-interval', 'disabled', allow_duplicate=True),
+         Output('apply-rules-button', 'disabled', allow_duplicate=True),
+         Output('apply-rules-fixpoint-button', 'disabled', allow_duplicate=True),
+         Output('cancel-rules-button', 'disabled', allow_duplicate=True),
+         Output('main-graph-version', 'data', allow_duplicate=True),
+         Output('main-graph-sync-request', 'data', allow_duplicate=True)],
+        Input('rewrite-job-interval', 'n_intervals'),
+        State('rewrite-job-store', 'data'),
+        prevent_initial_call=True
+    )
+    def poll_rewrite_job(n_intervals, job_id):
+        job = get_job(job_id) if job_id else None
+        if job is None:
+            # The job is gone, e.g. after a server restart
+            return dash.no_update, dash.no_update, None, True, False, False, True, dash.no_update, dash.no_update
+
+        if not job.is_finished:
+            if job.cancelled:
+                return (dash.no_update,) * 9
+            return (dash.no_update, {'message': _progress_message(job), 'type': 'info'}) + (dash.no_update,) * 7
+
+        pop_job(job_id)
+        version = sync = dash.no_update
+        if job.status == 'failed':
+            elements, alert = dash.no_update, {'message': f"Applying rules failed: {job.error}", 'type': 'error'}
+        elif job.status == 'cancelled':
+            elements, alert = dash.no_update, {'message': "Cancelled. The graph was left unchanged.", 'type': 'error'}
+        else:
+            elements, alert, version, sync = job.result
+        return elements, alert, None, True, False, False, True, version, sync
+
+    @app.callback(
+        [Output('main-graph', 'elements', allow_duplicate=True),
+         Output('alert-store', 'data', allow_duplicate=True),
+         Output('main-graph-version', 'data', allow_duplicate=True),
+         Output('main-graph-sync-request', 'data', allow_duplicate=True)],
+        [Input('undo-button', 'n_clicks'),
+         Input('redo-button', 'n_clicks')],
+        State('main-graph-version', 'data'),
+        prevent_initial_call=True
+    )
+    def undo_redo(n_clicks_undo, n_clicks_redo, version):
+        print("undo_redo callback triggered")
+        ctx = dash.callback_context
+        if not ctx.triggered or not ctx.triggered[0]['value']:
+            return (dash.no_update,) * 4
+        button_id = ctx.triggered[0]['prop_id'].split('.')[0]
+
+        session = graph_session.get_session(version)
+        if session is None:
+            return dash.no_update, graph_session.OUT_OF_SYNC_ALERT, dash.no_update, graph_session.sync_request()
+        if not session.lock.acquire(blocking=False):
+            return (dash.no_update, {'message': "Rules are being applied. Try again when they are done.", 'type': 'error'},
+                    dash.no_update, dash.no_update)
+        try:
+            history = session.get_history(version)
+            if history is None:
+                return dash.no_update, graph_session.OUT_OF_SYNC_ALERT, dash.no_update, graph_session.sync_request()
+            if button_id == 'undo-button':
+                if not history.undo():
+                    return dash.no_update, {'message': "Nothing to undo.", 'type': 'error'}, dash.no_update, dash.no_update
+                undone = history.versions[history.position + 1]
+                message = f"Undone: {undone.label}"
+                update = graph_update(history.graph_manager, undone.changes, undone=True,
+                                      element_keys=session.element_keys)
             else:
-                return dash.no_update, {'message': "No rules could be applied to the current graph. Check if your rules match any part of the graph.", 'type': 'error'}
-        
-        return dash.no_update, dash.no_update
+                if not history.redo():
+                    return dash.no_update, {'message': "Nothing to redo.", 'type': 'error'}, dash.no_update, dash.no_update
+                message = f"Redone: {history.label}"
+                update = graph_update(history.graph_manager, history.versions[history.position].changes,
+                                      element_keys=session.element_keys)
+            return update, {'message': message, 'type': 'success'}, session.changed(), dash.no_update
+        finally:
+            session.lock.release()
 
     @app.callback(
         Output('current-rule', 'data', allow_duplicate=True),
@@ -165,7 +426,7 @@ def register_rule_callbacks(app):
             print("Selected edges:")
             print(selected_edges)
             current_rule.update_k_elements(selected_nodes, selected_edges)
-            return current_rule.to_dict()
+            return rule_patch(current_rule_data, current_rule.to_dict())
         return dash.no_update
     
 
@@ -231,6 +492,12 @@ def register_rule_callbacks(app):
                 'backgroundColor': '#4CAF50',  # Green background
                 'color': 'white',
             }
+        elif alert_type == 'info':
+            style = {
+                **base_style,
+                'backgroundColor': '#87CEEB',  # Blue background
+                'color': 'white',
+            }
         else:  # error
             style = {
                 **base_style,
@@ -244,14 +511,15 @@ def register_rule_callbacks(app):
         [Output('alert-store', 'data', allow_duplicate=True),
          Output('saved-rules-list', 'children', allow_duplicate=True)],
         Input('save-rule-button', 'n_clicks'),
-        [State('current-rule', 'data')],
+        [State('current-rule', 'data'),
+         State('saved-rules-page', 'data')],
         prevent_initial_call=True
     )
-    def save_current_rule(n_clicks, current_rule_data):
+    def save_current_rule(n_clicks, current_rule_data, page):
         if n_clicks > 0:
             try:
-                save_rule_to_file(current_rule_data)
-                return "Rule saved to file successfully!", load_saved_rules_list()
+                get_store().save_rule(current_rule_data)
+                return "Rule saved successfully!", load_saved_rules_list(page)
             except Exception as e:
                 return f"Error saving rule: {str(e)}", dash.no_update
         return dash.no_update, dash.no_update
@@ -260,9 +528,10 @@ def register_rule_callbacks(app):
         [Output('alert-store', 'data', allow_duplicate=True),
          Output('saved-rules-list', 'children', allow_duplicate=True)],
         Input({'type': 'delete-saved-rule-button', 'index': ALL}, 'n_clicks'),
+        State('saved-rules-page', 'data'),
         prevent_initial_call=True
     )
-    def delete_saved_rule(n_clicks_list):
+    def delete_saved_rule(n_clicks_list, page):
         ctx = dash.callback_context
         if not ctx.triggered or not any(n_clicks_list):
             return dash.no_update, dash.no_update
@@ -271,20 +540,37 @@ def register_rule_callbacks(app):
         rule_id = button_id['index']
         
         try:
-            if delete_rule_file(rule_id):
-                return "Rule deleted successfully!", load_saved_rules_list()
+            if get_store().delete_rule(rule_id):
+                return "Rule deleted successfully!", load_saved_rules_list(page)
             else:
-                return "Error: Rule file not found", dash.no_update
+                return "Error: Rule not found", dash.no_update
         except Exception as e:
             return f"Error deleting rule: {str(e)}", dash.no_update
     
     @app.callback(
         Output('saved-rules-list', 'children'),
         Input('_refresh', 'children'),
+        State('saved-rules-page', 'data'),
         prevent_initial_call=False 
     )
-    def on_page_refresh(refresh_timestamp):
-        return load_saved_rules_list()
+    def on_page_refresh(refresh_timestamp, page):
+        return load_saved_rules_list(page)
+
+    @app.callback(
+        [Output('saved-rules-list', 'children', allow_duplicate=True),
+         Output('saved-rules-page', 'data')],
+        Input({'type': 'saved-rules-page-button', 'index': ALL}, 'n_clicks'),
+        prevent_initial_call=True
+    )
+    def change_saved_rules_page(n_clicks_list):
+        ctx = dash.callback_context
+        if not ctx.triggered or not ctx.triggered[0]['value']:
+            return dash.no_update, dash.no_update
+
+        # The buttons are identified by the page they lead to
+        page = json.loads(ctx.triggered[0]['prop_id'].split('.')[0])['index']
+        page = min(max(page, 0), saved_rules_page_count() - 1)
+        return load_saved_rules_list(page), page
 
     @app.callback(
         [Output('current-rule', 'data', allow_duplicate=True),
@@ -301,14 +587,11 @@ def register_rule_callbacks(app):
         button_id = json.loads(ctx.triggered[0]['prop_id'].split('.')[0])
         rule_id = button_id['index']
 
-        # Load rules from directory
-        saved_rules = load_rules_from_directory()
-        
-        # Find the rule with matching ID
-        for rule in saved_rules:
-            if rule['id'] == rule_id:
-                # Generate new ID for the loaded rule
-                rule['id'] = str(uuid.uuid4())
-                return rule, {'display': 'block'}
+        # Look the rule up by its ID in the store
+        rule = get_store().get_rule(rule_id)
+        if rule is not None:
+            # Generate new ID for the loaded rule
+            rule['id'] = str(uuid.uuid4())
+            return rule, {'display': 'block'}
 
         return dash.no_update, dash.no_update
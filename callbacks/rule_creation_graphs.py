@@ -3,6 +3,7 @@ from dash.dependencies import Input, Output, State, ALL
 
 from classes import GraphManager, RuleManager
 from utils.layout import get_default_graph_layout
+from utils.patch import rule_patch
 
 def register_rule_creation_graphs_callbacks(app):
     @app.callback(
@@ -53,7 +54,7 @@ def register_rule_creation_graphs_callbacks(app):
             current_rule.lhs.remove_elements(selected_nodes, selected_edges, k_elements)
             current_rule.rhs.remove_elements(selected_nodes, selected_edges, k_elements)
 
-        return current_rule.to_dict()
+        return rule_patch(current_rule_data, current_rule.to_dict())
 
     @app.callback(
         Output('current-rule', 'data', allow_duplicate=True),
@@ -89,7 +90,7 @@ def register_rule_creation_graphs_callbacks(app):
             print(current_rule.rhs.graph.edges())
             current_rule.rhs.remove_elements(selected_nodes, selected_edges, k_elements)
 
-        return current_rule.to_dict()
+        return rule_patch(current_rule_data, current_rule.to_dict())
     
     @app.callback(
         Output('current-rule', 'data', allow_duplicate=True),
@@ -102,7 +103,7 @@ def register_rule_creation_graphs_callbacks(app):
         if n_clicks > 0:
             current_rule = RuleManager.from_dict(current_rule_data)
             current_rule.reset_rhs_to_lhs()
-            return current_rule.to_dict()
+            return rule_patch(current_rule_data, current_rule.to_dict())
         return dash.no_update
 
 
@@ -3,26 +3,246 @@ from dash import html, dcc
 import dash_cytoscape as cyto
 from dash.dependencies import Input, Output, State, ALL
 import networkx as nx
+import copy
 import json
 import uuid
 
+from dpo import has_attributes
+from graph_core import GraphCore
+from rule_plan import compile_rule
+
+def _is_plain_node(element):
+    """Check whether a node element is the one `GraphManager.add_node` creates."""
+    data = element['data']
+    return len(element) == 1 and len(data) == 2 and data.get('label') == data['id']
+
+def _is_plain_edge(element):
+    """Check whether an edge element only holds its ID and endpoints."""
+    return len(element) == 1 and len(element['data']) == 3
+
 class GraphManager:
     def __init__(self):
-        self.graph = nx.Graph()
-        self.elements = []
-    
+        # The core is the only store of the graph; the NetworkX graph and the
+        # Cytoscape elements are views built from it when first needed
+        self.core = GraphCore()
+        self._graph = None
+        self._element_list = []
+        # Undo log of the open transaction, see `begin`
+        self._undo_log = None
+        # The GraphHistory recording committed transactions, if any
+        self.history = None
+
+    @property
+    def graph(self):
+        """NetworkX view of the graph, kept in sync with the core once built.
+
+        Modify the graph through the GraphManager methods, not through this view.
+        """
+        if self._graph is None:
+            graph = nx.Graph()
+            graph.add_nodes_from(self.core.nodes())
+            graph.add_edges_from((r.source, r.target, {'id': r.edge_id}) for r in self.core.edge_records())
+            self._graph = graph
+        return self._graph
+
+    @property
+    def elements(self):
+        """The Cytoscape elements, materialized as a list when first needed after a removal."""
+        if self._element_list is None:
+            elements = [self._node_element(node_id) for node_id in self.core.nodes()]
+            elements.extend(self._edge_element(record) for record in self.core.edge_records())
+            self._element_list = elements
+        return self._element_list
+
+    @elements.setter
+    def elements(self, elements):
+        self.clear()
+        self._element_list = None
+        for element in elements:
+            if 'source' not in element['data']:
+                node_id = element['data']['id']
+                self.core.add_node(node_id, None if _is_plain_node(element) else element)
+        for element in elements:
+            data = element['data']
+            if 'source' in data:
+                source, target = data['source'], data['target']
+                # Edges to unknown nodes create them, as NetworkX does
+                for node_id in (source, target):
+                    self.core.add_node(node_id)
+                self.core.add_edge(source, target, data['id'], None if _is_plain_edge(element) else element)
+
+    def _node_element(self, node_id):
+        element = self.core.node_elements.get(node_id)
+        if element is None:
+            # Keep handed out elements, so changes made to them (e.g. classes) persist
+            element = {'data': {'id': node_id, 'label': node_id}}
+            self.core.node_elements[node_id] = element
+        return element
+
+    def _edge_element(self, record):
+        if record.element is None:
+            record.element = {
+                'data': {
+                    'id': record.edge_id,
+                    'source': record.source,
+                    'target': record.target
+                }
+            }
+        return record.element
+
+    def begin(self, label=None):
+        """Start a transaction recording the changes made to the graph.
+
+        Changes made through `add_node`, `add_edge`, `remove_edge` and
+        `remove_node` (and so `remove_elements`) are recorded with their
+        inverse, so they can be rolled back in time proportional to their
+        number. Transactions can be nested; rolling back an inner transaction
+        only undoes its own changes. If the manager has a `history`, every
+        committed outermost transaction becomes a new version of it.
+
+        Parameters
+        ----------
+        label : str, optional
+            Description of the changes, used as the label of the history
+            version.
+
+        Returns
+        -------
+        GraphTransaction
+            The transaction, also usable as a context manager that commits on
+            success and rolls back on an exception.
+        """
+        return GraphTransaction(self, label)
+
+    def _undo(self, operation):
+        """Revert a change recorded in the undo log, without recording it."""
+        kind = operation[0]
+        self._element_list = None
+        if kind == 'add_node':
+            node_id = operation[1]
+            self.core.remove_node(node_id)
+            if self._graph is not None:
+                self._graph.remove_node(node_id)
+        elif kind == 'add_edge':
+            self._drop_edge(operation[1])
+        elif kind == 'remove_edge':
+            self._restore_edge(operation[1])
+        elif kind == 'remove_node':
+            node_id, element, records = operation[1], operation[2], operation[3]
+            self.core.add_node(node_id, element)
+            if self._graph is not None:
+                self._graph.add_node(node_id)
+            for record in records:
+                self._restore_edge(record)
+
+    def _redo(self, operation):
+        """Repeat a change recorded in the undo log, without recording it."""
+        kind = operation[0]
+        self._element_list = None
+        if kind == 'add_node':
+            node_id = operation[1]
+            self.core.add_node(node_id, operation[2])
+            if self._graph is not None:
+                self._graph.add_node(node_id)
+        elif kind == 'add_edge':
+            self._restore_edge(operation[1])
+        elif kind == 'remove_edge':
+            self._drop_edge(operation[1])
+        elif kind == 'remove_node':
+            node_id = operation[1]
+            self.core.remove_node(node_id)
+            if self._graph is not None:
+                self._graph.remove_node(node_id)
+
+    def _drop_edge(self, record):
+        self.core.remove_edge(record.source, record.target)
+        if self._graph is not None:
+            self._graph.remove_edge(record.source, record.target)
+
+    def _restore_edge(self, record):
+        self.core.add_edge(record.source, record.target, record.id, record.element)
+        if self._graph is not None:
+            self._graph.add_edge(record.source, record.target, id=record.edge_id)
+
+    def element_changes(self, changes, undone=False):
+        """Get the Cytoscape elements removed and added by changes recorded in an undo log.
+
+        This is what a view of the elements, e.g. in the browser, has to
+        remove and add to catch up with the changes, without rebuilding the
+        whole list.
+
+        Parameters
+        ----------
+        changes : list
+            Undo log entries, oldest first, as kept by a committed
+            `GraphTransaction` or a `GraphHistory` version. The changes must
+            have been made to the graph.
+        undone : bool, optional
+            Whether the changes were undone rather than made, as by
+            `GraphHistory.undo`.
+
+        Returns
+        -------
+        tuple
+            The removed elements as they were before the changes, and the
+            added elements as they are now, nodes before edges. An element
+            removed and added back is in both lists; one added and removed
+            again is in neither.
+        """
+        removed = {}
+        added = {}
+
+        def add_edge(record):
+            added[('edge', record.edge_id)] = record
+
+        def remove_edge(record):
+            if added.pop(('edge', record.edge_id), None) is None:
+                removed[('edge', record.edge_id)] = self._edge_element(record)
+
+        def remove_node(node_id, element):
+            if added.pop(('node', node_id), None) is None:
+                removed[('node', node_id)] = element or {'data': {'id': node_id, 'label': node_id}}
+
+        for operation in (reversed(changes) if undone else changes):
+            kind = operation[0]
+            if kind == 'add_node':
+                if undone:
+                    remove_node(operation[1], operation[2])
+                else:
+                    added[('node', operation[1])] = operation[1]
+            elif kind == 'add_edge':
+                (remove_edge if undone else add_edge)(operation[1])
+            elif kind == 'remove_edge':
+                (add_edge if undone else remove_edge)(operation[1])
+            elif kind == 'remove_node':
+                node_id, element, records = operation[1:]
+                if undone:
+                    added[('node', node_id)] = node_id
+                    for record in records:
+                        add_edge(record)
+                else:
+                    for record in records:
+                        remove_edge(record)
+                    remove_node(node_id, element)
+
+        added_elements = [self._node_element(key[1]) for key in added if key[0] == 'node']
+        for key, record in added.items():
+            if key[0] == 'edge':
+                added_elements.append(self._edge_element(self.core.edge(record.source, record.target)))
+        return list(removed.values()), added_elements
+
     @classmethod
     def from_elements(cls, elements):
         manager = cls()
         manager.elements = elements
+        return manager
 
-        manager.graph = nx.Graph()
-        for element in elements:
-            if 'source' in element['data']:
-                manager.graph.add_edge(element['data']['source'], element['data']['target'], id=element['data']['id'])
-            else:
-                manager.graph.add_node(element['data']['id'])
-
+    @classmethod
+    def from_core(cls, core):
+        """Create a GraphManager holding a GraphCore, whose elements are built when first needed."""
+        manager = cls()
+        manager.core = core
+        manager._element_list = None
         return manager
 
     
@@ -39,17 +259,8 @@ class GraphManager:
         if not data:
             return manager
             
-        # Restore elements
+        # Restore elements and rebuild the graph
         manager.elements = data.get('elements', [])
-        
-        # Rebuild NetworkX graph
-        for element in manager.elements:
-            # TODO
-            if 'id' in element['data']:
-                manager.graph.add_node(element['data']['id'])
-            elif 'source' in element['data']:
-                manager.graph.add_edge(element['data']['source'], 
-                                     element['data']['target'])
         return manager
         
     def to_dict(self):
@@ -63,25 +274,106 @@ class GraphManager:
         return {
             'elements': self.elements,
             'graph': {
-                'nodes': list(self.graph.nodes()),
-                'edges': [f"{u}-{v}" for u, v in self.graph.edges()]
+                'nodes': list(self.core.nodes()),
+                'edges': [f"{u}-{v}" for u, v in self.core.edges()]
             }
         }
+
+    def get_element(self, element_id):
+        """Get an element by its ID.
+
+        Parameters
+        ----------
+        element_id : str
+            The node or edge ID.
+
+        Returns
+        -------
+        dict or None
+            The Cytoscape element, or None if there is no such element.
+        """
+        if element_id in self.core:
+            return self._node_element(element_id)
+        record = self.core.find_edge(element_id)
+        return None if record is None else self._edge_element(record)
+
+    def edge_id(self, source, target):
+        """Get the ID of the edge between two nodes, in either orientation.
+
+        Parameters
+        ----------
+        source : str
+            The source node ID.
+        target : str
+            The target node ID.
+
+        Returns
+        -------
+        str or None
+            The edge ID, or None if the nodes are not adjacent.
+        """
+        record = self.core.edge(source, target)
+        return None if record is None else record.edge_id
+
+    def find_nodes(self, attributes):
+        """Get the nodes whose element data has the given values.
+
+        Candidates are looked up in the attribute index of the core, which is
+        kept up to date by the changes made through the GraphManager.
+
+        Parameters
+        ----------
+        attributes : dict
+            The required values, by data key, e.g. ``{'label': 'A'}``.
+
+        Returns
+        -------
+        set
+            The node IDs.
+        """
+        candidates = self.core.attribute_index.nodes_with(attributes)
+        if candidates is None:
+            candidates = self.core.nodes()
+        return {node_id for node_id in candidates if has_attributes(self.core.node_data(node_id), attributes)}
+
+    def new_node_id(self, prefix='n'):
+        """Generate an unused node ID.
+
+        Parameters
+        ----------
+        prefix : str, optional
+            The prefix of the ID, followed by a number.
+
+        Returns
+        -------
+        str
+            The node ID.
+        """
+        index = len(self.core) + 1
+        while f"{prefix}{index}" in self.core:
+            index += 1
+        return f"{prefix}{index}"
         
-    def add_node(self, node_id, **attrs):
+    def add_node(self, node_id, element=None, **attrs):
         """Add a node to the graph and the elements list.
 
         Parameters
         ----------
         node_id : str
             The node ID.
+        element : dict, optional
+            The Cytoscape element of the node, if it has other data than its
+            ID and a label equal to it.
         """        
-        self.graph.add_node(node_id, **attrs)
-        self.elements.append({
-            'data': {'id': node_id, 'label': node_id},
-        })
+        if self.core.add_node(node_id, element):
+            if self._element_list is not None:
+                self._element_list.append(self._node_element(node_id))
+            if self._undo_log is not None:
+                self._undo_log.append(('add_node', node_id, element))
+        if self._graph is not None:
+            self._graph.add_node(node_id, **attrs)
         
-    def add_edge(self, source, target):
+    def add_edge(self, source, target, edge_id=None):
         """Add an edge to the graph and the elements list.
 
         Parameters
@@ -90,17 +382,74 @@ class GraphManager:
             The source node ID.
         target : str
             The target node ID.
+        edge_id : str, optional
+            The edge ID, "source-target" by default.
+
+        Returns
+        -------
+        bool
+            True if the edge was added, False if an endpoint is missing or the
+            nodes are already adjacent.
         """        
-        if source in self.graph.nodes() and target in self.graph.nodes():
-            edge_id = f"{source}-{target}"
-            self.graph.add_edge(source, target)
-            self.elements.append({
-                'data': {
-                    'id': edge_id,
-                    'source': source,
-                    'target': target
-                }
-            })
+        record = self.core.add_edge(source, target, edge_id)
+        if record is None:
+            return False
+        if self._undo_log is not None:
+            self._undo_log.append(('add_edge', record))
+        if self._element_list is not None:
+            self._element_list.append(self._edge_element(record))
+        if self._graph is not None:
+            self._graph.add_edge(source, target, id=record.edge_id)
+        return True
+
+    def remove_edge(self, source, target):
+        """Remove the edge between two nodes, in either orientation.
+
+        Parameters
+        ----------
+        source : str
+            The source node ID.
+        target : str
+            The target node ID.
+
+        Returns
+        -------
+        bool
+            True if the edge existed.
+        """
+        record = self.core.remove_edge(source, target)
+        if record is None:
+            return False
+        if self._undo_log is not None:
+            self._undo_log.append(('remove_edge', record))
+        self._element_list = None
+        if self._graph is not None:
+            self._graph.remove_edge(source, target)
+        return True
+
+    def remove_node(self, node_id):
+        """Remove a node and its incident edges.
+
+        Parameters
+        ----------
+        node_id : str
+            The node ID.
+
+        Returns
+        -------
+        bool
+            True if the node existed.
+        """
+        element = self.core.node_elements.get(node_id)
+        records = self.core.remove_node(node_id)
+        if records is None:
+            return False
+        if self._undo_log is not None:
+            self._undo_log.append(('remove_node', node_id, element, records))
+        self._element_list = None
+        if self._graph is not None:
+            self._graph.remove_node(node_id)
+        return True
             
     def remove_elements(self, selected_nodes=None, selected_edges=None, k_elements=None):
         """Remove nodes and edges from the graph and the elements list.
@@ -118,70 +467,100 @@ class GraphManager:
             return
 
         # Filter out K elements from selected nodes and edges
+        k_nodes = set(k_elements.get('nodes', [])) if k_elements else set()
+        k_edges = set(k_elements.get('edges', [])) if k_elements else set()
 
-        selected_node_ids = set()
-        if selected_nodes:
-            for node in selected_nodes:
-                if k_elements and node['id'] in k_elements.get('nodes', []):
-                    continue
-                selected_node_ids.add(node['id'])
-        
-        selected_edge_ids = set()
+        # Remove edges, then nodes together with their remaining incident edges
         if selected_edges:
             for edge in selected_edges:
-                if k_elements and f"{edge['source']}-{edge['target']}" in k_elements.get('edges', []):
+                if f"{edge['source']}-{edge['target']}" in k_edges:
                     continue
-                selected_edge_ids.add(f"{edge['source']}-{edge['target']}")
-
-        new_node_elements = []
-        new_edge_elements = []
-        current_node_elements = [e for e in self.elements if 'source' not in e['data']]
-        current_edge_elements = [e for e in self.elements if 'source' in e['data']]
+                self.remove_edge(edge['source'], edge['target'])
 
-        # Remove nodes
-        for e in current_node_elements:
-            if e['data']['id'] not in selected_node_ids:
-                new_node_elements.append(e)
-            else:
-                self.graph.remove_node(e['data']['id'])
-
-        # Remove edges
-        new_node_ids = [e['data']['id'] for e in new_node_elements]
-        for e in current_edge_elements:
-            source, target = e['data']['source'], e['data']['target']
-            if f"{source}-{target}" not in selected_edge_ids and f"{target}-{source}" not in selected_edge_ids and source in new_node_ids and target in new_node_ids:
-                new_edge_elements.append(e)
-            # Remove edge in the NetworkX graph if it still exists
-            elif self.graph.has_edge(source, target):
-                self.graph.remove_edge(source, target)
-        
-        self.elements = new_node_elements + new_edge_elements
+        if selected_nodes:
+            for node in selected_nodes:
+                if node['id'] in k_nodes:
+                    continue
+                self.remove_node(node['id'])
 
     
     def clear(self):
         """Clear the graph and the elements list.
         """        
-        self.graph.clear()
-        self.elements = []
+        self.core.clear()
+        self._graph = None
+        self._element_list = []
     
     def copy_from(self, elements):
         """Copy the elements to the graph and the elements list.
 
+        The data of the elements is kept, e.g. the labels and attributes that
+        type the elements of a rule.
+
         Parameters
         ----------
         elements : list
             The elements to copy.
         """        
-        self.clear()
+        self.elements = copy.deepcopy(elements)
 
-        node_elements = [e for e in elements if 'source' not in e['data']]
-        edge_elements = [e for e in elements if 'source' in e['data']]
+class GraphTransaction:
+    """A group of changes to a GraphManager that can be rolled back, see `GraphManager.begin`."""
 
-        for element in node_elements:
-            self.add_node(element['data']['id'])
+    def __init__(self, graph_manager, label=None):
+        self.graph_manager = graph_manager
+        self.label = label
+        self._outermost = graph_manager._undo_log is None
+        if self._outermost:
+            graph_manager._undo_log = []
+        # Position in the undo log where the changes of this transaction start
+        self._savepoint = len(graph_manager._undo_log)
+        self.active = True
+        # The undo log entries of the changes, once committed
+        self.changes = None
 
-        for element in edge_elements:
-            self.add_edge(element['data']['source'], element['data']['target'])
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.active:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        return False
+
+    def __len__(self):
+        """Number of changes recorded by this transaction."""
+        if not self.active:
+            return 0
+        return len(self.graph_manager._undo_log) - self._savepoint
+
+    def _close(self):
+        self.active = False
+        if self._outermost:
+            self.graph_manager._undo_log = None
+
+    def commit(self):
+        """Keep the changes. The changes of a nested transaction can still be
+        rolled back by the enclosing one."""
+        if not self.active:
+            return
+        changes = self.graph_manager._undo_log
+        self.changes = changes if self._outermost else changes[self._savepoint:]
+        self._close()
+        history = self.graph_manager.history
+        if self._outermost and history is not None and changes:
+            history.push(changes, self.label)
+
+    def rollback(self):
+        """Undo the changes of the transaction, most recent first."""
+        if not self.active:
+            return
+        log = self.graph_manager._undo_log
+        while len(log) > self._savepoint:
+            self.graph_manager._undo(log.pop())
+        self._close()
 
 class RuleManager:
     def __init__(self):
@@ -221,6 +600,19 @@ class RuleManager:
         if self.index is not None:
             data['index'] = self.index
         return data
+
+    def compile(self):
+        """Get the compiled plan of the rule.
+
+        Plans are cached by rule content, so compiling an unchanged rule again
+        only costs hashing its content.
+
+        Returns
+        -------
+        RulePlan
+            The compiled rule.
+        """
+        return compile_rule(self.to_dict())
         
     @classmethod
     def initialize_from_selection(cls, selected_nodes, selected_edges):
@@ -1,52 +1,520 @@
 import networkx as nx
-from itertools import combinations
+from collections import namedtuple
+from itertools import combinations, islice
+import time
 
-def match_subgraph(host_graph, lhs_graph):
+MatchPattern = namedtuple('MatchPattern', [
+    'order',
+    'anchors',
+    'back_adjacent',
+    'back_nonadjacent',
+    'degrees',
+    'loops',
+    'larger',
+    'smaller',
+    'node_attributes',
+    'edge_attributes',
+])
+MatchPattern.__doc__ = """Search plan for matching an LHS graph, built by `compile_pattern`.
+
+LHS nodes are matched in `order`. For the node at position i, `anchors[i]` is
+the position of an earlier neighbour whose image supplies the candidates (None
+starts a new connected component), `back_adjacent[i]` and
+`back_nonadjacent[i]` are the earlier positions it must and must not be
+adjacent to, `degrees[i]` is the minimum host degree and `loops[i]` whether it
+has a self-loop. Its image must be greater than the images of the earlier
+positions `larger[i]` and less than those of `smaller[i]` in the order of
+`node_order_key`, so that only one of the matches related by a symmetry of the
+rule is found. `node_attributes[i]`
+holds the values its image must have in its element data (None if it is
+untyped), and `edge_attributes[i]` pairs of an earlier position (or i itself
+for the self-loop) and the values required of the edge to it.
+"""
+
+def node_order_key(node_id):
+    """Sort key ordering host node IDs of different types, e.g. int and str, by type first."""
+    return type(node_id).__name__, node_id
+
+def has_attributes(data, attributes):
+    """Check whether element data has all the given values."""
+    for key, value in attributes.items():
+        if key not in data or data[key] != value:
+            return False
+    return True
+
+def _data_accessors(host_graph):
+    """Get functions returning the data of a host node and of a host edge."""
+    if hasattr(host_graph, 'node_data'):
+        return host_graph.node_data, host_graph.edge_data
+    return (lambda node: host_graph.nodes[node]), (lambda source, target: host_graph.adj[source][target])
+
+def attributes_match(host_graph, pattern, match):
+    """
+    Check whether the images of a match have the data required by the typed nodes and edges of a pattern.
+
+    Parameters
+    ----------
+    host_graph : networkx.Graph or GraphCore
+        The host graph G.
+    pattern : MatchPattern
+        The compiled pattern of the LHS graph.
+    match : Dict
+        The mapping from LHS nodes to host graph nodes.
+
+    Returns
+    -------
+    bool
+        True if every constrained image has the required values.
+    """
+    node_data, edge_data = _data_accessors(host_graph)
+    order = pattern.order
+    for i, node in enumerate(order):
+        attributes = pattern.node_attributes[i]
+        if attributes is not None and not has_attributes(node_data(match[node]), attributes):
+            return False
+        for j, attributes in pattern.edge_attributes[i]:
+            if not has_attributes(edge_data(match[order[j]], match[node]), attributes):
+                return False
+    return True
+
+def compile_pattern(lhs_graph, symmetry=(), node_attributes=None, edge_attributes=None):
+    """
+    Compute the search order and constraints for matching an LHS graph.
+
+    Nodes are ordered so that each one is adjacent to as many already matched
+    nodes as possible, starting every connected component at a typed node if
+    it has one, then at its node of highest degree. Candidates are then taken
+    from the neighbourhood of a matched node, or for a typed node from the
+    `AttributeIndex` of the host graph, instead of from the whole host graph.
+
+    Parameters
+    ----------
+    lhs_graph : networkx.Graph
+        The left-hand side graph L of the rule.
+    symmetry : iterable, optional
+        Pairs ``(a, b)`` of LHS nodes whose images must be ordered as
+        ``node_order_key(match[a]) < node_order_key(match[b])``, e.g. the
+        `symmetry_breaking` of a rule.
+    node_attributes : dict, optional
+        The values required in the element data of the images of typed LHS
+        nodes, by LHS node.
+    edge_attributes : dict, optional
+        The values required in the element data of the images of typed LHS
+        edges, by frozenset of the edge endpoints.
+
+    Returns
+    -------
+    MatchPattern
+        The search plan.
+    """
+    L = lhs_graph
+    node_attributes = node_attributes or {}
+    edge_attributes = edge_attributes or {}
+    degree = {node: len(L.adj[node]) for node in L.nodes()}
+    rank = lambda node: (node in node_attributes, degree[node], str(node))
+
+    order = []
+    position = {}
+    connections = {}
+    remaining = set(L.nodes())
+    while remaining:
+        if connections:
+            node = max(connections, key=lambda n: (connections[n],) + rank(n))
+        else:
+            node = max(remaining, key=rank)
+        connections.pop(node, None)
+        remaining.discard(node)
+        position[node] = len(order)
+        order.append(node)
+        for neighbor in L.adj[node]:
+            if neighbor in remaining:
+                connections[neighbor] = connections.get(neighbor, 0) + 1
+
+    anchors, back_adjacent, back_nonadjacent = [], [], []
+    for i, node in enumerate(order):
+        adjacent = tuple(position[n] for n in L.adj[node] if n != node and position[n] < i)
+        anchors.append(min(adjacent) if adjacent else None)
+        back_adjacent.append(adjacent)
+        back_nonadjacent.append(tuple(j for j in range(i) if not L.has_edge(node, order[j])))
+
+    larger = [[] for _ in order]
+    smaller = [[] for _ in order]
+    for a, b in symmetry:
+        if position[a] < position[b]:
+            larger[position[b]].append(position[a])
+        else:
+            smaller[position[a]].append(position[b])
+
+    edge_checks = []
+    for i, node in enumerate(order):
+        edge_checks.append(tuple(
+            (position[n], edge_attributes[frozenset((n, node))])
+            for n in L.adj[node] if position[n] <= i and frozenset((n, node)) in edge_attributes
+        ))
+
+    return MatchPattern(
+        order=tuple(order),
+        anchors=tuple(anchors),
+        back_adjacent=tuple(back_adjacent),
+        back_nonadjacent=tuple(back_nonadjacent),
+        degrees=tuple(degree[node] for node in order),
+        loops=tuple(L.has_edge(node, node) for node in order),
+        larger=tuple(tuple(positions) for positions in larger),
+        smaller=tuple(tuple(positions) for positions in smaller),
+        node_attributes=tuple(node_attributes.get(node) for node in order),
+        edge_attributes=tuple(edge_checks),
+    )
+
+def _search(host_graph, pattern, deadline=None, deterministic=False):
+    """Backtracking search for the induced occurrences of a compiled pattern."""
+    order = pattern.order
+    size = len(order)
+    if size == 0:
+        yield {}
+        return
+
+    # The raw adjacency dicts avoid the overhead of the networkx views in the inner loop
+    adj = host_graph._adj
+    anchors, degrees, loops = pattern.anchors, pattern.degrees, pattern.loops
+    # Adjacency to the anchor holds for every candidate taken from its neighbourhood
+    back_adjacent = [tuple(j for j in adjacent if j != anchor) for adjacent, anchor in zip(pattern.back_adjacent, anchors)]
+    back_nonadjacent = pattern.back_nonadjacent
+    larger, smaller = pattern.larger, pattern.smaller
+    node_attributes, edge_attributes = pattern.node_attributes, pattern.edge_attributes
+    node_data, edge_data = _data_accessors(host_graph)
+    mapping = [None] * size
+    used = set()
+    checked = 0
+
+    def candidates(i):
+        anchor = anchors[i]
+        if anchor is not None:
+            nodes = adj[mapping[anchor]]
+        else:
+            nodes = None
+            if node_attributes[i] is not None and hasattr(host_graph, 'attribute_index'):
+                nodes = host_graph.attribute_index.nodes_with(node_attributes[i])
+            if nodes is None:
+                nodes = adj
+        return iter(sorted(nodes, key=str) if deterministic else nodes)
+
+    def typed_fit(i, node):
+        attributes = node_attributes[i]
+        if attributes is not None and not has_attributes(node_data(node), attributes):
+            return False
+        for j, attributes in edge_attributes[i]:
+            if not has_attributes(edge_data(node if j == i else mapping[j], node), attributes):
+                return False
+        return True
+
+    stack = [candidates(0)]
+    while stack:
+        i = len(stack) - 1
+        if mapping[i] is not None:
+            used.discard(mapping[i])
+            mapping[i] = None
+
+        degree, loop = degrees[i], loops[i]
+        adjacent, nonadjacent = back_adjacent[i], back_nonadjacent[i]
+        lower = max((node_order_key(mapping[j]) for j in larger[i]), default=None)
+        upper = min((node_order_key(mapping[j]) for j in smaller[i]), default=None)
+        typed = node_attributes[i] is not None or edge_attributes[i]
+        for node in stack[-1]:
+            if deadline is not None:
+                checked += 1
+                if checked % 1024 == 0 and time.monotonic() > deadline:
+                    return
+            if node in used:
+                continue
+            if lower is not None or upper is not None:
+                key = node_order_key(node)
+                if (lower is not None and key <= lower) or (upper is not None and key >= upper):
+                    continue
+            neighbors = adj[node]
+            if len(neighbors) < degree or (node in neighbors) != loop:
+                continue
+            for j in adjacent:
+                if mapping[j] not in neighbors:
+                    break
+            else:
+                for j in nonadjacent:
+                    if mapping[j] in neighbors:
+                        break
+                else:
+                    if not typed or typed_fit(i, node):
+                        mapping[i] = node
+                        used.add(node)
+                        break
+        else:
+            stack.pop()
+            continue
+
+        if i == size - 1:
+            yield dict(zip(order, mapping))
+        else:
+            stack.append(candidates(i + 1))
+
+def check_match(host_graph, lhs_graph, match):
+    """
+    Check whether a mapping is a match of lhs_graph in host_graph.
+
+    The mapping has to be injective and the occurrence induced: two matched
+    host nodes are adjacent exactly when their LHS nodes are. Only node pairs
+    of L are looked up, so the cost does not depend on the host size.
+
+    Parameters
+    ----------
+    host_graph : networkx.Graph or GraphCore
+        The host graph G.
+    lhs_graph : networkx.Graph
+        The left-hand side graph L of the rule.
+    match : Dict
+        The mapping from LHS nodes to host graph nodes.
+
+    Returns
+    -------
+    bool
+        True if the mapping is a match.
+    """
+    images = set()
+    for node in lhs_graph.nodes():
+        if node not in match:
+            return False
+        image = match[node]
+        if image not in host_graph or image in images:
+            return False
+        if lhs_graph.has_edge(node, node) != host_graph.has_edge(image, image):
+            return False
+        images.add(image)
+    for source, target in combinations(lhs_graph.nodes(), 2):
+        if lhs_graph.has_edge(source, target) != host_graph.has_edge(match[source], match[target]):
+            return False
+    return True
+
+def match_identity(host_graph, lhs_graph):
+    """
+    Check whether lhs_graph occurs in host_graph under its own node IDs.
+
+    This is the only match that keeps node IDs, so it is found by looking up
+    the LHS nodes and node pairs in the host graph with `check_match`, without
+    searching it.
+
+    Parameters
+    ----------
+    host_graph : networkx.Graph or GraphCore
+        The host graph G.
+    lhs_graph : networkx.Graph
+        The left-hand side graph L of the rule.
+
+    Returns
+    -------
+    Dict or None
+        The identity mapping on the LHS nodes, or None if it is not a match.
+    """
+    match = {node: node for node in lhs_graph.nodes()}
+    return match if check_match(host_graph, lhs_graph, match) else None
+
+def iter_matches(host_graph, lhs_graph, persist_node_id=False, limit=None, first_only=False,
+                 timeout=None, deterministic=False, fallback=False, pattern=None):
+    """
+    Lazily enumerate the subgraph isomorphisms from lhs_graph to host_graph.
+
+    Matches are produced one at a time, so callers that only need some of them
+    can stop early instead of enumerating every isomorphism up front.
+
+    Parameters
+    ----------
+    host_graph : networkx.Graph or GraphCore
+        The host graph G.
+    lhs_graph : networkx.Graph
+        The left-hand side graph L of the rule.
+    persist_node_id : bool, optional
+        Whether LHS nodes may only be matched to host nodes with the same ID.
+        The host graph is not searched in that case, see `match_identity`.
+    limit : int, optional
+        Maximum number of matches to produce.
+    first_only : bool, optional
+        Stop after the first match, same as ``limit=1``.
+    timeout : float, optional
+        Time budget in seconds. When it is spent the enumeration stops, also in
+        the middle of the search for the next match.
+    deterministic : bool, optional
+        Produce the matches in the same order for equal graphs, regardless of
+        the order in which their nodes and edges were inserted.
+    fallback : bool, optional
+        With `persist_node_id`, search for isomorphic matches if the LHS does
+        not occur under its own node IDs.
+    pattern : MatchPattern, optional
+        The precompiled `compile_pattern` of lhs_graph, e.g. from a `RulePlan`.
+        The pattern of a plan skips the matches that only differ from a found
+        one by a symmetry of the rule, see `symmetry_breaking`, and only
+        produces matches whose images have the data required by the typed
+        nodes and edges of the rule.
+
+    Yields
+    ------
+    Dict
+        A node mapping from LHS nodes to host graph nodes.
+    """
+    if first_only:
+        limit = 1 if limit is None else min(limit, 1)
+    if limit is not None and limit <= 0:
+        return
+
+    if persist_node_id:
+        match = match_identity(host_graph, lhs_graph)
+        if match is not None and (pattern is None or attributes_match(host_graph, pattern, match)):
+            yield match
+            return
+        if not fallback:
+            return
+
+    if pattern is None:
+        pattern = compile_pattern(lhs_graph)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    yield from islice(_search(host_graph, pattern, deadline, deterministic), limit)
+
+def rule_may_apply(host_graph, plan):
+    """
+    Check cheaply whether a rule can have a match in a host graph.
+
+    The invariants of L (node, edge, self-loop and triangle counts, degrees)
+    are compared with those a `GraphCore` maintains, so rules that cannot
+    match are skipped without searching the host graph.
+
+    Parameters
+    ----------
+    host_graph : networkx.Graph or GraphCore
+        The host graph G. Graphs without invariants are never ruled out.
+    plan : RulePlan
+        The compiled rule.
+
+    Returns
+    -------
+    bool
+        False if the rule certainly has no match.
+    """
+    invariants = getattr(host_graph, 'invariants', None)
+    return invariants is None or invariants.may_contain(plan.lhs_invariants)
+
+def match_subgraph(host_graph, lhs_graph, **kwargs):
     """
     Find all subgraph isomorphisms from lhs_graph to host_graph.
 
     Parameters
     ----------
-    host_graph : networkx.Graph
+    host_graph : networkx.Graph or GraphCore
         The host graph G.
     lhs_graph : networkx.Graph
         The left-hand side graph L of the rule.
+    **kwargs
+        Options of `iter_matches` bounding the enumeration.
 
     Returns
     -------
     List[Dict]
         A list of node mappings where each mapping is a dict from LHS nodes to host graph nodes.
     """
-    matcher = nx.algorithms.isomorphism.GraphMatcher(host_graph, lhs_graph)
-    l = [{v: k for k, v in match.items()} for match in matcher.subgraph_isomorphisms_iter()]
-    print(l)
-    return l
+    return list(iter_matches(host_graph, lhs_graph, **kwargs))
 
-def match_subgraph_persist_node_id(host_graph, lhs_graph):
-    # Create a base mapping where nodes must match by ID
-    node_match = lambda n1, n2: n1 == n2
-    matcher = nx.algorithms.isomorphism.GraphMatcher(host_graph, lhs_graph, node_match=node_match)
-    
-    # Get matches and invert the mapping (host->lhs to lhs->host)
-    matches = [{v: k for k, v in match.items()} for match in matcher.subgraph_isomorphisms_iter()]
-    
-    # Filter matches to only keep those where node IDs are identical
-    valid_matches = [match for match in matches if all(k == v for k, v in match.items())]
-    
-    return valid_matches
+def match_subgraph_persist_node_id(host_graph, lhs_graph, **kwargs):
+    """
+    Find the subgraph isomorphisms from lhs_graph to host_graph that keep node IDs.
 
-def apply_dpo_rule(host_graph_manager, rule_manager, match):
+    Parameters
+    ----------
+    host_graph : networkx.Graph or GraphCore
+        The host graph G.
+    lhs_graph : networkx.Graph
+        The left-hand side graph L of the rule.
+    **kwargs
+        Options of `iter_matches` bounding the enumeration.
+
+    Returns
+    -------
+    List[Dict]
+        A list of node mappings where every LHS node is mapped to itself.
+    """
+    return list(iter_matches(host_graph, lhs_graph, persist_node_id=True, **kwargs))
+
+def new_delta():
+    """
+    Create an empty delta for recording the changes made by rule applications.
+
+    Returns
+    -------
+    dict
+        Sets of removed and added node IDs and of removed and added edges,
+        edges being (source, target) pairs of host node IDs.
+    """
+    return {
+        'removed_nodes': set(),
+        'removed_edges': set(),
+        'added_nodes': set(),
+        'added_edges': set(),
+    }
+
+def dangling_node(host_graph, plan, match):
+    """
+    Check the gluing condition of a match.
+
+    Parameters
+    ----------
+    host_graph : networkx.Graph or GraphCore
+        The host graph.
+    plan : RulePlan
+        The compiled rule.
+    match : Dict
+        The mapping from LHS nodes to host graph nodes.
+
+    Returns
+    -------
+    object or None
+        An LHS node to be removed whose image has an edge that is not matched,
+        which would be left dangling, or None if the rule can be applied.
+    """
+    for node, l_neighbors in plan.gluing_checks:
+        neighbors = set(host_graph.neighbors(match[node]))
+        matched_l_neighbors = {match[n] for n in l_neighbors if n in match}
+        if neighbors - matched_l_neighbors:
+            return node
+    return None
+
+def merge_delta(delta, other):
+    """
+    Add the changes recorded in one delta to another.
+
+    Parameters
+    ----------
+    delta : dict
+        The delta to update, created by `new_delta`.
+    other : dict
+        The delta whose changes are added.
+    """
+    for key, elements in other.items():
+        delta[key] |= elements
+
+def apply_dpo_rule(host_graph_manager, rule_manager, match, delta=None, journal=None):
     """
     Apply a single DPO rule to the host graph.
 
+    The application is atomic: if it fails after the host graph was changed,
+    the changes are rolled back through a `GraphTransaction`, so the host graph
+    is either fully rewritten or left as it was.
+
     Parameters
     ----------
     host_graph_manager : GraphManager
         The host graph manager.
-    rule_manager : RuleManager
-        The rule to apply.
+    rule_manager : RuleManager or RulePlan
+        The rule to apply, or its compiled plan.
     match : Dict
         The mapping from LHS nodes to host graph nodes.
+    delta : dict, optional
+        A delta created by `new_delta`; the removed and added elements are
+        recorded in it if the application succeeds.
+    journal : DerivationJournal, optional
+        A journal the application is recorded in as a step if it succeeds.
 
     Returns
     -------
@@ -54,87 +522,90 @@ def apply_dpo_rule(host_graph_manager, rule_manager, match):
         True if the rule was applied successfully, False otherwise.
     """
     try:
-        G = host_graph_manager.graph
-        L = rule_manager.lhs.graph
-        K = rule_manager.k.graph
-        R = rule_manager.rhs.graph
+        G = host_graph_manager.core
+        plan = rule_manager.compile()
 
         # 1. Check gluing condition
-        nodes_to_remove = set(n for n in L.nodes() if n not in K.nodes())
-        for node in nodes_to_remove:
-            matched_node = match[node]
-            neighbors = set(G.neighbors(matched_node))
-            matched_l_neighbors = {match[n] for n in L.neighbors(node) if n in match}
-            if neighbors - matched_l_neighbors:
-                print(f"Dangling edge found for node {node}")
-                return False
+        node = dangling_node(G, plan, match)
+        if node is not None:
+            print(f"Dangling edge found for node {node}")
+            return False
+
+        # Record the changes separately, so a rolled back application leaves delta as it was
+        step_delta = None if delta is None and journal is None else new_delta()
+        with host_graph_manager.begin():
+            # 2. Remove elements (L - K)
+            # Remove edges first
+            for edge in plan.edges_to_remove:
+                source, target = match[edge[0]], match[edge[1]]
+                if host_graph_manager.remove_edge(source, target) and step_delta is not None:
+                    step_delta['removed_edges'].add((source, target))
 
-        # 2. Remove elements (L - K)
-        # Remove edges first
-        edges_to_remove = set(L.edges()) - set(K.edges())
-        for edge in edges_to_remove:
-            source, target = match[edge[0]], match[edge[1]]
-            
-            # Check and remove edge in both directions
-            if G.has_edge(source, target):
-                G.remove_edge(source, target)
-                # Try both directions when removing from elements list
-                edge_id_forward = f"{source}-{target}"
-                edge_id_reverse = f"{target}-{source}"
-                host_graph_manager.elements = [
-                    e for e in host_graph_manager.elements 
-                    if e['data'].get('id') not in [edge_id_forward, edge_id_reverse]
-                ]
-
-        # Remove nodes
-        for node in nodes_to_remove:
-            matched_node = match[node]
-            if matched_node in G:
-                G.remove_node(matched_node)
-                host_graph_manager.elements = [
-                    e for e in host_graph_manager.elements 
-                    if e['data'].get('id') != matched_node
-                ]
-
-        # 3. Add elements (R - K)
-        # Add new nodes
-        nodes_to_add = set(R.nodes()) - set(K.nodes())
-        new_node_mapping = {}
-        for node in nodes_to_add:
-            new_node_id = f"n{len(G.nodes()) + 1}"
-            new_node_mapping[node] = new_node_id
-            G.add_node(new_node_id)
-            host_graph_manager.elements.append({
-                'data': {'id': new_node_id, 'label': new_node_id}
-            })
-
-        # Add new edges
-        edges_to_add = set(R.edges()) - set(K.edges())
-        for edge in edges_to_add:
-            source = new_node_mapping.get(edge[0], match.get(edge[0], edge[0]))
-            target = new_node_mapping.get(edge[1], match.get(edge[1], edge[1]))
-            
-            print("edge to addd:", source, target)
-            if not G.has_edge(source, target):
-                edge_id = f"{source}-{target}"
-                G.add_edge(source, target)
-                host_graph_manager.elements.append({
-                    'data': {
-                        'id': edge_id,
-                        'source': source,
-                        'target': target
-                    }
-                })
-        
-        print("po dodaniu", G.edges())
+            # Remove nodes
+            for node in plan.nodes_to_remove:
+                matched_node = match[node]
+                if host_graph_manager.remove_node(matched_node) and step_delta is not None:
+                    step_delta['removed_nodes'].add(matched_node)
 
+            # 3. Add elements (R - K)
+            # Add new nodes, with the data of their R node
+            new_node_mapping = {}
+            for node in plan.nodes_to_add:
+                new_node_id = host_graph_manager.new_node_id()
+                new_node_mapping[node] = new_node_id
+                attributes = plan.added_node_attributes.get(node)
+                element = {'data': dict({'label': new_node_id}, **attributes, id=new_node_id)} if attributes else None
+                host_graph_manager.add_node(new_node_id, element)
+                if step_delta is not None:
+                    step_delta['added_nodes'].add(new_node_id)
+
+            # Add new edges
+            for edge in plan.edges_to_add:
+                source = new_node_mapping.get(edge[0], match.get(edge[0], edge[0]))
+                target = new_node_mapping.get(edge[1], match.get(edge[1], edge[1]))
+                if host_graph_manager.add_edge(source, target) and step_delta is not None:
+                    step_delta['added_edges'].add((source, target))
+
+        if delta is not None:
+            merge_delta(delta, step_delta)
+        if journal is not None:
+            journal.record_step(plan, match, step_delta)
         return True
 
     except Exception as e:
         print(f"Error applying DPO rule: {e}")
         return False
 
-def are_matches_independent(G, match1, match2):
+def match_footprint(plan, match):
+    """
+    Compute the host elements a match deletes and uses.
+
+    Parameters
+    ----------
+    plan : RulePlan
+        The compiled rule.
+    match : Dict
+        The mapping from LHS nodes to host graph nodes.
+
+    Returns
+    -------
+    tuple
+        The sets of deleted and of used elements. Nodes are given by their ID
+        and edges by the frozenset of their endpoints. Matches are induced, so
+        a match uses every pair of its nodes, adjacent or not, and adding an
+        edge between two of them counts as deleting their non-adjacency.
+    """
+    deleted = {match[n] for n in plan.nodes_to_remove}
+    deleted.update(frozenset((match[s], match[t])) for s, t in plan.edges_to_remove)
+    deleted.update(frozenset((match[s], match[t])) for s, t in plan.edges_to_add if s in match and t in match)
+    nodes = set(match.values())
+    used = set(nodes)
+    used.update(frozenset(pair) for pair in combinations(nodes, 2))
+    # Self-loops are the only edges that are not pairs of distinct nodes
+    used.update(frozenset((match[s], match[t])) for s, t in plan.lhs_graph.edges() if s == t)
+    return deleted, used
+
+def are_matches_independent(G, match1, match2, plan=None):
     """
     Check if two matches are parallel independent.
     Two matches are parallel independent if neither match deletes elements
@@ -146,12 +617,20 @@ def are_matches_independent(G, match1, match2):
         The host graph
     match1, match2 : Dict
         The mappings from LHS nodes to host graph nodes
+    plan : RulePlan, optional
+        The compiled rule of both matches. Without it, matches are only
+        considered independent if they share no nodes.
     
     Returns
     -------
     bool
         True if matches are parallel independent
     """
+    if plan is not None:
+        deleted1, used1 = match_footprint(plan, match1)
+        deleted2, used2 = match_footprint(plan, match2)
+        return deleted1.isdisjoint(used2) and deleted2.isdisjoint(used1)
+
     # Convert matches to sets of nodes
     nodes1 = set(match1.values())
     nodes2 = set(match2.values())
@@ -159,8 +638,68 @@ def are_matches_independent(G, match1, match2):
     # If matches share nodes, they're not independent
     return len(nodes1.intersection(nodes2)) == 0
 
+def schedule_independent_matches(plan, matches, limit=None):
+    """
+    Select a large set of pairwise parallel independent matches.
+
+    Matches may overlap on elements both of them preserve. Without a limit,
+    the number of conflicts of every match is counted through an index from
+    host elements to the matches deleting and using them, and matches are
+    picked greedily starting with the least conflicting ones. With a limit,
+    matches are picked in the order they come, so a lazy enumeration is only
+    consumed until enough matches are found. Either way each match is checked
+    against the elements deleted and used by the picked ones, which takes time
+    linear in the total size of the footprints.
 
-def apply_rule_parallel(host_graph_manager, rule_manager):
+    Parameters
+    ----------
+    plan : RulePlan
+        The compiled rule.
+    matches : iterable
+        The candidate matches.
+    limit : int, optional
+        Maximum number of matches to select.
+
+    Returns
+    -------
+    List[Dict]
+        The selected matches, in their original order.
+    """
+    if limit is not None:
+        candidates = ((match, match_footprint(plan, match)) for match in matches)
+    else:
+        candidates = [(match, match_footprint(plan, match)) for match in matches]
+        deleting, using = {}, {}
+        for _, (deleted, used) in candidates:
+            for element in deleted:
+                deleting[element] = deleting.get(element, 0) + 1
+            for element in used:
+                using[element] = using.get(element, 0) + 1
+        # A match deletes and uses its own deleted elements, which must not count as conflicts
+        conflicts = [
+            sum(using[e] for e in deleted) + sum(deleting.get(e, 0) for e in used) - 2 * len(deleted)
+            for _, (deleted, used) in candidates
+        ]
+        order = sorted(range(len(candidates)), key=conflicts.__getitem__)
+        candidates = [candidates[i] for i in order]
+        positions = {id(candidates[i][0]): order[i] for i in range(len(order))}
+
+    selected = []
+    selected_deleted, selected_used = set(), set()
+    for match, (deleted, used) in candidates:
+        if limit is not None and len(selected) >= limit:
+            break
+        if deleted.isdisjoint(selected_used) and used.isdisjoint(selected_deleted):
+            selected.append(match)
+            selected_deleted |= deleted
+            selected_used |= used
+
+    if limit is None:
+        selected.sort(key=lambda match: positions[id(match)])
+    return selected
+
+def apply_rule_parallel(host_graph_manager, rule_manager, matches=None, delta=None, limit=None,
+                        rounds=1, round_counts=None, journal=None):
     """
     Apply a DPO rule to all parallel independent matches simultaneously.
 
@@ -168,34 +707,76 @@ def apply_rule_parallel(host_graph_manager, rule_manager):
     ----------
     host_graph_manager : GraphManager
         The host graph manager
-    rule_manager : RuleManager
-        The rule to apply
+    rule_manager : RuleManager or RulePlan
+        The rule to apply, or its compiled plan
+    matches : iterable, optional
+        Precomputed matches of the rule, e.g. from a `MatchIndex`. If omitted,
+        the host graph is searched for them lazily.
+    delta : dict, optional
+        A delta created by `new_delta`; the changes of all applications are
+        recorded in it.
+    limit : int, optional
+        Maximum number of matches to apply the rule to. The search for matches
+        stops as soon as that many independent ones are found.
+    rounds : int or None, optional
+        Number of rounds. Each further round applies the rule to an independent
+        set of the matches not applied so far that are still valid. None runs
+        rounds until no such match is left.
+    round_counts : list, optional
+        If given, the number of successful applications of every round is
+        appended to it.
+    journal : DerivationJournal, optional
+        A journal every application is recorded in as a step.
 
     Returns
     -------
     int
         Number of successful parallel applications
     """
-    # Find all possible matches
-    matches = match_subgraph_persist_node_id(host_graph_manager.graph, rule_manager.lhs.graph)
-    if not matches:
-        return 0
-
-    # Find maximal set of parallel independent matches
-    independent_matches = []
-    for match in matches:
-        # Check if this match is independent with all selected matches
-        is_independent = all(
-            are_matches_independent(host_graph_manager.graph, match, m)
-            for m in independent_matches
-        )
-        if is_independent:
-            independent_matches.append(match)
-
-    # Apply rule to all independent matches
+    plan = rule_manager.compile()
+
+    # Find matches only as far as they are consumed below
+    if matches is None:
+        if not rule_may_apply(host_graph_manager.core, plan):
+            if round_counts is not None:
+                round_counts.append(0)
+            return 0
+        matches = iter_matches(host_graph_manager.core, plan.lhs_graph, persist_node_id=True, pattern=plan.pattern)
+
+    # Matches violating the gluing condition cannot be applied, and must not take
+    # the place of applicable matches they overlap with
+    core = host_graph_manager.core
+    if plan.gluing_checks:
+        matches = (match for match in matches if dangling_node(core, plan, match) is None)
+    if rounds != 1:
+        matches = list(matches)
+
     successful_applications = 0
-    for match in independent_matches:
-        if apply_dpo_rule(host_graph_manager, rule_manager, match):
-            successful_applications += 1
+    round_number = 0
+    while rounds is None or round_number < rounds:
+        remaining = None if limit is None else limit - successful_applications
+        independent_matches = schedule_independent_matches(plan, matches, remaining)
+
+        # Apply rule to all independent matches
+        round_applications = 0
+        for match in independent_matches:
+            if apply_dpo_rule(host_graph_manager, plan, match, delta, journal):
+                round_applications += 1
+        successful_applications += round_applications
+        round_number += 1
+        if round_counts is not None:
+            round_counts.append(round_applications)
+
+        if round_applications == 0 or (limit is not None and successful_applications >= limit):
+            break
+        if rounds is None or round_number < rounds:
+            applied = {id(match) for match in independent_matches}
+            matches = [
+                match for match in matches
+                if id(match) not in applied and check_match(core, plan.lhs_graph, match)
+                and dangling_node(core, plan, match) is None
+            ]
+            if not matches:
+                break
 
-    return successful_applications
\ No newline at end of file
+    return successful_applications
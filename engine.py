@@ -0,0 +1,229 @@
+from contextlib import nullcontext
+import time
+
+from dpo import apply_dpo_rule, apply_rule_parallel, merge_delta, new_delta
+from match_index import MatchIndex
+from pattern_network import PatternNetwork
+from rule_analysis import analyze_rules
+from rule_plan import compile_rule
+
+STRATEGIES = ('sequential', 'parallel', 'priority')
+
+class _RuleEntry:
+    """A rule taking part in a derivation, with its match index and statistics."""
+    __slots__ = ('id', 'plan', 'priority', 'index', 'applications', 'time', 'affects', 'enables', 'blocked')
+
+    def __init__(self, rule_id, plan, priority):
+        self.id = rule_id
+        self.plan = plan
+        self.priority = priority
+        self.index = None
+        self.applications = 0
+        self.time = 0.0
+        # The entries whose matches an application can change or that it can make applicable
+        self.affects = ()
+        self.enables = ()
+        # Whether the rule had matches but none could be applied, and nothing enabled it since
+        self.blocked = False
+
+def _rule_entries(rules):
+    entries = []
+    for rule in rules:
+        if isinstance(rule, dict):
+            plan = compile_rule(rule)
+            entries.append(_RuleEntry(rule.get('id', plan.content_hash), plan, rule.get('priority', 0)))
+        else:
+            plan = rule.compile()
+            entries.append(_RuleEntry(getattr(rule, 'id', plan.content_hash), plan, getattr(rule, 'priority', 0)))
+    return entries
+
+def rewrite_to_fixpoint(host_graph_manager, rules, strategy='sequential', max_steps=None, timeout=None,
+                        persist_node_id=True, delta=None, max_rounds=None, progress=None, cancel=None,
+                        shared_patterns=False, journal=None, label=None):
+    """
+    Apply a set of rules until none of them matches or a budget is spent.
+
+    Strategies:
+
+    - ``'sequential'``: pass over the rules in order, applying each rule at one
+      match per pass.
+    - ``'parallel'``: pass over the rules in order, applying each rule at a
+      maximal set of parallel independent matches per pass.
+    - ``'priority'``: apply the rule of highest priority that has a match at
+      one match, then start over. Rules are ordered by their ``priority``
+      (higher first), then by their position in `rules`.
+
+    Matches are kept in a `MatchIndex` per rule and updated from the changes of
+    every step, so the host graph is only searched once per rule. The
+    `TriggerGraph` of the rules limits the updates after a step to the rules
+    whose matches it can have changed, and a rule whose matches could not be
+    applied is only tried again once a step of a rule that can enable it was
+    made.
+
+    Parameters
+    ----------
+    host_graph_manager : GraphManager
+        The host graph manager, rewritten in place.
+    rules : list
+        The rules, as rule data dicts, RuleManagers or RulePlans.
+    strategy : str, optional
+        One of `STRATEGIES`.
+    max_steps : int, optional
+        Maximum number of rule applications.
+    timeout : float, optional
+        Time budget in seconds, checked between steps.
+    persist_node_id : bool, optional
+        Whether LHS nodes may only be matched to host nodes with the same ID,
+        as done by `apply_rule_parallel`.
+    delta : dict, optional
+        A delta created by `new_delta`; the changes of all steps are recorded
+        in it.
+    max_rounds : int, optional
+        Maximum number of passes over the rules. One round of the
+        ``'parallel'`` strategy is what the "Apply Rules" button does.
+    progress : callable, optional
+        Called after each rule of a round as ``progress(rounds=..., rules_done=...,
+        rules=..., steps=..., elapsed=...)``.
+    cancel : threading.Event, optional
+        When set, the derivation stops before the next rule application.
+    shared_patterns : bool, optional
+        Whether to keep the matches of all rules in one `PatternNetwork`
+        instead of a `MatchIndex` per rule, so sub-patterns shared by several
+        rules are matched once.
+    journal : DerivationJournal, optional
+        A journal every rule application is recorded in as a step. The rules
+        are added to it first, and it is flushed when the derivation stops.
+    label : str, optional
+        If given, every round is made in a transaction labelled with it and the
+        round number, so a `GraphHistory` of the host graph records a version
+        per round rather than per rule application.
+
+    Returns
+    -------
+    dict
+        Statistics of the derivation: the number of ``steps`` (applications
+        changing the graph) and ``rounds``, why it ``stopped`` (``'fixpoint'``, ``'max_steps'``,
+        ``'max_rounds'``, ``'timeout'`` or ``'cancelled'``), the ``elapsed``
+        time, the time spent updating match indexes (``index_time``) and, per
+        rule, its ``id``, ``applications`` and ``time``.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy {strategy!r}, expected one of {STRATEGIES}")
+
+    start = time.monotonic()
+    deadline = None if timeout is None else start + timeout
+    entries = _rule_entries(rules)
+    triggers = analyze_rules([entry.plan for entry in entries], persist_node_id)
+    network = None
+    if shared_patterns:
+        network = PatternNetwork(host_graph_manager, [entry.plan for entry in entries], persist_node_id)
+    for position, entry in enumerate(entries):
+        if network is not None:
+            entry.index = network.index(position)
+        else:
+            entry.index = MatchIndex(host_graph_manager, entry.plan, persist_node_id)
+        entry.affects = [entries[other] for other in sorted(triggers.affected_by(position))]
+        entry.enables = [entries[other] for other in sorted(triggers.enabled_by(position))]
+    if journal is not None:
+        for rule, entry in zip(rules, entries):
+            rule_data = rule if isinstance(rule, dict) else rule.to_dict() if hasattr(rule, 'to_dict') else None
+            journal.add_rule(entry.id, entry.plan, rule_data)
+    if strategy == 'priority':
+        order = sorted(entries, key=lambda entry: -entry.priority)
+    else:
+        order = entries
+
+    steps = 0
+    rounds = 0
+    index_time = 0.0
+    stopped = 'fixpoint'
+
+    def budget_spent(check_rounds=True):
+        nonlocal stopped
+        if cancel is not None and cancel.is_set():
+            stopped = 'cancelled'
+        elif max_steps is not None and steps >= max_steps:
+            stopped = 'max_steps'
+        elif deadline is not None and time.monotonic() > deadline:
+            stopped = 'timeout'
+        elif check_rounds and max_rounds is not None and rounds >= max_rounds:
+            stopped = 'max_rounds'
+        else:
+            return False
+        return True
+
+    def apply(entry):
+        """Apply a rule according to the strategy, returning the number of applications."""
+        nonlocal index_time
+        step_delta = new_delta()
+        entry_start = time.monotonic()
+        if strategy == 'parallel':
+            remaining = None if max_steps is None else max_steps - steps
+            applications = apply_rule_parallel(host_graph_manager, entry.plan, entry.index.get_matches(), step_delta, remaining,
+                                               journal=journal)
+        else:
+            applications = 0
+            # Matches are taken lazily; the index is not updated before the loop is left
+            for match in entry.index:
+                if apply_dpo_rule(host_graph_manager, entry.plan, match, step_delta, journal):
+                    applications = 1
+                    break
+        entry.time += time.monotonic() - entry_start
+        if not any(step_delta.values()):
+            # Applications that leave the graph as it was, e.g. of rules with
+            # L = K = R, would match again forever
+            applications = 0
+        entry.applications += applications
+
+        if applications:
+            if delta is not None:
+                merge_delta(delta, step_delta)
+            index_start = time.monotonic()
+            if network is not None:
+                network.update(step_delta)
+            else:
+                for other in entry.affects:
+                    other.index.update(step_delta)
+            index_time += time.monotonic() - index_start
+            for other in entry.enables:
+                other.blocked = False
+        else:
+            entry.blocked = True
+        return applications
+
+    while not budget_spent():
+        rounds += 1
+        round_applications = 0
+        with nullcontext() if label is None else host_graph_manager.begin(f"{label} (round {rounds})"):
+            for rules_done, entry in enumerate(order, 1):
+                if budget_spent(check_rounds=False):
+                    break
+                if entry.blocked or not entry.index:
+                    continue
+                applications = apply(entry)
+                steps += applications
+                round_applications += applications
+                if progress is not None:
+                    progress(rounds=rounds, rules_done=rules_done, rules=len(order), steps=steps,
+                             elapsed=time.monotonic() - start)
+                if strategy == 'priority' and applications:
+                    break
+            else:
+                if round_applications == 0:
+                    break
+        if stopped != 'fixpoint':
+            break
+
+    if journal is not None:
+        journal.flush()
+    return {
+        'steps': steps,
+        'rounds': rounds,
+        'stopped': stopped,
+        'elapsed': time.monotonic() - start,
+        'index_time': index_time,
+        'rules': [
+            {'id': entry.id, 'applications': entry.applications, 'time': entry.time}
+            for entry in entries
+        ],
+    }
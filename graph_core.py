@@ -0,0 +1,552 @@
+import sys
+
+def _intern(node_id):
+    """Share one string object between all references to a node ID."""
+    return sys.intern(node_id) if type(node_id) is str else node_id
+
+class EdgeRecord:
+    """An undirected edge of a `GraphCore`, shared by the adjacency of both endpoints."""
+    __slots__ = ('source', 'target', 'id', 'element')
+
+    def __init__(self, source, target, edge_id=None, element=None):
+        self.source = source
+        self.target = target
+        # Only edges whose ID is not the default "source-target" store it
+        self.id = edge_id
+        # Only edges with a non-default Cytoscape element, or whose element was
+        # handed out and may have been modified, keep it
+        self.element = element
+
+    @property
+    def edge_id(self):
+        """The edge ID."""
+        return self.id if self.id is not None else f"{self.source}-{self.target}"
+
+class GraphInvariants:
+    """Cheap invariants of a graph, used to rule out matches without searching.
+
+    The invariants of a `GraphCore` are updated by its mutations once they have
+    been computed. The triangle count is only computed when first needed.
+    """
+    __slots__ = ('graph', 'node_count', 'edge_count', 'self_loops', 'degree_counts', '_triangles')
+
+    def __init__(self):
+        self.graph = None
+        self.node_count = 0
+        self.edge_count = 0
+        self.self_loops = 0
+        # Number of nodes by degree, without zero counts
+        self.degree_counts = {}
+        self._triangles = None
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        Compute the invariants of a graph.
+
+        Parameters
+        ----------
+        graph : networkx.Graph or GraphCore
+            The graph.
+
+        Returns
+        -------
+        GraphInvariants
+            The invariants.
+        """
+        invariants = cls()
+        invariants.graph = graph
+        for node, neighbors in graph.adj.items():
+            invariants._count_degree(len(neighbors), 1)
+            if node in neighbors:
+                invariants.self_loops += 1
+        invariants.node_count = len(graph)
+        invariants.edge_count = graph.number_of_edges()
+        return invariants
+
+    def _count_degree(self, degree, change):
+        count = self.degree_counts.get(degree, 0) + change
+        if count:
+            self.degree_counts[degree] = count
+        else:
+            del self.degree_counts[degree]
+
+    def _common_neighbors(self, source, target):
+        adj = self.graph.adj
+        return len((adj[source].keys() & adj[target].keys()) - {source, target})
+
+    @property
+    def max_degree(self):
+        return max(self.degree_counts, default=0)
+
+    @property
+    def triangles(self):
+        if self._triangles is None:
+            adj = self.graph.adj
+            total = 0
+            for node, neighbors in adj.items():
+                for neighbor in neighbors:
+                    if neighbor != node:
+                        total += self._common_neighbors(node, neighbor)
+            # Every triangle is counted once from each of its three edges in both orientations
+            self._triangles = total // 6
+        return self._triangles
+
+    def at_least(self, degree):
+        """Count the nodes with at least the given degree."""
+        return sum(count for d, count in self.degree_counts.items() if d >= degree)
+
+    def node_added(self):
+        self.node_count += 1
+        self._count_degree(0, 1)
+
+    def node_removed(self):
+        """Account for the removal of a node whose edges were already removed."""
+        self.node_count -= 1
+        self._count_degree(0, -1)
+
+    def edge_added(self, source, target):
+        """Account for an edge added to the graph."""
+        self.edge_count += 1
+        adj = self.graph.adj
+        if source == target:
+            self.self_loops += 1
+            self._count_degree(len(adj[source]) - 1, -1)
+            self._count_degree(len(adj[source]), 1)
+            return
+        for node in (source, target):
+            self._count_degree(len(adj[node]) - 1, -1)
+            self._count_degree(len(adj[node]), 1)
+        if self._triangles is not None:
+            self._triangles += self._common_neighbors(source, target)
+
+    def edge_removed(self, source, target):
+        """Account for an edge removed from the graph."""
+        self.edge_count -= 1
+        adj = self.graph.adj
+        if source == target:
+            self.self_loops -= 1
+            self._count_degree(len(adj[source]) + 1, -1)
+            self._count_degree(len(adj[source]), 1)
+            return
+        for node in (source, target):
+            self._count_degree(len(adj[node]) + 1, -1)
+            self._count_degree(len(adj[node]), 1)
+        if self._triangles is not None:
+            self._triangles -= self._common_neighbors(source, target)
+
+    def may_contain(self, pattern):
+        """
+        Check whether a graph with the given invariants can occur in this graph.
+
+        A False result is certain; a True result only means that the invariants
+        do not rule out an occurrence.
+
+        Parameters
+        ----------
+        pattern : GraphInvariants
+            The invariants of the pattern graph, e.g. an LHS graph.
+
+        Returns
+        -------
+        bool
+            False if the pattern cannot occur as a subgraph.
+        """
+        if (pattern.node_count > self.node_count or pattern.edge_count > self.edge_count
+                or pattern.self_loops > self.self_loops or pattern.max_degree > self.max_degree):
+            return False
+        # Every pattern node needs its own host node of at least its degree
+        for degree in pattern.degree_counts:
+            if degree and pattern.at_least(degree) > self.at_least(degree):
+                return False
+        if pattern.triangles and pattern.triangles > self.triangles:
+            return False
+        return True
+
+class AttributeIndex:
+    """The nodes of a graph by the values of the data of their Cytoscape elements.
+
+    Used to seed the candidates of typed LHS nodes instead of scanning the
+    graph. The index of a `GraphCore` is updated by its mutations once it has
+    been computed. Values that cannot be hashed are not indexed, and neither
+    are nodes whose element is the default one, whose only data is their ID as
+    label; `nodes_with` accounts for them.
+    """
+    __slots__ = ('graph', 'nodes_by_value')
+
+    def __init__(self, graph):
+        self.graph = graph
+        # Node IDs by (key, value) pair of their element data
+        self.nodes_by_value = {}
+        for node_id, element in graph.node_elements.items():
+            self.node_added(node_id, element)
+
+    def _items(self, element):
+        for key, value in element['data'].items():
+            if key == 'id':
+                continue
+            try:
+                hash(value)
+            except TypeError:
+                continue
+            yield key, value
+
+    def node_added(self, node_id, element):
+        for item in self._items(element):
+            self.nodes_by_value.setdefault(item, set()).add(node_id)
+
+    def node_removed(self, node_id, element):
+        for item in self._items(element):
+            nodes = self.nodes_by_value.get(item)
+            if nodes is not None:
+                nodes.discard(node_id)
+                if not nodes:
+                    del self.nodes_by_value[item]
+
+    def nodes_with(self, attributes):
+        """
+        Get the candidate nodes for some data values.
+
+        Parameters
+        ----------
+        attributes : dict
+            The required values, by data key.
+
+        Returns
+        -------
+        set or None
+            A superset of the nodes whose data has all the values, or None if
+            none of the values is indexed.
+        """
+        candidates = None
+        for key, value in attributes.items():
+            try:
+                nodes = self.nodes_by_value.get((key, value), set())
+            except TypeError:
+                continue
+            if key == 'label' and value in self.graph and self.graph.node_data(value).get('label') == value:
+                nodes = nodes | {value}
+            if candidates is None or len(nodes) < len(candidates):
+                candidates = nodes
+        return None if candidates is None else set(candidates)
+
+class GraphCore:
+    """Compact, mutable store of an undirected graph.
+
+    Node IDs are interned and every node only owns a dict from its neighbours
+    to the shared `EdgeRecord` of the edge, so neither per-element attribute
+    dicts nor Cytoscape element dicts are kept for plain nodes and edges.
+
+    The read methods are the subset of the `networkx.Graph` API used by the
+    matching functions in `dpo`, so the core can be matched against directly.
+    """
+    __slots__ = ('_adj', 'node_elements', 'custom_edge_ids', 'edge_count', '_invariants', '_attribute_index')
+
+    def __init__(self):
+        self._invariants = None
+        self._attribute_index = None
+        self._adj = {}
+        # Cytoscape elements of nodes that have one, see `EdgeRecord.element`
+        self.node_elements = {}
+        # Edges with a non-default ID, by that ID
+        self.custom_edge_ids = {}
+        self.edge_count = 0
+
+    @property
+    def adj(self):
+        return self._adj
+
+    @property
+    def invariants(self):
+        """The `GraphInvariants` of the graph, maintained by every mutation once computed."""
+        if self._invariants is None:
+            self._invariants = GraphInvariants.from_graph(self)
+        return self._invariants
+
+    @property
+    def attribute_index(self):
+        """The `AttributeIndex` of the graph, maintained by every mutation once computed.
+
+        Assigning `node_elements` directly requires `reset_attribute_index`.
+        """
+        if self._attribute_index is None:
+            self._attribute_index = AttributeIndex(self)
+        return self._attribute_index
+
+    def reset_attribute_index(self):
+        self._attribute_index = None
+
+    def node_data(self, node_id):
+        """The data of the Cytoscape element of a node; a node without element only has its ID and label."""
+        element = self.node_elements.get(node_id)
+        return {'id': node_id, 'label': node_id} if element is None else element['data']
+
+    def edge_data(self, source, target):
+        """The data of the Cytoscape element of an edge, or an empty dict for a plain edge."""
+        element = self._adj[source][target].element
+        return {} if element is None else element['data']
+
+    def __contains__(self, node_id):
+        return node_id in self._adj
+
+    def __iter__(self):
+        return iter(self._adj)
+
+    def __len__(self):
+        return len(self._adj)
+
+    def nodes(self):
+        return self._adj.keys()
+
+    def number_of_nodes(self):
+        return len(self._adj)
+
+    def number_of_edges(self):
+        return self.edge_count
+
+    def neighbors(self, node_id):
+        return iter(self._adj[node_id])
+
+    def has_edge(self, source, target):
+        neighbors = self._adj.get(source)
+        return neighbors is not None and target in neighbors
+
+    def edge(self, source, target):
+        """Get the record of the edge between two nodes, in either orientation, or None."""
+        neighbors = self._adj.get(source)
+        return None if neighbors is None else neighbors.get(target)
+
+    def edge_records(self):
+        """Iterate over the records of all edges, each once."""
+        for node_id, neighbors in self._adj.items():
+            for neighbor, record in neighbors.items():
+                if record.source == node_id and record.target == neighbor:
+                    yield record
+
+    def edges(self):
+        for record in self.edge_records():
+            yield record.source, record.target
+
+    def find_edge(self, edge_id):
+        """
+        Get the record of an edge by its ID.
+
+        Default IDs are split at every "-" into candidate endpoints, so no index
+        of all edge IDs has to be kept.
+
+        Parameters
+        ----------
+        edge_id : str
+            The edge ID.
+
+        Returns
+        -------
+        EdgeRecord or None
+            The edge record, or None if there is no such edge.
+        """
+        record = self.custom_edge_ids.get(edge_id)
+        if record is not None:
+            return record
+        position = edge_id.find('-')
+        while position != -1:
+            record = self.edge(edge_id[:position], edge_id[position + 1:])
+            if record is not None and record.id is None and record.edge_id == edge_id:
+                return record
+            position = edge_id.find('-', position + 1)
+        return None
+
+    def add_node(self, node_id, element=None):
+        """Add a node; returns False if it already exists."""
+        if node_id in self._adj:
+            return False
+        node_id = _intern(node_id)
+        self._adj[node_id] = {}
+        if element is not None:
+            self.node_elements[node_id] = element
+            if self._attribute_index is not None:
+                self._attribute_index.node_added(node_id, element)
+        if self._invariants is not None:
+            self._invariants.node_added()
+        return True
+
+    def add_edge(self, source, target, edge_id=None, element=None):
+        """Add an edge between existing nodes; returns its record, or None if it was not added."""
+        source_neighbors = self._adj.get(source)
+        target_neighbors = self._adj.get(target)
+        if source_neighbors is None or target_neighbors is None or target in source_neighbors:
+            return None
+        source, target = _intern(source), _intern(target)
+        if edge_id == f"{source}-{target}":
+            edge_id = None
+        record = EdgeRecord(source, target, edge_id, element)
+        source_neighbors[target] = record
+        target_neighbors[source] = record
+        if edge_id is not None:
+            self.custom_edge_ids[edge_id] = record
+        self.edge_count += 1
+        if self._invariants is not None:
+            self._invariants.edge_added(source, target)
+        return record
+
+    def add_nodes_from(self, node_ids):
+        """
+        Add many plain nodes at once.
+
+        The invariants are updated if they have been computed, like by
+        `add_node`.
+
+        Parameters
+        ----------
+        node_ids : iterable
+            The node IDs; IDs of existing nodes are skipped.
+
+        Returns
+        -------
+        int
+            The number of nodes added.
+        """
+        adj = self._adj
+        count = len(adj)
+        for node_id in node_ids:
+            if node_id not in adj:
+                adj[_intern(node_id)] = {}
+        added = len(adj) - count
+        invariants = self._invariants
+        if invariants is not None and added:
+            # New nodes have no edges yet
+            invariants.node_count += added
+            invariants._count_degree(0, added)
+        return added
+
+    def add_edges_from(self, edges):
+        """
+        Add many edges at once.
+
+        The invariants are updated if they have been computed, like by
+        `add_edge`.
+
+        Parameters
+        ----------
+        edges : iterable
+            Tuples ``(source, target)``, optionally followed by the edge ID and
+            the Cytoscape element. Edges with a missing endpoint, or between
+            nodes that are already adjacent, are skipped.
+
+        Returns
+        -------
+        int
+            The number of edges added.
+        """
+        adj = self._adj
+        custom_edge_ids = self.custom_edge_ids
+        invariants = self._invariants
+        count = 0
+        for edge in edges:
+            source, target = _intern(edge[0]), _intern(edge[1])
+            source_neighbors = adj.get(source)
+            target_neighbors = adj.get(target)
+            if source_neighbors is None or target_neighbors is None or target in source_neighbors:
+                continue
+            edge_id = edge[2] if len(edge) > 2 else None
+            if edge_id is not None and edge_id == f"{source}-{target}":
+                edge_id = None
+            record = EdgeRecord(source, target, edge_id, edge[3] if len(edge) > 3 else None)
+            source_neighbors[target] = record
+            target_neighbors[source] = record
+            if edge_id is not None:
+                custom_edge_ids[edge_id] = record
+            count += 1
+            if invariants is not None:
+                invariants.edge_added(source, target)
+        self.edge_count += count
+        return count
+
+    def remove_edge(self, source, target):
+        """Remove an edge in either orientation; returns its record, or None if there is none."""
+        record = self.edge(source, target)
+        if record is None:
+            return None
+        del self._adj[source][target]
+        self._adj[target].pop(source, None)
+        if record.id is not None:
+            self.custom_edge_ids.pop(record.id, None)
+        self.edge_count -= 1
+        if self._invariants is not None:
+            self._invariants.edge_removed(source, target)
+        return record
+
+    def remove_node(self, node_id):
+        """Remove a node and its incident edges; returns the removed edge records, or None."""
+        neighbors = self._adj.get(node_id)
+        if neighbors is None:
+            return None
+        records = list(neighbors.values())
+        for record in records:
+            self.remove_edge(record.source, record.target)
+        del self._adj[node_id]
+        element = self.node_elements.pop(node_id, None)
+        if element is not None and self._attribute_index is not None:
+            self._attribute_index.node_removed(node_id, element)
+        if self._invariants is not None:
+            self._invariants.node_removed()
+        return records
+
+    def subgraph(self, node_ids):
+        """
+        Copy the subgraph induced by a set of nodes.
+
+        Parameters
+        ----------
+        node_ids : iterable
+            The node IDs; IDs that are not in the graph are ignored.
+
+        Returns
+        -------
+        GraphCore
+            A new core sharing the edge records of the induced edges.
+        """
+        nodes = {node_id for node_id in node_ids if node_id in self._adj}
+        core = GraphCore()
+        for node_id in nodes:
+            core._adj[node_id] = {
+                neighbor: record for neighbor, record in self._adj[node_id].items() if neighbor in nodes
+            }
+            element = self.node_elements.get(node_id)
+            if element is not None:
+                core.node_elements[node_id] = element
+        core.edge_count = sum(1 for _ in core.edge_records())
+        return core
+
+    def copy(self):
+        """
+        Copy the graph.
+
+        Returns
+        -------
+        GraphCore
+            A new core with its own adjacency and edge records, since
+            `GraphManager` and `GraphHistory.sync` set `EdgeRecord.element`
+            in place. The Cytoscape elements themselves are shared.
+        """
+        core = GraphCore()
+        records = {}
+        for node_id, neighbors in self._adj.items():
+            row = {}
+            for neighbor, record in neighbors.items():
+                copied = records.get(record)
+                if copied is None:
+                    copied = records[record] = EdgeRecord(record.source, record.target, record.id, record.element)
+                row[neighbor] = copied
+            core._adj[node_id] = row
+        core.node_elements = dict(self.node_elements)
+        core.custom_edge_ids = {edge_id: records[record] for edge_id, record in self.custom_edge_ids.items()}
+        core.edge_count = self.edge_count
+        return core
+
+    def clear(self):
+        self._invariants = None
+        self._attribute_index = None
+        self._adj = {}
+        self.node_elements = {}
+        self.custom_edge_ids = {}
+        self.edge_count = 0
@@ -0,0 +1,945 @@
+import argparse
+import array
+import base64
+import codecs
+from contextlib import contextmanager
+import gc
+import io
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape, quoteattr
+
+from classes import GraphManager, _is_plain_edge, _is_plain_node
+from graph_core import GraphCore
+from rule_plan import element_attributes
+
+BINARY_MAGIC = b'DPOG'
+BINARY_VERSION = 1
+BINARY_EXTENSION = '.gbin'
+
+# Magic, version, flags, node count, edge count, byte sizes of the node ID,
+# label column, edge ID column and extra sections
+_HEADER = struct.Struct('<4sHHQQQQQQ')
+# Flags of the optional columns
+_HAS_LABELS = 1
+_HAS_EDGE_IDS = 2
+
+# Size of the pieces JSON files and uploads are decoded and parsed in
+STREAM_CHUNK_SIZE = 1 << 20
+# Number of elements added to the graph at once while streaming
+STREAM_BATCH_SIZE = 10000
+
+# File extension of each graph format
+GRAPH_FORMATS = {
+    'json': '.json',
+    'binary': BINARY_EXTENSION,
+    'graphml': '.graphml',
+    'edgelist': '.edgelist',
+    'adjlist': '.adjlist',
+}
+
+# Characters that cannot be part of a node or edge ID in the text formats
+_UNSAFE_TOKEN = re.compile(r'[\s#]')
+
+_GRAPHML_NAMESPACE = 'http://graphml.graphdrawing.org/xmlns'
+# GraphML attribute types of the Python types of element data, and how to read them back
+_GRAPHML_TYPES = {bool: 'boolean', int: 'long', float: 'double', str: 'string'}
+_GRAPHML_PARSERS = {
+    'boolean': lambda text: text.strip().lower() in ('true', '1'),
+    'int': int,
+    'long': int,
+    'float': float,
+    'double': float,
+    'string': str,
+}
+
+@contextmanager
+def _bulk_allocation():
+    """Pause the cyclic garbage collector, which would otherwise scan the graph repeatedly while it is built."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def _padding(size):
+    return -size % 4
+
+def _join(strings, what):
+    """Join strings with NUL separators, checking that they can be split again."""
+    try:
+        text = '\0'.join(strings)
+    except TypeError:
+        raise ValueError(f"Only string {what} can be stored in the binary format")
+    if text.count('\0') != max(len(strings) - 1, 0):
+        raise ValueError(f"{what.capitalize()} containing NUL cannot be stored in the binary format")
+    return text.encode('utf-8')
+
+def _split(view, count):
+    strings = str(view, 'utf-8').split('\0') if count else []
+    if len(strings) != count:
+        raise ValueError("Corrupt binary graph: column length mismatch")
+    return strings
+
+def _is_labelled_node(element):
+    """Check whether a node element only holds its ID and a label, which fits in the label column."""
+    data = element['data']
+    return len(element) == 1 and len(data) == 2 and type(data.get('label')) is str
+
+def _index_array(view):
+    """Read a section of little-endian uint32 node positions, without copying it where possible."""
+    if sys.byteorder == 'little':
+        return view.cast('I')
+    positions = array.array('I', bytes(view))
+    positions.byteswap()
+    return positions
+
+def save_graph_binary(graph_manager, filepath, metadata=None):
+    """
+    Save a graph in the compact binary format, as written by `write_graph_binary`.
+
+    Parameters
+    ----------
+    graph_manager : GraphManager
+        The graph.
+    filepath : str
+        Path of the file to write.
+    metadata : dict, optional
+        Extra JSON data, e.g. a timestamp, returned by `read_graph_binary`.
+
+    Returns
+    -------
+    str
+        Path to the saved file
+    """
+    with open(filepath, 'wb') as f:
+        write_graph_binary(graph_manager, f, metadata)
+    return filepath
+
+def write_graph_binary(graph_manager, f, metadata=None):
+    """
+    Write a graph in the compact binary format.
+
+    The file holds the node IDs once, NUL-separated, and the edges as two
+    arrays of uint32 positions in that list. Node labels other than the ID
+    and custom edge IDs are stored as NUL-separated columns when the graph
+    has any. Only elements that carry more data are kept, in a JSON section
+    together with `metadata`. JSON files written by `save_graph_to_file`
+    remain the interchange format.
+
+    Parameters
+    ----------
+    graph_manager : GraphManager
+        The graph.
+    f : file object
+        A binary file, or e.g. an `io.BytesIO`.
+    metadata : dict, optional
+        Extra JSON data, e.g. a timestamp, returned by `read_graph_binary`.
+    """
+    core = graph_manager.core
+    node_ids = list(core.nodes())
+    if len(node_ids) >= 2 ** 32:
+        raise ValueError("Too many nodes for the binary format")
+    names = _join(node_ids, 'node IDs')
+    position = {node_id: i for i, node_id in enumerate(node_ids)}
+
+    labels = None
+    extra = {'metadata': metadata or {}, 'nodes': {}, 'edges': {}}
+    for node_id, element in core.node_elements.items():
+        if _is_plain_node(element):
+            continue
+        if _is_labelled_node(element):
+            if labels is None:
+                labels = list(node_ids)
+            labels[position[node_id]] = element['data']['label']
+        else:
+            extra['nodes'][position[node_id]] = element
+
+    sources = array.array('I')
+    targets = array.array('I')
+    edge_ids = None
+    for i, record in enumerate(core.edge_records()):
+        sources.append(position[record.source])
+        targets.append(position[record.target])
+        if record.id is not None:
+            if edge_ids is None:
+                edge_ids = [''] * i
+            edge_ids.append(record.id)
+        elif edge_ids is not None:
+            edge_ids.append('')
+        element = record.element
+        if element is not None and not _is_plain_edge(element):
+            extra['edges'][i] = element
+    if sys.byteorder != 'little':
+        sources.byteswap()
+        targets.byteswap()
+
+    flags = 0
+    label_column = edge_id_column = b''
+    if labels is not None:
+        flags |= _HAS_LABELS
+        label_column = _join(labels, 'labels')
+    if edge_ids is not None:
+        flags |= _HAS_EDGE_IDS
+        edge_id_column = _join(edge_ids, 'edge IDs')
+    extra = json.dumps(extra, separators=(',', ':')).encode('utf-8')
+    f.write(_HEADER.pack(
+        BINARY_MAGIC, BINARY_VERSION, flags, len(node_ids), len(sources),
+        len(names), len(label_column), len(edge_id_column), len(extra),
+    ))
+    for section in (names, label_column, edge_id_column):
+        f.write(section)
+        f.write(b'\0' * _padding(len(section)))
+    sources.tofile(f)
+    targets.tofile(f)
+    f.write(extra)
+
+@_bulk_allocation()
+def read_graph_binary(buffer):
+    """
+    Build a graph from data in the binary format.
+
+    The node IDs are decoded with a single split, and the edges are added
+    from the position arrays in bulk, so no element dicts are built except
+    for the elements stored in the extra section.
+
+    Parameters
+    ----------
+    buffer : bytes-like
+        The data, e.g. the bytes of an upload or a memory map of a file.
+
+    Returns
+    -------
+    Tuple[GraphManager, dict]
+        The graph and the metadata it was saved with.
+    """
+    view = memoryview(buffer)
+    try:
+        if len(view) < _HEADER.size:
+            raise ValueError("Not a binary graph: file too short")
+        (magic, version, flags, node_count, edge_count,
+         names_size, labels_size, edge_ids_size, extra_size) = _HEADER.unpack_from(view)
+        if magic != BINARY_MAGIC:
+            raise ValueError("Not a binary graph")
+        if version != BINARY_VERSION:
+            raise ValueError(f"Unsupported binary graph version {version}")
+        offset = _HEADER.size
+        node_ids = list(map(sys.intern, _split(view[offset:offset + names_size], node_count)))
+        offset += names_size + _padding(names_size)
+        labels = _split(view[offset:offset + labels_size], node_count) if flags & _HAS_LABELS else None
+        offset += labels_size + _padding(labels_size)
+        edge_ids = _split(view[offset:offset + edge_ids_size], edge_count) if flags & _HAS_EDGE_IDS else None
+        offset += edge_ids_size + _padding(edge_ids_size)
+        sources = _index_array(view[offset:offset + 4 * edge_count])
+        offset += 4 * edge_count
+        targets = _index_array(view[offset:offset + 4 * edge_count])
+        offset += 4 * edge_count
+        extra = json.loads(bytes(view[offset:offset + extra_size])) if extra_size else {}
+
+        core = GraphCore()
+        core.add_nodes_from(node_ids)
+        endpoints = zip(map(node_ids.__getitem__, sources), map(node_ids.__getitem__, targets))
+        edge_elements = {int(i): element for i, element in extra.get('edges', {}).items()}
+        if edge_elements:
+            edges = (
+                (source, target, edge_ids[i] or None if edge_ids else None, edge_elements.get(i))
+                for i, (source, target) in enumerate(endpoints)
+            )
+        elif edge_ids is not None:
+            edges = (
+                (source, target, edge_id or None) for (source, target), edge_id in zip(endpoints, edge_ids)
+            )
+        else:
+            edges = endpoints
+        core.add_edges_from(edges)
+        if labels is not None:
+            for node_id, label in zip(node_ids, labels):
+                if label != node_id:
+                    core.node_elements[node_id] = {'data': {'id': node_id, 'label': label}}
+        for i, element in extra.get('nodes', {}).items():
+            core.node_elements[node_ids[int(i)]] = element
+        # Drop every view of the buffer, so a memory map can be closed
+        del sources, targets, endpoints, edges
+    finally:
+        view.release()
+    return GraphManager.from_core(core), extra.get('metadata', {})
+
+def load_graph_binary(filepath):
+    """
+    Load a graph saved by `save_graph_binary`, memory-mapping the file.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the binary file
+
+    Returns
+    -------
+    Tuple[GraphManager, dict]
+        The graph and the metadata it was saved with.
+    """
+    with open(filepath, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return read_graph_binary(mapped)
+
+def is_binary_graph(filepath):
+    """Check whether a file starts with the magic of the binary format."""
+    with open(filepath, 'rb') as f:
+        return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+class _JSONStream:
+    """JSON text given in chunks, from which values are decoded one at a time.
+
+    Only the text from the value being decoded onwards is kept, so a long
+    array can be read element by element.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+
+    def _fill(self):
+        """Append the next chunk to the buffer; returns False at the end of the text."""
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and get the next character, or '' at the end of the text."""
+        while True:
+            buffer, position = self.buffer, self.position
+            while position < len(buffer) and buffer[position] in ' \t\n\r':
+                position += 1
+            self.position = position
+            if position < len(buffer):
+                return buffer[position]
+            if not self._fill():
+                return ''
+
+    def expect(self, characters):
+        """Consume the next character, which must be one of `characters`."""
+        character = self.peek()
+        if not character or character not in characters:
+            expected = ' or '.join(repr(c) for c in characters)
+            raise ValueError(f"Invalid graph JSON: expected {expected}, found {character or 'the end'!r}")
+        self.position += 1
+        return character
+
+    def value(self):
+        """Decode the next value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number at the end of the buffer may go on in the next chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.position = end
+            return value
+
+def _iter_array(stream):
+    stream.expect('[')
+    if stream.peek() == ']':
+        stream.position += 1
+        return
+    while True:
+        yield stream.value()
+        if stream.expect(',]') == ']':
+            return
+
+def iter_json_elements(chunks):
+    """
+    Parse the Cytoscape elements of a graph JSON text one at a time.
+
+    Parameters
+    ----------
+    chunks : iterable
+        The text, in pieces of any size. It holds either an object with an
+        ``elements`` list, as written by `save_graph_to_file`, or the list
+        itself.
+
+    Yields
+    ------
+    dict
+        The elements, in the order of the text.
+    """
+    stream = _JSONStream(chunks)
+    if stream.peek() == '[':
+        yield from _iter_array(stream)
+    else:
+        stream.expect('{')
+        if stream.peek() == '}':
+            stream.position += 1
+        else:
+            while True:
+                key = stream.value()
+                stream.expect(':')
+                if key == 'elements':
+                    yield from _iter_array(stream)
+                else:
+                    stream.value()
+                if stream.expect(',}') == '}':
+                    break
+    if stream.peek():
+        raise ValueError("Invalid graph JSON: extra data after the graph")
+
+@_bulk_allocation()
+def read_elements_stream(elements, progress=None, batch_size=STREAM_BATCH_SIZE):
+    """
+    Build a graph from Cytoscape elements given one at a time.
+
+    Elements are added in batches with `GraphCore.add_nodes_from` and
+    `add_edges_from`, so only a batch of them is held besides the graph.
+    Edges are checked against the nodes: an edge whose endpoints are not
+    given as nodes is skipped, as is a second edge between the same nodes.
+
+    Parameters
+    ----------
+    elements : iterable
+        The node and edge elements, e.g. from `iter_json_elements`. Edges may
+        come before their endpoints.
+    progress : callable, optional
+        Called after each batch with the ``nodes`` and ``edges`` added so far.
+    batch_size : int, optional
+        The number of elements per batch.
+
+    Returns
+    -------
+    Tuple[GraphManager, dict]
+        The graph, and the numbers of ``nodes`` and ``edges`` added and of
+        ``dangling_edges`` and ``duplicate_edges`` skipped.
+    """
+    core = GraphCore()
+    adj = core.adj
+    stats = {'nodes': 0, 'edges': 0, 'dangling_edges': 0, 'duplicate_edges': 0}
+    nodes, edges = [], []
+    # Edges with an endpoint not given yet
+    pending = []
+
+    def add_edges(batch, keep_dangling):
+        ready = []
+        for edge in batch:
+            if edge[0] in adj and edge[1] in adj:
+                ready.append(edge)
+            elif keep_dangling:
+                pending.append(edge)
+            else:
+                stats['dangling_edges'] += 1
+        added = core.add_edges_from(ready)
+        stats['edges'] += added
+        stats['duplicate_edges'] += len(ready) - added
+
+    def flush():
+        stats['nodes'] += core.add_nodes_from(nodes)
+        add_edges(edges, True)
+        nodes.clear()
+        edges.clear()
+        if progress is not None:
+            progress(nodes=stats['nodes'], edges=stats['edges'])
+
+    for element in elements:
+        data = element.get('data') if isinstance(element, dict) else None
+        if not isinstance(data, dict):
+            raise ValueError(f"Invalid element without data: {element!r:.200}")
+        if 'source' in data:
+            if 'target' not in data:
+                raise ValueError(f"Invalid edge without target: {element!r:.200}")
+            edges.append((data['source'], data['target'], data.get('id'), None if _is_plain_edge(element) else element))
+        else:
+            node_id = data.get('id')
+            if node_id is None:
+                raise ValueError(f"Invalid node without ID: {element!r:.200}")
+            nodes.append(node_id)
+            if not _is_plain_node(element):
+                core.node_elements.setdefault(node_id, element)
+        if len(nodes) + len(edges) >= batch_size:
+            flush()
+    flush()
+    if pending:
+        add_edges(pending, False)
+    return GraphManager.from_core(core), stats
+
+def _iter_text(chunks):
+    """Decode UTF-8 text given in byte chunks, which may split characters."""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    decoder.decode(b'', final=True)
+
+def read_graph_upload(contents, progress=None, filename=None):
+    """
+    Build a graph from the contents of a Dash upload, in any of the `GRAPH_FORMATS`.
+
+    JSON uploads are decoded from base64 and parsed piece by piece, so the
+    peak memory is the upload string and the graph, without the decoded
+    text or a parsed copy of all elements.
+
+    Parameters
+    ----------
+    contents : str
+        The data URL given by ``dcc.Upload``.
+    progress : callable, optional
+        Called now and then with the ``bytes_read`` out of ``bytes_total``
+        and the ``nodes`` and ``edges`` added so far.
+    filename : str, optional
+        The name of the uploaded file. Binary uploads are recognized by their
+        content, the text formats by this extension, and anything else is
+        read as JSON.
+
+    Returns
+    -------
+    Tuple[GraphManager, dict]
+        The graph and the statistics of `read_elements_stream`.
+    """
+    header, _, content_string = contents.partition(',')
+    if not header.endswith(';base64'):
+        raise ValueError("Unsupported upload encoding")
+    total = len(content_string) * 3 // 4 - content_string[-2:].count('=')
+    if len(content_string) >= 8 and base64.b64decode(content_string[:8]).startswith(BINARY_MAGIC):
+        # The sections of the binary format are read in place, so it is decoded at once
+        graph_manager, _ = read_graph_binary(base64.b64decode(content_string))
+        core = graph_manager.core
+        if progress is not None:
+            progress(bytes_read=total, bytes_total=total, nodes=len(core), edges=core.number_of_edges())
+        return graph_manager, {'nodes': len(core), 'edges': core.number_of_edges(),
+                               'dangling_edges': 0, 'duplicate_edges': 0}
+    file_format = graph_format(filename) if filename else 'json'
+    if file_format in _TEXT_FORMATS:
+        return _read_text_upload(base64.b64decode(content_string), file_format, progress)
+
+    bytes_read = 0
+
+    def decode():
+        nonlocal bytes_read
+        # Whole groups of 4 base64 characters decode independently
+        step = STREAM_CHUNK_SIZE // 3 * 4
+        for start in range(0, len(content_string), step):
+            chunk = base64.b64decode(content_string[start:start + step])
+            bytes_read += len(chunk)
+            yield chunk
+
+    def report(nodes, edges):
+        if progress is not None:
+            progress(bytes_read=bytes_read, bytes_total=total, nodes=nodes, edges=edges)
+
+    return read_elements_stream(iter_json_elements(_iter_text(decode())), report)
+
+def _read_text_upload(data, file_format, progress):
+    """Build a graph from the decoded bytes of an upload in one of the `_TEXT_FORMATS`."""
+    def report(nodes, edges):
+        if progress is not None:
+            progress(bytes_read=len(data), bytes_total=len(data), nodes=nodes, edges=edges)
+
+    if file_format == 'graphml':
+        return read_elements_stream(_iter_graphml_elements(io.BytesIO(data)), report)
+    with io.StringIO(data.decode('utf-8-sig')) as f:
+        graph_manager = _read_rows(_iter_rows(f, None), adjacency=file_format == 'adjlist')
+    core = graph_manager.core
+    report(len(core), core.number_of_edges())
+    # Edges to unknown nodes cannot occur, and repeated edges are not counted
+    return graph_manager, {'nodes': len(core), 'edges': core.number_of_edges(),
+                           'dangling_edges': 0, 'duplicate_edges': 0}
+
+def _iter_rows(f, delimiter):
+    """Yield the line numbers and fields of the lines of a text file, without comments and blank lines."""
+    for number, line in enumerate(f, 1):
+        line = line.partition('#')[0]
+        fields = line.split() if delimiter is None else [field.strip() for field in line.split(delimiter)]
+        if fields and fields != ['']:
+            yield number, fields
+
+@_bulk_allocation()
+def _read_rows(rows, adjacency):
+    core = GraphCore()
+    nodes, edges = [], []
+    for number, fields in rows:
+        if adjacency:
+            node_id = fields[0]
+            nodes.extend(fields)
+            edges.extend((node_id, neighbor) for neighbor in fields[1:])
+        else:
+            if len(fields) > 3:
+                raise ValueError(f"Line {number}: expected a node, or an edge and its ID, found {len(fields)} fields")
+            nodes.extend(fields[:2])
+            if len(fields) > 1:
+                edges.append(fields)
+        if len(nodes) >= STREAM_BATCH_SIZE:
+            # Nodes first, as edges to unknown nodes are skipped
+            core.add_nodes_from(nodes)
+            core.add_edges_from(edges)
+            nodes.clear()
+            edges.clear()
+    core.add_nodes_from(nodes)
+    core.add_edges_from(edges)
+    return GraphManager.from_core(core)
+
+def _token(value, delimiter, what):
+    text = str(value)
+    if not text or _UNSAFE_TOKEN.search(text) or (delimiter and delimiter in text):
+        raise ValueError(f"Cannot write {what} {text!r} to a text graph file")
+    return text
+
+def load_edge_list(filepath, delimiter=None):
+    """
+    Load a graph from an edge list.
+
+    Each line holds the endpoints of an edge, optionally followed by the edge
+    ID, or a single node ID for an isolated node. Text after ``#`` is a
+    comment. Nodes are created as their edges are read, and an edge between
+    nodes that are already adjacent is skipped.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the file.
+    delimiter : str, optional
+        The field separator; any whitespace by default.
+
+    Returns
+    -------
+    GraphManager
+        The graph.
+    """
+    with open(filepath, 'r', encoding='utf-8-sig') as f:
+        return _read_rows(_iter_rows(f, delimiter), adjacency=False)
+
+def save_edge_list(graph_manager, filepath, delimiter=' '):
+    """
+    Save a graph as an edge list readable by `load_edge_list`.
+
+    Isolated nodes are written first, then the edges, with their ID if it is
+    not the default one. Element data other than IDs is not written.
+
+    Parameters
+    ----------
+    graph_manager : GraphManager
+        The graph.
+    filepath : str
+        Path to the file.
+    delimiter : str, optional
+        The field separator.
+    """
+    core = graph_manager.core
+    adj = core.adj
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.writelines(
+            _token(node_id, delimiter, 'node ID') + '\n' for node_id in core.nodes() if not adj[node_id]
+        )
+        for record in core.edge_records():
+            fields = [_token(record.source, delimiter, 'node ID'), _token(record.target, delimiter, 'node ID')]
+            if record.id is not None:
+                fields.append(_token(record.id, delimiter, 'edge ID'))
+            f.write(delimiter.join(fields) + '\n')
+
+def load_adjacency_list(filepath, delimiter=None):
+    """
+    Load a graph from an adjacency list.
+
+    Each line holds a node ID followed by IDs of its neighbors; an edge may be
+    listed at one or both of its endpoints. Text after ``#`` is a comment.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the file.
+    delimiter : str, optional
+        The field separator; any whitespace by default.
+
+    Returns
+    -------
+    GraphManager
+        The graph.
+    """
+    with open(filepath, 'r', encoding='utf-8-sig') as f:
+        return _read_rows(_iter_rows(f, delimiter), adjacency=True)
+
+def save_adjacency_list(graph_manager, filepath, delimiter=' '):
+    """
+    Save a graph as an adjacency list readable by `load_adjacency_list`.
+
+    Every node gets a line, listing each edge once at the endpoint written
+    first. Edge IDs and element data are not written.
+
+    Parameters
+    ----------
+    graph_manager : GraphManager
+        The graph.
+    filepath : str
+        Path to the file.
+    delimiter : str, optional
+        The field separator.
+    """
+    adj = graph_manager.core.adj
+    written = set()
+    with open(filepath, 'w', encoding='utf-8') as f:
+        for node_id, neighbors in adj.items():
+            fields = [_token(node_id, delimiter, 'node ID')]
+            fields.extend(_token(neighbor, delimiter, 'node ID') for neighbor in neighbors if neighbor not in written)
+            written.add(node_id)
+            f.write(delimiter.join(fields) + '\n')
+
+def _local_name(tag):
+    return tag.rpartition('}')[2]
+
+def _iter_graphml_elements(filepath):
+    """Yield the Cytoscape elements of the nodes and edges of a GraphML file as they are parsed."""
+    # Key ID to attribute name and parser, and default values by domain
+    keys = {}
+    defaults = {'node': {}, 'edge': {}}
+    graphs = []
+    for event, element in ElementTree.iterparse(filepath, events=('start', 'end')):
+        tag = _local_name(element.tag)
+        if event == 'start':
+            if tag == 'graph':
+                graphs.append(element)
+            continue
+        if tag == 'graph':
+            graphs.pop()
+        elif tag == 'key':
+            name = element.get('attr.name') or element.get('id')
+            parse = _GRAPHML_PARSERS.get(element.get('attr.type', 'string'), str)
+            keys[element.get('id')] = (name, parse)
+            for child in element:
+                if _local_name(child.tag) == 'default':
+                    domain = element.get('for', 'all')
+                    for name_domain in (('node', 'edge') if domain == 'all' else (domain,)):
+                        if name_domain in defaults:
+                            defaults[name_domain][name] = parse(child.text or '')
+        elif tag in ('node', 'edge'):
+            data = dict(defaults[tag])
+            for child in element:
+                if _local_name(child.tag) == 'data' and child.get('key') in keys:
+                    name, parse = keys[child.get('key')]
+                    try:
+                        data[name] = parse(child.text or '')
+                    except ValueError:
+                        raise ValueError(f"Invalid value {child.text!r} of GraphML attribute {name!r}")
+            if tag == 'node':
+                node_id = element.get('id')
+                if node_id is None:
+                    raise ValueError("Invalid GraphML: node without ID")
+                data['id'] = node_id
+                # Labels equal to the node ID are not written, see `save_graphml`
+                data.setdefault('label', node_id)
+            else:
+                source, target = element.get('source'), element.get('target')
+                if source is None or target is None:
+                    raise ValueError("Invalid GraphML: edge without source or target")
+                data.update(id=element.get('id') or f"{source}-{target}", source=source, target=target)
+            yield {'data': data}
+            # Drop the parsed element, so the document is never held whole
+            if graphs:
+                graphs[-1].remove(element)
+            else:
+                element.clear()
+
+def load_graphml(filepath):
+    """
+    Load a graph from a GraphML file.
+
+    The file is parsed incrementally. Node and edge attributes become the
+    data of their elements, converted to the declared types. Nodes without a
+    label are labelled with their ID, like nodes added in the UI. Edge direction,
+    hyperedges and ports are ignored, and nested graphs are flattened.
+    Edges to unknown nodes and second edges between the same nodes are
+    skipped, as by `read_elements_stream`.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the file.
+
+    Returns
+    -------
+    GraphManager
+        The graph.
+    """
+    return read_elements_stream(_iter_graphml_elements(filepath))[0]
+
+def _graphml_text(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (str, int, float)):
+        return str(value)
+    return json.dumps(value)
+
+def save_graphml(graph_manager, filepath):
+    """
+    Save a graph as GraphML, readable by `load_graphml` and other tools.
+
+    The data of node and edge elements becomes GraphML attributes, except
+    the IDs, endpoints and labels equal to the node ID, which `load_graphml`
+    restores. Attributes with values of different types are written as
+    strings, and values that are not numbers, strings or booleans as JSON
+    strings.
+
+    Parameters
+    ----------
+    graph_manager : GraphManager
+        The graph.
+    filepath : str
+        Path to the file.
+    """
+    core = graph_manager.core
+
+    def edge_attributes():
+        for record in core.edge_records():
+            if record.element is not None:
+                attributes = element_attributes(record.element)
+                if attributes:
+                    yield attributes
+
+    # A first pass declares the attributes and their types
+    types = {}
+    domains = (('node', (element_attributes(element) for element in core.node_elements.values())),
+               ('edge', edge_attributes()))
+    for domain, attribute_dicts in domains:
+        for attributes in attribute_dicts:
+            for name, value in attributes.items():
+                kind = _GRAPHML_TYPES.get(type(value), 'string')
+                if types.setdefault((domain, name), kind) != kind:
+                    types[(domain, name)] = 'string'
+    key_ids = {key: f"d{i}" for i, key in enumerate(sorted(types))}
+
+    def data_lines(domain, element):
+        attributes = element_attributes(element) if element is not None else None
+        if not attributes:
+            return ''
+        return ''.join(
+            f'<data key="{key_ids[(domain, name)]}">{escape(_graphml_text(value))}</data>'
+            for name, value in attributes.items()
+        )
+
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write(f'<graphml xmlns="{_GRAPHML_NAMESPACE}">\n')
+        for (domain, name), key_id in key_ids.items():
+            f.write(f'  <key id="{key_id}" for="{domain}" attr.name={quoteattr(name)} attr.type="{types[(domain, name)]}"/>\n')
+        f.write('  <graph edgedefault="undirected">\n')
+        for node_id in core.nodes():
+            data = data_lines('node', core.node_elements.get(node_id))
+            if data:
+                f.write(f'    <node id={quoteattr(str(node_id))}>{data}</node>\n')
+            else:
+                f.write(f'    <node id={quoteattr(str(node_id))}/>\n')
+        for record in core.edge_records():
+            edge_id = f' id={quoteattr(str(record.id))}' if record.id is not None else ''
+            endpoints = f'source={quoteattr(str(record.source))} target={quoteattr(str(record.target))}'
+            data = data_lines('edge', record.element)
+            if data:
+                f.write(f'    <edge{edge_id} {endpoints}>{data}</edge>\n')
+            else:
+                f.write(f'    <edge{edge_id} {endpoints}/>\n')
+        f.write('  </graph>\n</graphml>\n')
+
+# Loaders and savers of the text formats, by format name
+_TEXT_FORMATS = {
+    'graphml': (load_graphml, save_graphml),
+    'edgelist': (load_edge_list, save_edge_list),
+    'adjlist': (load_adjacency_list, save_adjacency_list),
+}
+
+def graph_format(filepath):
+    """
+    Get the format of a graph file from its extension.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the file.
+
+    Returns
+    -------
+    str
+        A key of `GRAPH_FORMATS`; JSON for unknown extensions.
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    for name, format_extension in GRAPH_FORMATS.items():
+        if extension == format_extension:
+            return name
+    return 'json'
+
+def load_graph_manager(filepath):
+    """
+    Load a graph file in any of the `GRAPH_FORMATS`.
+
+    Binary files are recognized by their content, the text formats by their
+    extension, and any other file is read as JSON as written by
+    `save_graph_to_file`.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the file.
+
+    Returns
+    -------
+    GraphManager
+        The graph.
+    """
+    if is_binary_graph(filepath):
+        return load_graph_binary(filepath)[0]
+    file_format = graph_format(filepath)
+    if file_format in _TEXT_FORMATS:
+        return _TEXT_FORMATS[file_format][0](filepath)
+    with open(filepath, 'r', encoding='utf-8-sig') as f:
+        chunks = iter(lambda: f.read(STREAM_CHUNK_SIZE), '')
+        return read_elements_stream(iter_json_elements(chunks))[0]
+
+def save_graph_manager(graph_manager, filepath, file_format=None):
+    """
+    Save a graph in any of the `GRAPH_FORMATS`.
+
+    Parameters
+    ----------
+    graph_manager : GraphManager
+        The graph.
+    filepath : str
+        Path to the file.
+    file_format : str, optional
+        A key of `GRAPH_FORMATS`; by default the format of the extension.
+    """
+    file_format = file_format or graph_format(filepath)
+    if file_format == 'binary':
+        save_graph_binary(graph_manager, filepath)
+    elif file_format in _TEXT_FORMATS:
+        _TEXT_FORMATS[file_format][1](graph_manager, filepath)
+    else:
+        with open(filepath, 'w') as f:
+            json.dump({'elements': graph_manager.elements}, f)
+
+def main(argv=None):
+    """Convert graph files between the formats."""
+    extensions = ', '.join(f"{extension} ({name})" for name, extension in GRAPH_FORMATS.items())
+    parser = argparse.ArgumentParser(
+        description="Convert a graph between formats, chosen by the file extensions: " + extensions)
+    parser.add_argument('input', help="graph file in any format")
+    parser.add_argument('output', help="output file, JSON unless its extension is of another format")
+    args = parser.parse_args(argv)
+
+    graph_manager = load_graph_manager(args.input)
+    save_graph_manager(graph_manager, args.output)
+    print(f"{args.input} -> {args.output}: {len(graph_manager.core)} nodes, "
+          f"{graph_manager.core.number_of_edges()} edges")
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,219 @@
+import threading
+import time
+import uuid
+
+from classes import GraphManager
+from history import GraphHistory
+from utils.patch import element_keys
+
+# Sessions are forgotten this many seconds after they were last used; the page
+# then sends its elements again, only losing its undo history
+SESSION_RETENTION = 3600.0
+
+# Undo goes back at most this many versions of the main graph; older ones are forgotten
+HISTORY_MAX_VERSIONS = 200
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+OUT_OF_SYNC_ALERT = {
+    'message': "The graph on the server was out of date and has been updated from this page. Please try again.",
+    'type': 'error',
+}
+
+class GraphSession:
+    """The main graph of one page, kept on the server with its versions for undo/redo.
+
+    The page holds the `state` of the session in the ``main-graph-version``
+    store and sends it instead of the elements, so edits are made to the graph
+    kept here and only their changes are sent back. Each page load starts a
+    new session, so tabs and users never share a graph.
+
+    Sessions are kept in the memory of the server process, so the app has to
+    be served by a single process; a page whose requests reach another process
+    finds no session there and sends its elements again, losing its history.
+
+    Attributes
+    ----------
+    id : str
+        The session ID.
+    history : GraphHistory or None
+        The versions of the main graph, once the page sent it.
+    version : str or None
+        Token of the state of the main graph the page was last sent, changed
+        with every change of it.
+    lock : threading.Lock
+        Serializes the use of the main graph by callbacks and background jobs.
+    element_keys : list
+        The keys of the elements of the main graph in the order the page holds
+        them, to patch removals, see `utils.patch.graph_update`.
+    match_indexes : dict
+        The `MatchIndex` of rules applied to the main graph, by rule ID. They
+        hold the matches in the current version and are dropped when it changes,
+        unless the change updated them.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.history = None
+        self.version = None
+        self.lock = threading.Lock()
+        self.element_keys = []
+        self.match_indexes = {}
+        self.last_used = time.monotonic()
+
+    @property
+    def state(self):
+        """The data of the ``main-graph-version`` store for the current version."""
+        return {'session': self.id, 'version': self.version}
+
+    def get_history(self, state):
+        """
+        Get the history of the main graph, if the page holds its current version.
+
+        Call with `lock` held.
+
+        Parameters
+        ----------
+        state : dict
+            The data of the ``main-graph-version`` store of the page.
+
+        Returns
+        -------
+        GraphHistory or None
+            The history, or None if the page holds another version, e.g. when
+            a response was dropped. The page then has to send its elements to
+            `sync`.
+        """
+        if self.history is None or not state or state.get('version') != self.version:
+            return None
+        return self.history
+
+    def changed(self, match_indexes=None):
+        """
+        Record that the main graph changed, once the changes are sent to the page.
+
+        Call with `lock` held.
+
+        Parameters
+        ----------
+        element_keys : list
+        The keys of the elements of the main graph in the order the page holds
+        them, to patch removals, see `utils.patch.graph_update`.
+    match_indexes : dict, optional
+            The match indexes, by rule ID, updated for the changes. The match
+            indexes of the previous version are dropped otherwise.
+
+        Returns
+        -------
+        dict
+            The new data of the ``main-graph-version`` store.
+        """
+        self.version = uuid.uuid4().hex
+        self.match_indexes = match_indexes or {}
+        return self.state
+
+    def sync(self, elements):
+        """
+        Make the main graph hold the graph of the page.
+
+        If they differ, the graph of the page is recorded as a new version of
+        the history.
+
+        Call with `lock` held.
+
+        Parameters
+        ----------
+        elements : list
+            The Cytoscape elements of the graph in the page.
+
+        Returns
+        -------
+        dict
+            The new data of the ``main-graph-version`` store.
+        """
+        if self.history is None:
+            self.history = GraphHistory(GraphManager.from_elements(elements), max_versions=HISTORY_MAX_VERSIONS)
+        else:
+            self.history.sync(elements)
+        self.element_keys = element_keys(elements)
+        return self.changed()
+
+    def load(self, graph_manager, label='Load graph'):
+        """
+        Make a loaded graph the main graph, starting a new history.
+
+        Call with `lock` held.
+
+        Parameters
+        ----------
+        graph_manager : GraphManager
+            The loaded graph.
+        label : str, optional
+            The label of the first version of the history.
+
+        Returns
+        -------
+        dict
+            The new data of the ``main-graph-version`` store.
+        """
+        self.history = GraphHistory(graph_manager, label, HISTORY_MAX_VERSIONS)
+        # The page is sent the elements of the graph as they are now
+        self.element_keys = element_keys(graph_manager.elements)
+        return self.changed()
+
+def _forget_idle_sessions():
+    now = time.monotonic()
+    with _sessions_lock:
+        for session_id in [session_id for session_id, session in _sessions.items()
+                           if now - session.last_used > SESSION_RETENTION]:
+            del _sessions[session_id]
+
+def get_session(state, create=False):
+    """
+    Get the session of a page.
+
+    Parameters
+    ----------
+    state : dict
+        The data of the ``main-graph-version`` store of the page.
+    create : bool, optional
+        Whether to start a new session if the page has none, e.g. when it was
+        just loaded, or its session is unknown, e.g. after a server restart.
+
+    Returns
+    -------
+    GraphSession or None
+        The session, or None if it is unknown and `create` is False. The page
+        then has to send its elements to `GraphSession.sync` of a new session.
+    """
+    _forget_idle_sessions()
+    session_id = state.get('session') if state else None
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+        if session is None and create:
+            session = GraphSession()
+            _sessions[session.id] = session
+    if session is not None:
+        session.last_used = time.monotonic()
+    return session
+
+def job_queue(state):
+    """
+    Get the key of the queue of the background jobs of a page, for `jobs.start_job`.
+
+    Parameters
+    ----------
+    state : dict
+        The data of the ``main-graph-version`` store of the page.
+
+    Returns
+    -------
+    str or None
+        The session ID, or None if the page has no session yet.
+    """
+    return state.get('session') if state else None
+
+def sync_request():
+    """Get a new value for the store asking the page to send its elements to `GraphSession.sync`."""
+    return uuid.uuid4().hex
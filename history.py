@@ -0,0 +1,274 @@
+from collections import namedtuple
+from contextlib import contextmanager
+
+from classes import GraphManager
+
+class Version(namedtuple('Version', ['label', 'changes', 'checkpoint', 'replay_cost'])):
+    """A version of a graph in a `GraphHistory`.
+
+    Attributes
+    ----------
+    label : str or None
+        Description of the changes that produced the version.
+    changes : tuple
+        The undo log entries of those changes, oldest first.
+    checkpoint : GraphCore or None
+        A copy of the graph at this version, kept for some versions only.
+    replay_cost : int
+        Number of changes to replay from the last checkpoint to reach this
+        version.
+    """
+    __slots__ = ()
+
+class GraphHistory:
+    """The versions of a graph, for undo/redo and access to past steps.
+
+    Versions only store their changes as recorded by `GraphTransaction`, so the
+    graph itself is shared by all of them. Undo and redo replay the changes of
+    one version, so they take time linear in the number of those changes, not
+    constant time, but independent of the size of the graph. Every committed
+    outermost transaction of the graph manager becomes a version; in
+    particular each `apply_dpo_rule` call outside a transaction is one
+    derivation step.
+
+    A copy of the graph is kept as a checkpoint whenever the changes since the
+    last one outnumber the elements of the graph, so any version can be
+    rebuilt by `graph_at` with a replay no longer than a copy of the graph.
+
+    With `max_versions`, the oldest versions are forgotten once there are more,
+    half of them at a time, so the memory of a long session stays bounded.
+
+    Changes made through `GraphManager.clear`, `copy_from` or by setting
+    `GraphManager.elements` are not recorded; use `sync` to record a new state
+    of the whole graph.
+    """
+
+    def __init__(self, graph_manager, label='Initial', max_versions=None):
+        """
+        Parameters
+        ----------
+        graph_manager : GraphManager
+            The graph manager, whose current graph becomes the first version.
+        label : str, optional
+            The label of the first version.
+        max_versions : int, optional
+            The number of versions to keep; all of them by default.
+        """
+        self.graph_manager = graph_manager
+        graph_manager.history = self
+        self.versions = [Version(label, (), graph_manager.core.copy(), 0)]
+        self.position = 0
+        self.max_versions = max_versions
+
+    def __len__(self):
+        return len(self.versions)
+
+    @property
+    def can_undo(self):
+        return self.position > 0
+
+    @property
+    def can_redo(self):
+        return self.position < len(self.versions) - 1
+
+    @property
+    def label(self):
+        """The label of the current version."""
+        return self.versions[self.position].label
+
+    def push(self, changes, label=None):
+        """
+        Add a version after the current one, dropping the versions that could be redone.
+
+        Called by `GraphTransaction.commit`; the changes must already have been
+        made to the graph.
+
+        Parameters
+        ----------
+        changes : list
+            The undo log entries of the changes.
+        label : str, optional
+            Description of the changes.
+        """
+        del self.versions[self.position + 1:]
+        core = self.graph_manager.core
+        replay_cost = self.versions[self.position].replay_cost + len(changes)
+        checkpoint = None
+        if replay_cost > len(core) + core.number_of_edges():
+            checkpoint = core.copy()
+            replay_cost = 0
+        self.versions.append(Version(label, tuple(changes), checkpoint, replay_cost))
+        self.position += 1
+        self._trim()
+
+    def _trim(self):
+        """Forget the oldest half of the versions once there are more than `max_versions`."""
+        if self.max_versions is None or len(self.versions) <= self.max_versions:
+            return
+        count = len(self.versions) - max(self.max_versions // 2, 1)
+        # The first version needs a checkpoint to rebuild the others from
+        first = self.versions[count]
+        if first.checkpoint is None:
+            first = first._replace(checkpoint=self.graph_at(count).core, replay_cost=0)
+        self.versions = [first] + self.versions[count + 1:]
+        self.position -= count
+
+    @contextmanager
+    def keeping_versions(self):
+        """
+        Keep all versions while the context is open, e.g. to `revert` several pushed versions.
+
+        Yields
+        ------
+        int
+            The index of the current version, which stays valid in the context.
+        """
+        max_versions, self.max_versions = self.max_versions, None
+        try:
+            yield self.position
+        finally:
+            self.max_versions = max_versions
+            self._trim()
+
+    def _check_idle(self):
+        if self.graph_manager._undo_log is not None:
+            raise RuntimeError("Cannot move through the history while a transaction is open")
+
+    def undo(self):
+        """
+        Go back to the previous version.
+
+        Returns
+        -------
+        bool
+            False if there is no previous version.
+        """
+        self._check_idle()
+        if not self.can_undo:
+            return False
+        for operation in reversed(self.versions[self.position].changes):
+            self.graph_manager._undo(operation)
+        self.position -= 1
+        return True
+
+    def redo(self):
+        """
+        Go forward to the next version.
+
+        Returns
+        -------
+        bool
+            False if there is no next version.
+        """
+        self._check_idle()
+        if not self.can_redo:
+            return False
+        self.position += 1
+        for operation in self.versions[self.position].changes:
+            self.graph_manager._redo(operation)
+        return True
+
+    def checkout(self, position):
+        """
+        Make the graph manager hold the graph of a version, undoing or redoing the versions in between.
+
+        Parameters
+        ----------
+        position : int
+            The index of the version.
+        """
+        if not 0 <= position < len(self.versions):
+            raise IndexError(f"No version {position}, the history has {len(self.versions)}")
+        while self.position > position:
+            self.undo()
+        while self.position < position:
+            self.redo()
+
+    def revert(self, position):
+        """
+        Go back to a version and drop the versions after it, so they cannot be redone.
+
+        Used to roll back changes committed as several versions.
+
+        Parameters
+        ----------
+        position : int
+            The index of the version.
+        """
+        self.checkout(position)
+        del self.versions[position + 1:]
+
+    def graph_at(self, position):
+        """
+        Rebuild the graph of a version without changing the current one.
+
+        Parameters
+        ----------
+        position : int
+            The index of the version.
+
+        Returns
+        -------
+        GraphManager
+            A new graph manager holding the graph of the version.
+        """
+        if not 0 <= position < len(self.versions):
+            raise IndexError(f"No version {position}, the history has {len(self.versions)}")
+        start = position
+        while self.versions[start].checkpoint is None:
+            start -= 1
+        manager = GraphManager()
+        manager.core = self.versions[start].checkpoint.copy()
+        manager._element_list = None
+        for version in self.versions[start + 1:position + 1]:
+            for operation in version.changes:
+                manager._redo(operation)
+        return manager
+
+    def sync(self, elements, label='Edit'):
+        """
+        Record the graph given by Cytoscape elements as a new version, if it differs from the current one.
+
+        Only the nodes and edges that differ are changed, so the version is as
+        small as the edit. Element data of existing nodes and edges is taken
+        over without being recorded.
+
+        Parameters
+        ----------
+        elements : list
+            The Cytoscape elements of the graph.
+        label : str, optional
+            Description of the changes.
+
+        Returns
+        -------
+        bool
+            True if a version was added.
+        """
+        manager = self.graph_manager
+        core = manager.core
+        target = GraphManager.from_elements(elements).core
+
+        with manager.begin(label) as transaction:
+            for record in list(core.edge_records()):
+                target_record = target.edge(record.source, record.target)
+                if target_record is None or target_record.edge_id != record.edge_id:
+                    manager.remove_edge(record.source, record.target)
+            for node_id in list(core.nodes()):
+                if node_id not in target:
+                    manager.remove_node(node_id)
+            for node_id in target.nodes():
+                if node_id not in core:
+                    manager.add_node(node_id)
+            for record in target.edge_records():
+                if not core.has_edge(record.source, record.target):
+                    manager.add_edge(record.source, record.target, record.id)
+            changed = len(transaction) > 0
+
+        # Element data is not versioned; take over what the elements carry
+        core.node_elements = dict(target.node_elements)
+        core.reset_attribute_index()
+        for record in core.edge_records():
+            record.element = target.edge(record.source, record.target).element
+        manager._element_list = None
+        return changed
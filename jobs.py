@@ -0,0 +1,189 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import traceback
+import uuid
+
+# Jobs of different pages run side by side, up to this many at a time
+JOB_WORKERS = 4
+
+# Jobs and the graph sessions they rewrite are kept in the memory of this
+# process, so the app has to be served by a single process; its requests may
+# be handled by any number of threads.
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='rewrite-job')
+_jobs = {}
+# Jobs waiting for the running job of their queue, by queue key
+_queues = {}
+_jobs_lock = threading.Lock()
+
+# Finished jobs are forgotten this many seconds after they were last polled
+JOB_RETENTION = 600.0
+
+class RewriteJob:
+    """A rule application running in the background.
+
+    The work function receives the job and reports its progress with
+    `report`, and checks `cancel_event` (or `cancelled`) between steps so it
+    can stop early.
+
+    Attributes
+    ----------
+    id : str
+        The job ID.
+    status : str
+        ``'queued'``, ``'running'``, ``'done'``, ``'failed'``, or ``'cancelled'``
+        if it was cancelled before it started.
+    progress : dict
+        The last progress reported by the job.
+    result : object
+        The return value of the work function, once the job is done.
+    error : str
+        The error message if the job failed.
+    """
+
+    def __init__(self):
+        self.id = str(uuid.uuid4())
+        self.status = 'queued'
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.started_at = None
+        self.finished_at = None
+        self.last_polled = time.monotonic()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'cancelled', 'failed')
+
+    def report(self, **progress):
+        """Replace the progress of the job."""
+        self.progress = progress
+
+    def cancel(self):
+        """Ask the job to stop at its next check."""
+        self.cancel_event.set()
+
+    def _run(self, work, args, kwargs):
+        self.started_at = time.monotonic()
+        if self.cancelled:
+            # Cancelled while queued; a job cancelled while running reports it in its result
+            self.status = 'cancelled'
+            self.finished_at = self.started_at
+            return
+        self.status = 'running'
+        try:
+            self.result = work(self, *args, **kwargs)
+            self.status = 'done'
+        except Exception as e:
+            traceback.print_exc()
+            self.error = str(e)
+            self.status = 'failed'
+        self.finished_at = time.monotonic()
+
+def _forget_stale_jobs():
+    now = time.monotonic()
+    with _jobs_lock:
+        for job_id in [job_id for job_id, job in _jobs.items()
+                       if job.is_finished and now - job.last_polled > JOB_RETENTION]:
+            del _jobs[job_id]
+
+def _run_queued(job, work, args, kwargs, queue):
+    try:
+        job._run(work, args, kwargs)
+    finally:
+        if queue is not None:
+            with _jobs_lock:
+                waiting = _queues[queue]
+                if waiting:
+                    _executor.submit(_run_queued, *waiting.popleft(), queue)
+                else:
+                    del _queues[queue]
+
+def start_job(work, *args, queue=None, **kwargs):
+    """
+    Run a function in the background.
+
+    Parameters
+    ----------
+    work : callable
+        Called as ``work(job, *args, **kwargs)`` in the job thread.
+    *args, **kwargs
+        Further arguments of `work`.
+    queue : hashable, optional
+        Jobs with the same queue key, e.g. the session of a page, run one
+        after the other in the order they were started. Other jobs run as
+        soon as a worker is free.
+
+    Returns
+    -------
+    RewriteJob
+        The job, queued behind the jobs of its queue that have not finished.
+    """
+    _forget_stale_jobs()
+    job = RewriteJob()
+    with _jobs_lock:
+        _jobs[job.id] = job
+        if queue is not None:
+            if queue in _queues:
+                _queues[queue].append((job, work, args, kwargs))
+                return job
+            _queues[queue] = deque()
+    _executor.submit(_run_queued, job, work, args, kwargs, queue)
+    return job
+
+def get_job(job_id):
+    """
+    Get a job by its ID.
+
+    Parameters
+    ----------
+    job_id : str
+        The job ID.
+
+    Returns
+    -------
+    RewriteJob or None
+        The job, or None if it is unknown or was forgotten.
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        job.last_polled = time.monotonic()
+    return job
+
+def pop_job(job_id):
+    """Remove a job from the registry, returning it or None."""
+    with _jobs_lock:
+        return _jobs.pop(job_id, None)
+
+def cancel_job(job_id):
+    """
+    Cancel a job.
+
+    Parameters
+    ----------
+    job_id : str
+        The job ID.
+
+    Returns
+    -------
+    bool
+        True if the job exists and had not finished yet.
+    """
+    job = get_job(job_id)
+    if job is None or job.is_finished:
+        return False
+    job.cancel()
+    return True
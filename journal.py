@@ -0,0 +1,337 @@
+import argparse
+import bisect
+import io
+import json
+import struct
+import zlib
+
+from graph_io import read_graph_binary, save_graph_manager, write_graph_binary
+from rule_plan import element_attributes
+
+JOURNAL_MAGIC = b'DPOJ'
+JOURNAL_VERSION = 1
+JOURNAL_EXTENSION = '.journal'
+
+# Steps compressed together in one frame
+JOURNAL_FRAME_STEPS = 1024
+# Size of the write buffer of a journal file
+JOURNAL_BUFFER_SIZE = 1 << 20
+
+_FILE_HEADER = struct.Struct('<4sH')
+# Kind, step number, record count and payload size of a frame. The step number
+# is the one of the first step of a steps frame, and the number of steps made
+# before a checkpoint.
+_FRAME_HEADER = struct.Struct('<BQII')
+_RULES = 0
+_STEPS = 1
+_CHECKPOINT = 2
+
+# Fields of a step, in the order they are stored in
+_STEP_FIELDS = ('rule', 'match', 'removed_edges', 'removed_nodes', 'added_nodes', 'added_edges')
+
+def _encode(records):
+    return zlib.compress(json.dumps(records, separators=(',', ':')).encode('utf-8'))
+
+class DerivationJournal:
+    """An append-only record of the steps of a derivation, written to a file as they are made.
+
+    Every successful `apply_dpo_rule` given the journal adds a step with the
+    ID of the rule, its match and the host elements it removed and added.
+    Steps are buffered and written as zlib-compressed frames of
+    `JOURNAL_FRAME_STEPS` steps. The graph is written as a checkpoint when the
+    journal is opened and whenever the changes since the last checkpoint
+    outnumber the elements of the graph, like `GraphHistory` does, so any
+    step can be replayed from a checkpoint with no more changes than
+    elements in the graph. Use `JournalReader` to read it.
+
+    Steps rolled back by an enclosing transaction are not removed from the
+    journal, so a journal is meant for derivations that are kept, such as
+    batch rewriting.
+    """
+
+    def __init__(self, path, graph_manager, metadata=None):
+        """
+        Parameters
+        ----------
+        path : str
+            Path of the journal file, replaced if it exists.
+        graph_manager : GraphManager
+            The graph being rewritten, whose current state is the first
+            checkpoint.
+        metadata : dict, optional
+            Extra JSON data stored with the first checkpoint.
+        """
+        self.path = path
+        self.graph_manager = graph_manager
+        self.steps = 0
+        self._file = open(path, 'wb', buffering=JOURNAL_BUFFER_SIZE)
+        self._file.write(_FILE_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION))
+        self._records = []
+        self._rule_ids = {}
+        self._changes = 0
+        self.checkpoint(metadata)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write_frame(self, kind, step, count, payload):
+        self._file.write(_FRAME_HEADER.pack(kind, step, count, len(payload)))
+        self._file.write(payload)
+
+    def _flush_steps(self):
+        if self._records:
+            first = self.steps - len(self._records) + 1
+            self._write_frame(_STEPS, first, len(self._records), _encode(self._records))
+            self._records = []
+
+    def add_rule(self, rule_id, plan, rule_data=None):
+        """
+        Record a rule, so steps of its plan refer to it by its ID.
+
+        Steps of plans that were not added refer to their content hash.
+
+        Parameters
+        ----------
+        rule_id : str
+            The rule ID.
+        plan : RulePlan
+            The compiled rule.
+        rule_data : dict, optional
+            The rule data, stored in the journal so the derivation can be
+            reproduced.
+        """
+        if plan.content_hash in self._rule_ids:
+            return
+        self._rule_ids[plan.content_hash] = rule_id
+        record = {'id': rule_id, 'content_hash': plan.content_hash, 'rule': rule_data}
+        self._write_frame(_RULES, self.steps, 1, _encode([record]))
+
+    def record_step(self, plan, match, delta):
+        """
+        Add a step, called by `apply_dpo_rule`.
+
+        Parameters
+        ----------
+        plan : RulePlan
+            The applied rule.
+        match : dict
+            The match it was applied at.
+        delta : dict
+            The changes of the step, as recorded by `apply_dpo_rule`.
+        """
+        self.steps += 1
+        removed_edges = delta['removed_edges']
+        removed_nodes = delta['removed_nodes']
+        added_nodes = delta['added_nodes']
+        added_edges = delta['added_edges']
+        core = self.graph_manager.core
+        stored_nodes = []
+        for node_id in added_nodes:
+            data = core.node_data(node_id)
+            # Nodes given data by the rule are stored with a copy of it
+            stored_nodes.append([node_id, dict(data)] if element_attributes({'data': data}) else node_id)
+        # Stored as a list rather than a dict, as the field names would take most of a frame
+        self._records.append([self._rule_ids.get(plan.content_hash, plan.content_hash), match,
+                              list(removed_edges), list(removed_nodes), stored_nodes, list(added_edges)])
+        self._changes += len(removed_edges) + len(removed_nodes) + len(added_nodes) + len(added_edges)
+        if len(self._records) >= JOURNAL_FRAME_STEPS:
+            self._flush_steps()
+        if self._changes > len(core) + core.number_of_edges():
+            self.checkpoint()
+
+    def checkpoint(self, metadata=None):
+        """Write the current graph, so replays of later steps can start from it."""
+        self._flush_steps()
+        buffer = io.BytesIO()
+        write_graph_binary(self.graph_manager, buffer, metadata)
+        self._write_frame(_CHECKPOINT, self.steps, 1, zlib.compress(buffer.getvalue(), 1))
+        self._changes = 0
+
+    def flush(self):
+        """Write the buffered steps to the file."""
+        self._flush_steps()
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._flush_steps()
+            self._file.close()
+
+def apply_step(graph_manager, step):
+    """
+    Make the changes of a journal step to a graph.
+
+    Parameters
+    ----------
+    graph_manager : GraphManager
+        The graph, as it was before the step.
+    step : dict
+        The step, as read by `JournalReader`.
+    """
+    for source, target in step['removed_edges']:
+        graph_manager.remove_edge(source, target)
+    for node_id in step['removed_nodes']:
+        graph_manager.remove_node(node_id)
+    for node in step['added_nodes']:
+        if isinstance(node, list):
+            graph_manager.add_node(node[0], {'data': node[1]})
+        else:
+            graph_manager.add_node(node)
+    for source, target in step['added_edges']:
+        graph_manager.add_edge(source, target)
+
+class JournalReader:
+    """The steps, rules and checkpoints of a journal written by `DerivationJournal`.
+
+    Opening a journal only reads the headers of its frames, skipping over
+    their contents, so a graph at any step is rebuilt by decompressing the
+    nearest checkpoint before it and the frames of the steps in between. A
+    frame cut off at the end of the file, e.g. by a crash, is ignored.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : str
+            Path of the journal file.
+        """
+        self.path = path
+        self.rules = {}
+        # Step numbers and offsets of the checkpoints, and first step numbers,
+        # counts and offsets of the step frames, in file order
+        self._checkpoints = []
+        self._frames = []
+        with open(path, 'rb') as f:
+            header = f.read(_FILE_HEADER.size)
+            if len(header) < _FILE_HEADER.size:
+                raise ValueError(f"{path} is not a derivation journal")
+            magic, version = _FILE_HEADER.unpack(header)
+            if magic != JOURNAL_MAGIC:
+                raise ValueError(f"{path} is not a derivation journal")
+            if version != JOURNAL_VERSION:
+                raise ValueError(f"Unsupported journal version {version}")
+            size = f.seek(0, 2)
+            offset = _FILE_HEADER.size
+            while offset + _FRAME_HEADER.size <= size:
+                f.seek(offset)
+                kind, step, count, payload_size = _FRAME_HEADER.unpack(f.read(_FRAME_HEADER.size))
+                payload_offset = offset + _FRAME_HEADER.size
+                if payload_offset + payload_size > size:
+                    break
+                if kind == _RULES:
+                    for record in self._read_records(f, payload_offset, payload_size):
+                        self.rules[record['id']] = record
+                elif kind == _STEPS:
+                    self._frames.append((step, count, payload_offset, payload_size))
+                elif kind == _CHECKPOINT:
+                    self._checkpoints.append((step, payload_offset, payload_size))
+                offset = payload_offset + payload_size
+        if not self._checkpoints:
+            raise ValueError(f"{path} has no checkpoint")
+        self._checkpoint_steps = [checkpoint[0] for checkpoint in self._checkpoints]
+        self._frame_steps = [frame[0] for frame in self._frames]
+
+    @staticmethod
+    def _read_records(f, offset, size):
+        f.seek(offset)
+        return json.loads(zlib.decompress(f.read(size)))
+
+    def __len__(self):
+        """The number of steps."""
+        if not self._frames:
+            return 0
+        first, count, _, _ = self._frames[-1]
+        return first + count - 1
+
+    @property
+    def checkpoints(self):
+        """The step numbers after which the graph was written."""
+        return list(self._checkpoint_steps)
+
+    def iter_steps(self, start=1, stop=None):
+        """
+        Iterate over steps.
+
+        Parameters
+        ----------
+        start : int, optional
+            The number of the first step, counting from 1.
+        stop : int, optional
+            The number of the last step; the last step of the journal by default.
+
+        Yields
+        ------
+        dict
+            The steps, with the ``rule`` ID, the ``match`` and the
+            ``removed_edges``, ``removed_nodes``, ``added_nodes`` and
+            ``added_edges``. Added nodes with data are given as a list of
+            their ID and data.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        position = max(bisect.bisect_right(self._frame_steps, start) - 1, 0)
+        with open(self.path, 'rb') as f:
+            for first, count, offset, size in self._frames[position:]:
+                if first > stop:
+                    break
+                if first + count <= start:
+                    continue
+                for step, record in enumerate(self._read_records(f, offset, size), first):
+                    if start <= step <= stop:
+                        yield dict(zip(_STEP_FIELDS, record))
+
+    def graph_at(self, step=None):
+        """
+        Rebuild the graph after a step.
+
+        Parameters
+        ----------
+        step : int, optional
+            The number of steps made, from 0 for the graph the derivation
+            started from; the last step by default.
+
+        Returns
+        -------
+        GraphManager
+            A new graph manager holding the graph.
+        """
+        step = len(self) if step is None else step
+        if not 0 <= step <= len(self):
+            raise IndexError(f"No step {step}, the journal has {len(self)}")
+        checkpoint_step, offset, size = self._checkpoints[bisect.bisect_right(self._checkpoint_steps, step) - 1]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            graph_manager, _ = read_graph_binary(zlib.decompress(f.read(size)))
+        if step > checkpoint_step:
+            for record in self.iter_steps(checkpoint_step + 1, step):
+                apply_step(graph_manager, record)
+        return graph_manager
+
+def main(argv=None):
+    """Show a journal, or write the graph at one of its steps."""
+    parser = argparse.ArgumentParser(description="Inspect a derivation journal or replay it up to a step.")
+    parser.add_argument('journal', help="journal file")
+    parser.add_argument('--step', type=int, default=None, help="step to replay up to (default: the last one)")
+    parser.add_argument('--output', default=None,
+                        help="write the graph after the step to this file, in the format of its extension")
+    parser.add_argument('--list', action='store_true', help="print the rule and match of every step up to --step")
+    args = parser.parse_args(argv)
+
+    reader = JournalReader(args.journal)
+    print(f"{args.journal}: {len(reader)} steps of {len(reader.rules)} rules, checkpoints after steps "
+          f"{', '.join(map(str, reader.checkpoints))}")
+    if args.list:
+        for number, step in enumerate(reader.iter_steps(1, args.step), 1):
+            print(f"  {number}: {step['rule']} at {step['match']}")
+    if args.output:
+        graph_manager = reader.graph_at(args.step)
+        save_graph_manager(graph_manager, args.output)
+        print(f"Graph after step {len(reader) if args.step is None else args.step} written to {args.output}: "
+              f"{len(graph_manager.core)} nodes, {graph_manager.core.number_of_edges()} edges")
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -125,6 +125,24 @@ def create_layout():
     return html.Div([
         # Add this store component for alerts
         dcc.Store(id='alert-store', data=''),
+
+        # Background rule application: the running job and the timer polling its progress
+        dcc.Store(id='rewrite-job-store', data=None),
+        dcc.Interval(id='rewrite-job-interval', interval=500, disabled=True),
+
+        # Background loading of an uploaded graph, polled like rule application
+        dcc.Store(id='graph-load-job-store', data=None),
+        dcc.Interval(id='graph-load-job-interval', interval=500, disabled=True),
+
+        # The page of the saved rules list, and the store ID the main graph was last saved under
+        dcc.Store(id='saved-rules-page', data=0),
+        dcc.Store(id='saved-graph-id', data=None),
+
+        # The session and version of the main graph kept on the server that the page holds,
+        # sent by callbacks instead of the elements; a change of the request makes the page
+        # send its elements when the versions differ
+        dcc.Store(id='main-graph-version', data=None),
+        dcc.Store(id='main-graph-sync-request', data=None),
         
         # Add this div for displaying alerts
         html.Div(id='alert-container', style={
@@ -191,7 +209,7 @@ def create_layout():
                                     html.Button('Load Graph', style={**button_style, 'backgroundColor': '#3498DB'}),
                                 ]),
                             ],
-                            accept='application/json'
+                            accept='application/json,.json,.gbin,.graphml,.edgelist,.adjlist'
                         ),
                     ])
                 ], style={'textAlign': 'center', 'marginBottom': '20px'}),
@@ -220,6 +238,14 @@ def create_layout():
                                 style={**button_style, 'backgroundColor': blue}),
                         html.Button('Apply Rules', id='apply-rules-button', n_clicks=0, 
                                 style={**button_style, 'backgroundColor': blue}),
+                        html.Button('Apply Until Done', id='apply-rules-fixpoint-button', n_clicks=0, 
+                                style={**button_style, 'backgroundColor': blue}),
+                        html.Button('Cancel', id='cancel-rules-button', n_clicks=0, disabled=True,
+                                style={**button_style, 'backgroundColor': '#ff4444'}),
+                        html.Button('Undo', id='undo-button', n_clicks=0, 
+                                style={**button_style, 'backgroundColor': blue}),
+                        html.Button('Redo', id='redo-button', n_clicks=0, 
+                                style={**button_style, 'backgroundColor': blue}),
                         html.Button('Save Rule To JSON', id='save-rule-button', n_clicks=0, 
                                 style={**button_style, 'backgroundColor': '#2ECC71'}),
                     ], style={'textAlign': 'center', 'marginBottom': '20px'}),
@@ -0,0 +1,236 @@
+import json
+
+import networkx as nx
+
+from dpo import iter_matches, rule_may_apply
+from rule_plan import element_attributes
+
+def graph_signature(graph):
+    """
+    Compute a signature identifying the structure of a graph.
+
+    Parameters
+    ----------
+    graph : networkx.Graph or GraphCore
+        The graph.
+
+    Returns
+    -------
+    int
+        A hash of the node set, the (undirected) edge set and, for a
+        `GraphCore`, the attributes typing its elements.
+    """
+    attributes = set()
+    if hasattr(graph, 'node_elements'):
+        elements = list(graph.node_elements.values())
+        elements.extend(record.element for record in graph.edge_records() if record.element is not None)
+        for element in elements:
+            values = element_attributes(element)
+            if values:
+                attributes.add((element['data']['id'], json.dumps(values, sort_keys=True, default=str)))
+    return hash((
+        frozenset(graph.nodes()),
+        frozenset(frozenset(edge) for edge in graph.edges()),
+        frozenset(attributes),
+    ))
+
+def lhs_signature(rule_manager):
+    """
+    Compute a signature of the LHS graph of a rule.
+
+    Only the LHS and its compiled pattern determine the matches of a rule, so
+    the index of a rule whose K or R graph changed can be kept unless that
+    changed the symmetries of the rule.
+
+    Parameters
+    ----------
+    rule_manager : RuleManager or RulePlan
+        The rule.
+
+    Returns
+    -------
+    int
+        A hash of the LHS node and edge sets and of its pattern.
+    """
+    plan = rule_manager.compile()
+    return hash((graph_signature(plan.lhs_graph), repr(plan.pattern)))
+
+def touched_nodes(delta):
+    """
+    Collect the host node IDs affected by a delta.
+
+    Parameters
+    ----------
+    delta : dict
+        A delta filled by `apply_dpo_rule`.
+
+    Returns
+    -------
+    set
+        The removed and added nodes and the endpoints of removed and added edges.
+    """
+    nodes = set(delta['removed_nodes']) | set(delta['added_nodes'])
+    for source, target in delta['removed_edges'] | delta['added_edges']:
+        nodes.add(source)
+        nodes.add(target)
+    return nodes
+
+def _neighborhood(graph, seeds, radius):
+    """Collect the nodes within a distance of radius from any of the seeds."""
+    reached = set(seeds)
+    frontier = list(reached)
+    for _ in range(radius):
+        next_frontier = []
+        for node in frontier:
+            for neighbor in graph.neighbors(node):
+                if neighbor not in reached:
+                    reached.add(neighbor)
+                    next_frontier.append(neighbor)
+        frontier = next_frontier
+    return reached
+
+class MatchIndex:
+    """The matches of a rule in a host graph, kept up to date across rule applications.
+
+    After the index has been built, each rewrite of the host graph is reported
+    to `update` as the delta recorded by `apply_dpo_rule`. Matches using a
+    touched node are dropped and new matches are only searched for in the
+    neighbourhood of the touched nodes, so the cost of an update is
+    proportional to the change instead of to the size of the host graph.
+    """
+
+    def __init__(self, host_graph_manager, rule_manager, persist_node_id=True):
+        """
+        Parameters
+        ----------
+        host_graph_manager : GraphManager
+            The host graph manager.
+        rule_manager : RuleManager or RulePlan
+            The rule whose matches are indexed.
+        persist_node_id : bool, optional
+            Whether LHS nodes may only be matched to host nodes with the same ID,
+            as done by `apply_rule_parallel`.
+        """
+        self.host_graph_manager = host_graph_manager
+        self.rule_manager = rule_manager
+        self.plan = rule_manager.compile()
+        self.persist_node_id = persist_node_id
+        self.lhs_signature = lhs_signature(rule_manager)
+        self.matches = {}
+        self.matches_by_node = {}
+
+        # A match of a connected LHS lies within diameter(L) of any of its nodes,
+        # so only that neighbourhood of a touched node has to be searched again.
+        L = self.plan.lhs_graph
+        if len(L) > 0 and nx.is_connected(L):
+            self.radius = nx.diameter(L)
+        else:
+            self.radius = None
+
+        self.rebuild()
+
+    def __len__(self):
+        return len(self.matches)
+
+    def __iter__(self):
+        return iter(self.matches.values())
+
+    def get_matches(self):
+        """
+        Get the current matches.
+
+        Returns
+        -------
+        List[Dict]
+            A list of node mappings from LHS nodes to host graph nodes.
+        """
+        return list(self.matches.values())
+
+    def _find(self, graph):
+        return iter_matches(graph, self.plan.lhs_graph, persist_node_id=self.persist_node_id, pattern=self.plan.pattern)
+
+    def _add(self, match):
+        key = frozenset(match.items())
+        if key in self.matches:
+            return
+        self.matches[key] = match
+        for node in match.values():
+            self.matches_by_node.setdefault(node, set()).add(key)
+
+    def _discard_node(self, node):
+        for key in self.matches_by_node.pop(node, ()):
+            match = self.matches.pop(key, None)
+            if match is None:
+                continue
+            for other in match.values():
+                if other != node and other in self.matches_by_node:
+                    self.matches_by_node[other].discard(key)
+
+    def rebuild(self):
+        """Search the whole host graph for matches of the rule."""
+        self.matches = {}
+        self.matches_by_node = {}
+        if rule_may_apply(self.host_graph_manager.core, self.plan):
+            for match in self._find(self.host_graph_manager.core):
+                self._add(match)
+
+    def update(self, delta):
+        """
+        Update the matches after the host graph was rewritten.
+
+        Parameters
+        ----------
+        delta : dict
+            The changes made to the host graph, as recorded by `apply_dpo_rule`.
+        """
+        touched = touched_nodes(delta)
+        if not touched:
+            return
+
+        # Matches are induced subgraphs, so any change at a matched node invalidates them
+        for node in touched:
+            self._discard_node(node)
+
+        G = self.host_graph_manager.core
+        seeds = [n for n in touched if n in G]
+        if not seeds or not rule_may_apply(G, self.plan):
+            return
+
+        if self.persist_node_id:
+            # The identity match is looked up directly and does not need a search region
+            region = G
+        elif self.radius is None:
+            self.rebuild()
+            return
+        else:
+            region = G.subgraph(_neighborhood(G, seeds, self.radius))
+
+        for match in self._find(region):
+            if not touched.isdisjoint(match.values()):
+                self._add(match)
+
+    def attach(self, host_graph_manager, rule_manager):
+        """
+        Reuse the index for a rule rebuilt from its serialized form.
+
+        The host graph is not checked: the caller keeps the index only while
+        the host graph is the one it was last updated for.
+
+        Parameters
+        ----------
+        host_graph_manager : GraphManager
+            The host graph manager.
+        rule_manager : RuleManager or RulePlan
+            The rule.
+
+        Returns
+        -------
+        bool
+            True if the index is for the same rule, False if it has to be rebuilt.
+        """
+        if lhs_signature(rule_manager) != self.lhs_signature:
+            return False
+        self.host_graph_manager = host_graph_manager
+        self.rule_manager = rule_manager
+        self.plan = rule_manager.compile()
+        return True
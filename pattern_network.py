@@ -0,0 +1,281 @@
+import json
+
+from dpo import has_attributes, node_order_key
+from match_index import touched_nodes
+
+class _PatternNode:
+    """A sub-pattern shared by the rules whose search order starts with it.
+
+    The sub-pattern is the one of the parent node extended by one node, whose
+    constraints are given by `step`. `tokens` holds the host node tuples
+    matching the sub-pattern in search order, and `by_node` the tokens by each
+    host node they use.
+    """
+    __slots__ = ('step', 'attributes', 'parent', 'anchor', 'children', 'tokens', 'by_node')
+
+    def __init__(self, step, attributes, parent):
+        self.step = step
+        # The node and edge attributes required by the step, as in `MatchPattern`
+        self.attributes = attributes
+        self.parent = parent
+        adjacent = step[1]
+        self.anchor = min(adjacent) if adjacent else None
+        self.children = {}
+        self.tokens = set()
+        self.by_node = {}
+
+    def add(self, token):
+        if token in self.tokens:
+            return False
+        self.tokens.add(token)
+        for node in token:
+            self.by_node.setdefault(node, set()).add(token)
+        return True
+
+    def discard_node(self, node):
+        for token in self.by_node.pop(node, ()):
+            self.tokens.discard(token)
+            for other in token:
+                if other != node:
+                    tokens = self.by_node.get(other)
+                    if tokens is not None:
+                        tokens.discard(token)
+                        if not tokens:
+                            del self.by_node[other]
+
+class RuleMatches:
+    """The matches of one rule in a `PatternNetwork`, usable where a `MatchIndex` is expected.
+
+    The matches are updated by `PatternNetwork.update`, not by the view.
+    """
+
+    def __init__(self, network, position):
+        self.network = network
+        self.position = position
+        self.plan = network.plans[position]
+
+    def __len__(self):
+        node, _ = self.network.terminals[self.position]
+        return 1 if node is None else len(node.tokens)
+
+    def __iter__(self):
+        return self.network.iter_matches(self.position)
+
+    def get_matches(self):
+        return self.network.get_matches(self.position)
+
+class PatternNetwork:
+    """The matches of a set of rules, kept in a discrimination network of shared sub-patterns.
+
+    Each LHS graph is matched node by node in the order of its compiled
+    `MatchPattern`, and every prefix of that order is a node of the network.
+    Rules whose search orders start with the same constraints share those
+    nodes, so a sub-pattern common to many rules (an edge, a path, ...) is
+    matched once, and its partial matches are kept for all of them.
+
+    After a rewrite, only partial matches using a touched node are dropped,
+    and new ones are derived from the new partial matches of the parent node
+    or by extending the unchanged ones with a touched node, as in a Rete
+    network. Matches are induced, as found by `iter_matches`.
+    """
+
+    def __init__(self, host_graph_manager, rules, persist_node_id=True):
+        """
+        Parameters
+        ----------
+        host_graph_manager : GraphManager
+            The host graph manager.
+        rules : list
+            The rules, as RuleManagers or RulePlans.
+        persist_node_id : bool, optional
+            Whether LHS nodes may only be matched to host nodes with the same ID,
+            as done by `apply_rule_parallel`.
+        """
+        self.host_graph_manager = host_graph_manager
+        self.persist_node_id = persist_node_id
+        self.plans = [rule.compile() for rule in rules]
+        self.roots = {}
+        # Network nodes, every parent before its children
+        self.nodes = []
+        # Per rule, the node of its whole LHS (None for an empty LHS) and its search order
+        self.terminals = []
+        for plan in self.plans:
+            self._add_pattern(plan.pattern)
+        self.rebuild()
+
+    def _add_pattern(self, pattern):
+        children = self.roots
+        parent = node = None
+        for i, lhs_node in enumerate(pattern.order):
+            # A node matched by ID has a single image, so no symmetric match is left to skip
+            step = (
+                lhs_node if self.persist_node_id else None,
+                pattern.back_adjacent[i],
+                pattern.back_nonadjacent[i],
+                pattern.loops[i],
+                () if self.persist_node_id else pattern.larger[i],
+                () if self.persist_node_id else pattern.smaller[i],
+                json.dumps([pattern.node_attributes[i], pattern.edge_attributes[i]], sort_keys=True),
+            )
+            node = children.get(step)
+            if node is None:
+                node = _PatternNode(step, (pattern.node_attributes[i], pattern.edge_attributes[i]), parent)
+                children[step] = node
+                self.nodes.append(node)
+            parent = node
+            children = node.children
+        self.terminals.append((node, pattern.order))
+
+    @property
+    def pattern_size(self):
+        """The number of network nodes the rules would need without sharing."""
+        return sum(len(plan.pattern.order) for plan in self.plans)
+
+    def index(self, position):
+        """
+        Get the matches of a rule.
+
+        Parameters
+        ----------
+        position : int
+            The position of the rule in the list the network was built from.
+
+        Returns
+        -------
+        RuleMatches
+            A view of the matches of the rule.
+        """
+        return RuleMatches(self, position)
+
+    def iter_matches(self, position):
+        """Iterate over the current matches of a rule, as `get_matches` without building the list."""
+        node, order = self.terminals[position]
+        if node is None:
+            yield {}
+            return
+        for token in node.tokens:
+            yield dict(zip(order, token))
+
+    def get_matches(self, position):
+        """
+        Get the current matches of a rule.
+
+        Parameters
+        ----------
+        position : int
+            The position of the rule in the list the network was built from.
+
+        Returns
+        -------
+        List[Dict]
+            A list of node mappings from LHS nodes to host graph nodes.
+        """
+        node, order = self.terminals[position]
+        if node is None:
+            return [{}]
+        return [dict(zip(order, token)) for token in node.tokens]
+
+    def _extend(self, node, token, candidates):
+        """Yield the extensions of a parent token by the candidates that satisfy the step of a node."""
+        core = self.host_graph_manager.core
+        adj = core.adj
+        fixed, adjacent, nonadjacent, loop, larger, smaller, _ = node.step
+        node_attributes, edge_attributes = node.attributes
+        lower = max((node_order_key(token[j]) for j in larger), default=None)
+        upper = min((node_order_key(token[j]) for j in smaller), default=None)
+        for candidate in candidates:
+            if candidate in token:
+                continue
+            if lower is not None or upper is not None:
+                key = node_order_key(candidate)
+                if (lower is not None and key <= lower) or (upper is not None and key >= upper):
+                    continue
+            neighbors = adj.get(candidate)
+            if neighbors is None or (candidate in neighbors) != loop:
+                continue
+            for j in adjacent:
+                if token[j] not in neighbors:
+                    break
+            else:
+                for j in nonadjacent:
+                    if token[j] in neighbors:
+                        break
+                else:
+                    if node_attributes is not None and not has_attributes(core.node_data(candidate), node_attributes):
+                        continue
+                    if all(has_attributes(core.edge_data(token[j] if j < len(token) else candidate, candidate), attributes)
+                           for j, attributes in edge_attributes):
+                        yield token + (candidate,)
+
+    def _candidates(self, node, token):
+        fixed = node.step[0]
+        if fixed is not None:
+            return (fixed,)
+        core = self.host_graph_manager.core
+        if node.anchor is not None:
+            return core.adj[token[node.anchor]]
+        node_attributes = node.attributes[0]
+        if node_attributes is not None:
+            nodes = core.attribute_index.nodes_with(node_attributes)
+            if nodes is not None:
+                return nodes
+        return core.adj
+
+    def rebuild(self):
+        """Match all sub-patterns against the whole host graph."""
+        for node in self.nodes:
+            node.tokens = set()
+            node.by_node = {}
+            parent_tokens = [()] if node.parent is None else node.parent.tokens
+            for token in parent_tokens:
+                for extended in self._extend(node, token, self._candidates(node, token)):
+                    node.add(extended)
+
+    def update(self, delta):
+        """
+        Update the matches of all rules after the host graph was rewritten.
+
+        Parameters
+        ----------
+        delta : dict
+            The changes made to the host graph, as recorded by `apply_dpo_rule`.
+        """
+        touched = touched_nodes(delta)
+        if not touched:
+            return
+
+        # Matches are induced subgraphs, so any change at a matched node invalidates them
+        for node in self.nodes:
+            for host_node in touched:
+                node.discard_node(host_node)
+
+        adj = self.host_graph_manager.core.adj
+        live = [host_node for host_node in touched if host_node in adj]
+        new_tokens = {}
+        for node in self.nodes:
+            parent = node.parent
+            added = set()
+            # Extensions of the partial matches of the parent that use a touched node
+            if parent is not None:
+                for token in new_tokens[parent]:
+                    added.update(self._extend(node, token, self._candidates(node, token)))
+
+            # Extensions of any partial match of the parent by a touched node
+            fixed = node.step[0]
+            parent_tokens = [()] if parent is None else parent.tokens
+            if fixed is not None:
+                if fixed in live:
+                    for token in parent_tokens:
+                        added.update(self._extend(node, token, (fixed,)))
+            elif node.anchor is not None:
+                anchor = node.anchor
+                for host_node in live:
+                    for neighbor in adj[host_node]:
+                        for token in parent.by_node.get(neighbor, ()):
+                            if token[anchor] == neighbor:
+                                added.update(self._extend(node, token, (host_node,)))
+            else:
+                for token in parent_tokens:
+                    added.update(self._extend(node, token, live))
+
+            new_tokens[node] = {token for token in added if node.add(token)}
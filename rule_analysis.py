@@ -0,0 +1,249 @@
+from collections import namedtuple
+import sys
+
+import networkx as nx
+
+from rule_plan import compile_rule
+
+# Marker for an endpoint of an added edge that is a node added by the same step
+NEW_NODE = object()
+
+def _may_be_generated(node_id, prefix='n'):
+    """Check whether a node ID has the form of the IDs made by `GraphManager.new_node_id`."""
+    return isinstance(node_id, str) and node_id.startswith(prefix) and node_id[len(prefix):].isdigit()
+
+class RuleEffects(namedtuple('RuleEffects', [
+    'lhs_nodes',
+    'lhs_edges',
+    'lhs_nonedges',
+    'added_edges',
+    'removed_edges',
+    'removed_nodes',
+    'adds_nodes',
+    'generated_lhs_nodes',
+])):
+    """What a rule needs and what one application of it changes, in terms of LHS node IDs.
+
+    Attributes
+    ----------
+    lhs_nodes : frozenset
+        The L nodes.
+    lhs_edges : frozenset
+        The L edges, as frozensets of their endpoints.
+    lhs_nonedges : bool
+        Whether two distinct L nodes are not adjacent, so adding an edge
+        between their images can invalidate a match.
+    added_edges : tuple
+        The R - K edges, as pairs of L node IDs or `NEW_NODE`.
+    removed_edges : tuple
+        The L - K edges, as frozensets of their endpoints.
+    removed_nodes : frozenset
+        The L - K nodes.
+    adds_nodes : bool
+        Whether the rule adds nodes.
+    generated_lhs_nodes : frozenset
+        The L nodes whose ID could be given to an added node.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_plan(cls, plan):
+        L = plan.lhs_graph
+        n = len(L)
+        nodes_to_add = set(plan.nodes_to_add)
+        return cls(
+            lhs_nodes=frozenset(L.nodes()),
+            lhs_edges=frozenset(frozenset(edge) for edge in L.edges()),
+            lhs_nonedges=sum(1 for s, t in L.edges() if s != t) < n * (n - 1) // 2,
+            added_edges=tuple(
+                tuple(NEW_NODE if node in nodes_to_add else node for node in edge)
+                for edge in plan.edges_to_add
+            ),
+            removed_edges=tuple(frozenset(edge) for edge in plan.edges_to_remove),
+            removed_nodes=frozenset(plan.nodes_to_remove),
+            adds_nodes=bool(nodes_to_add),
+            generated_lhs_nodes=frozenset(node for node in L.nodes() if _may_be_generated(node)),
+        )
+
+def _identity_relations(a, b):
+    """
+    Relate an application of rule `a` to rule `b` when LHS nodes are matched to host nodes with the same ID.
+
+    Returns
+    -------
+    tuple
+        Whether `a` can create a match of `b`, invalidate a match of `b`, and
+        remove an edge that made `b` violate the gluing condition.
+    """
+    creates = invalidates = unblocks = False
+
+    def in_lhs(node):
+        return a.adds_nodes and bool(b.generated_lhs_nodes) if node is NEW_NODE else node in b.lhs_nodes
+
+    for source, target in a.added_edges:
+        if not (in_lhs(source) and in_lhs(target)):
+            continue
+        if source is NEW_NODE or target is NEW_NODE:
+            # The match of b could only use the added node once it exists
+            creates = True
+        elif frozenset((source, target)) in b.lhs_edges:
+            creates = True
+        else:
+            invalidates = True
+    if a.adds_nodes and b.generated_lhs_nodes:
+        creates = True
+
+    for edge in a.removed_edges:
+        if edge <= b.lhs_nodes:
+            if edge in b.lhs_edges:
+                invalidates = True
+            else:
+                creates = True
+        if not edge.isdisjoint(b.removed_nodes) and edge not in b.lhs_edges:
+            unblocks = True
+
+    if not a.removed_nodes.isdisjoint(b.lhs_nodes):
+        invalidates = True
+    return creates, invalidates, unblocks
+
+def _structural_relations(a, b):
+    """
+    Relate an application of rule `a` to rule `b` when LHS nodes can be matched to any host nodes.
+
+    Only the kinds of changes are compared, as every host element may be
+    matched by an element of the same kind.
+    """
+    if not b.lhs_nodes:
+        return False, False, False
+    creates = bool(
+        a.adds_nodes
+        or (a.added_edges and b.lhs_edges)
+        or (a.removed_edges and b.lhs_nonedges)
+    )
+    invalidates = bool(
+        a.removed_nodes
+        or (a.removed_edges and b.lhs_edges)
+        or (a.added_edges and b.lhs_nonedges)
+    )
+    unblocks = bool(a.removed_edges and b.removed_nodes)
+    return creates, invalidates, unblocks
+
+class TriggerGraph:
+    """Which rules an application of each rule can affect.
+
+    For rules ``a`` and ``b``, an application of ``a`` can:
+
+    - create a match of ``b``, by adding an element or removing an edge
+      between nodes that ``b`` needs to be non-adjacent;
+    - invalidate a match of ``b``, by removing an element it uses or adding an
+      edge between nodes it needs to be non-adjacent;
+    - unblock ``b``, by removing an edge that would have been left dangling by
+      an application of ``b``.
+
+    The relations are conservative: a rule that is not related to another can
+    never change the matches or the applicability of the other, so its match
+    index does not need to be updated and it does not need to be tried again.
+
+    Rules are referred to by their position in the list given to
+    `analyze_rules`.
+    """
+
+    def __init__(self, rule_ids, creates, invalidates, unblocks):
+        self.rule_ids = rule_ids
+        self.creates = creates
+        self.invalidates = invalidates
+        self.unblocks = unblocks
+
+    def __len__(self):
+        return len(self.rule_ids)
+
+    def affected_by(self, position):
+        """The rules whose matches an application of a rule can change."""
+        return self.creates[position] | self.invalidates[position]
+
+    def enabled_by(self, position):
+        """The rules that can become applicable after an application of a rule."""
+        return self.creates[position] | self.unblocks[position]
+
+    def to_networkx(self):
+        """
+        Build the trigger graph as a directed graph.
+
+        Returns
+        -------
+        networkx.DiGraph
+            A node per rule ID and an edge from each rule to every rule it can
+            create a match of, invalidate or unblock, with boolean ``creates``,
+            ``invalidates`` and ``unblocks`` attributes.
+        """
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.rule_ids)
+        for position, rule_id in enumerate(self.rule_ids):
+            for other in self.affected_by(position) | self.unblocks[position]:
+                graph.add_edge(
+                    rule_id,
+                    self.rule_ids[other],
+                    creates=other in self.creates[position],
+                    invalidates=other in self.invalidates[position],
+                    unblocks=other in self.unblocks[position],
+                )
+        return graph
+
+def analyze_rules(rules, persist_node_id=True):
+    """
+    Compute the trigger graph of a set of rules, critical-pair style.
+
+    Parameters
+    ----------
+    rules : list
+        The rules, as rule data dicts, RuleManagers or RulePlans.
+    persist_node_id : bool, optional
+        Whether LHS nodes are only matched to host nodes with the same ID, as
+        done by `apply_rule_parallel`. The relations are much sparser then,
+        since rules only interact through the node IDs they share.
+
+    Returns
+    -------
+    TriggerGraph
+        The relations between the rules.
+    """
+    rule_ids = []
+    effects = []
+    for rule in rules:
+        plan = compile_rule(rule) if isinstance(rule, dict) else rule.compile()
+        rule_ids.append(rule.get('id', plan.content_hash) if isinstance(rule, dict) else getattr(rule, 'id', plan.content_hash))
+        effects.append(RuleEffects.from_plan(plan))
+
+    relate = _identity_relations if persist_node_id else _structural_relations
+    creates, invalidates, unblocks = [], [], []
+    for a in effects:
+        created, invalidated, unblocked = set(), set(), set()
+        for position, b in enumerate(effects):
+            c, i, u = relate(a, b)
+            if c:
+                created.add(position)
+            if i:
+                invalidated.add(position)
+            if u:
+                unblocked.add(position)
+        creates.append(frozenset(created))
+        invalidates.append(frozenset(invalidated))
+        unblocks.append(frozenset(unblocked))
+    return TriggerGraph(rule_ids, creates, invalidates, unblocks)
+
+def main(argv=None):
+    """Print the trigger graph of the rules saved in a store or a directory."""
+    from store import DEFAULT_STORE_PATH
+    from utils.file_operations import load_rules
+
+    argv = sys.argv[1:] if argv is None else argv
+    rules = load_rules(argv[0] if argv else DEFAULT_STORE_PATH)
+    for persist_node_id in (True, False):
+        graph = analyze_rules(rules, persist_node_id).to_networkx()
+        print(f"Matching {'by node ID' if persist_node_id else 'by structure'}: "
+              f"{graph.number_of_edges()} dependencies between {graph.number_of_nodes()} rules")
+        for source, target, kinds in graph.edges(data=True):
+            print(f"  {source} -> {target}: {', '.join(kind for kind, value in kinds.items() if value)}")
+
+if __name__ == '__main__':
+    main()
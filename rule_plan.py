@@ -0,0 +1,306 @@
+from collections import namedtuple
+from functools import lru_cache
+import hashlib
+import json
+
+import networkx as nx
+
+from dpo import compile_pattern
+from graph_core import GraphInvariants
+
+def element_attributes(element):
+    """
+    Get the values of the data of an element that type it.
+
+    The ID and the endpoints are left out, and so is a label equal to the ID,
+    which is the default one given by `GraphManager.add_node`. The image of
+    a typed LHS element has to have the same values.
+
+    Parameters
+    ----------
+    element : dict
+        A Cytoscape node or edge element.
+
+    Returns
+    -------
+    dict
+        The required values by data key, empty for an untyped element.
+    """
+    data = element['data']
+    return {
+        key: value for key, value in data.items()
+        if key not in ('id', 'source', 'target') and not (key == 'label' and value == data['id'])
+    }
+
+def _graph_content(elements, typed=False):
+    """Extract the sorted node IDs and edges from Cytoscape elements, and with `typed` their attributes."""
+    nodes = sorted(e['data']['id'] for e in elements if 'source' not in e['data'])
+    edges = sorted([e['data']['source'], e['data']['target']] for e in elements if 'source' in e['data'])
+    content = {'nodes': nodes, 'edges': edges}
+    if typed:
+        # Only typed elements are listed, so untyped rules keep the content they always had
+        node_attributes = {}
+        edge_attributes = []
+        for element in elements:
+            attributes = element_attributes(element)
+            if not attributes:
+                continue
+            data = element['data']
+            if 'source' in data:
+                edge_attributes.append([data['source'], data['target'], attributes])
+            else:
+                node_attributes[data['id']] = attributes
+        if node_attributes:
+            content['node_attributes'] = node_attributes
+        if edge_attributes:
+            content['edge_attributes'] = sorted(edge_attributes, key=lambda edge: edge[:2])
+    return content
+
+def rule_content(rule_data):
+    """
+    Serialize the structure of a rule in a canonical form.
+
+    The rule ID, index and element classes are left out, so rules that only
+    differ in those share the same content. The data of the LHS elements is
+    kept where it types them, see `element_attributes`, and so is the data of
+    the RHS elements, which is given to the nodes a rule creates.
+
+    Parameters
+    ----------
+    rule_data : dict
+        The rule data, as produced by `RuleManager.to_dict`.
+
+    Returns
+    -------
+    str
+        A JSON string of the sorted L, K and R nodes and edges, and of the
+        attributes of the typed LHS and RHS elements.
+    """
+    k_data = rule_data.get('k') or {'nodes': [], 'edges': []}
+    return json.dumps({
+        'lhs': _graph_content(rule_data.get('lhs', []), typed=True),
+        'rhs': _graph_content(rule_data.get('rhs', []), typed=True),
+        'k': {
+            'nodes': sorted(k_data.get('nodes', [])),
+            'edges': sorted(edge.split('-') for edge in k_data.get('edges', [])),
+        },
+    }, sort_keys=True)
+
+def _build_graph(content):
+    """Build a frozen graph, skipping edges whose endpoints are not nodes as `GraphManager.add_edge` does."""
+    graph = nx.Graph()
+    graph.add_nodes_from(content['nodes'])
+    graph.add_edges_from((s, t) for s, t in content['edges'] if s in graph and t in graph)
+    return nx.freeze(graph)
+
+def symmetry_breaking(lhs_graph, k_graph, rhs_graph, order=None, node_attributes=None, edge_attributes=None,
+                      added_node_attributes=None):
+    """
+    Compute ordering constraints that pick one match per symmetry class of a rule.
+
+    A symmetry is an automorphism of L that maps K onto itself, keeps the
+    types of the LHS elements and extends to an automorphism of R mapping the
+    added nodes onto added nodes with the same data. Applying the
+    rule at a match or at the match composed with a symmetry removes the same
+    elements and adds the same ones, up to the IDs of the new nodes, so only
+    one of them needs to be found. A triangle LHS kept entirely, for example,
+    has 6 symmetries, and is matched once per host triangle instead of 6 times.
+
+    The constraints are built along the stabilizer chain of the symmetry
+    group (Grochow and Kellis, 2007): every node gets its orbit under the
+    symmetries fixing the nodes before it, and its image must be less than the
+    images of the other nodes of that orbit. Exactly one match of every class
+    satisfies them.
+
+    Parameters
+    ----------
+    lhs_graph, k_graph, rhs_graph : networkx.Graph
+        The L, K and R graphs of the rule.
+    order : sequence, optional
+        The LHS nodes in the order they are matched, so the constraints can be
+        checked as early as possible. Defaults to the order of `lhs_graph`.
+    node_attributes, edge_attributes : dict, optional
+        The attributes of the typed LHS nodes and edges, as passed to
+        `compile_pattern`.
+    added_node_attributes : dict, optional
+        The attributes of the added nodes that have data, by node.
+
+    Returns
+    -------
+    Tuple[tuple, int]
+        The pairs ``(a, b)`` of LHS nodes whose images must be ordered as
+        ``match[a] < match[b]`` by `dpo.node_order_key`, and the number of
+        symmetries acting on L, i.e. the number of matches in a class.
+    """
+    L, K, R = lhs_graph, k_graph, rhs_graph
+    # L nodes are never added, so the attributes of both kinds of nodes can be looked up together
+    node_attributes = dict(node_attributes or {}, **(added_node_attributes or {}))
+    edge_attributes = edge_attributes or {}
+    # Nodes and edges are labelled with the graphs they belong to and their
+    # types, so the automorphisms of this graph are the symmetries of the rule
+    rule_graph = nx.Graph()
+    for node in set(L) | set(K) | set(R):
+        rule_graph.add_node(node, roles=(
+            node in L, node in K, node in R, json.dumps(node_attributes.get(node), sort_keys=True)
+        ))
+    for name, graph in (('L', L), ('K', K), ('R', R)):
+        for s, t in graph.edges():
+            if rule_graph.has_edge(s, t):
+                rule_graph[s][t]['roles'] += name
+            else:
+                rule_graph.add_edge(s, t, roles=name)
+    for edge, attributes in edge_attributes.items():
+        s, t = tuple(edge) if len(edge) == 2 else tuple(edge) * 2
+        rule_graph[s][t]['roles'] += json.dumps(attributes, sort_keys=True)
+
+    def maps_to(fixed, node, image):
+        """Check whether a symmetry fixing the nodes of `fixed` maps node to image."""
+        source, target = rule_graph.copy(), rule_graph.copy()
+        for n in fixed:
+            source.nodes[n]['roles'] = target.nodes[n]['roles'] = ('fixed', n)
+        source.nodes[node]['roles'] = target.nodes[image]['roles'] = ('moved',)
+        return nx.is_isomorphic(
+            source, target,
+            node_match=lambda a, b: a['roles'] == b['roles'],
+            edge_match=lambda a, b: a['roles'] == b['roles'],
+        )
+
+    order = list(L.nodes()) if order is None else list(order)
+    constraints = []
+    symmetries = 1
+    for i, node in enumerate(order):
+        orbit = [
+            other for other in order[i + 1:]
+            if rule_graph.nodes[other]['roles'] == rule_graph.nodes[node]['roles']
+            and maps_to(order[:i], node, other)
+        ]
+        constraints.extend((node, other) for other in orbit)
+        symmetries *= len(orbit) + 1
+    return tuple(constraints), symmetries
+
+class RulePlan(namedtuple('RulePlan', [
+    'content_hash',
+    'lhs_graph',
+    'k_graph',
+    'rhs_graph',
+    'nodes_to_remove',
+    'edges_to_remove',
+    'nodes_to_add',
+    'edges_to_add',
+    'gluing_checks',
+    'pattern',
+    'lhs_invariants',
+    'symmetries',
+    'node_attributes',
+    'edge_attributes',
+    'added_node_attributes',
+])):
+    """Immutable, precomputed form of a rule for applying it repeatedly.
+
+    Attributes
+    ----------
+    content_hash : str
+        SHA-1 of the `rule_content` of the rule.
+    lhs_graph, k_graph, rhs_graph : networkx.Graph
+        Frozen L, K and R graphs.
+    nodes_to_remove, edges_to_remove : tuple
+        The L nodes and edges that are not in K.
+    nodes_to_add, edges_to_add : tuple
+        The R nodes and edges that are not in K.
+    gluing_checks : tuple
+        Pairs of a node to remove and its L neighbours, checked for dangling edges.
+    pattern : MatchPattern
+        The search order, degree and attribute constraints for matching L,
+        with the `symmetry_breaking` constraints of the rule.
+    lhs_invariants : GraphInvariants
+        The invariants of L, checked against those of a host graph before
+        searching it.
+    symmetries : int
+        The number of matches with the same effect that only one of is found
+        when matching by structure.
+    node_attributes : dict
+        The `element_attributes` of the typed L nodes, by node.
+    edge_attributes : dict
+        The `element_attributes` of the typed L edges, by frozenset of their
+        endpoints.
+    added_node_attributes : dict
+        The `element_attributes` of the added R nodes that have data, by node,
+        given to the nodes created for them.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_content(cls, content):
+        """
+        Compile a rule from its canonical content.
+
+        Parameters
+        ----------
+        content : str
+            The rule content, as produced by `rule_content`.
+
+        Returns
+        -------
+        RulePlan
+            The compiled rule.
+        """
+        data = json.loads(content)
+        L = _build_graph(data['lhs'])
+        R = _build_graph(data['rhs'])
+        K = nx.Graph()
+        K.add_nodes_from(data['k']['nodes'])
+        K.add_edges_from((s, t) for s, t in data['k']['edges'] if s in K and t in K)
+        K = nx.freeze(K)
+
+        node_attributes = {n: a for n, a in data['lhs'].get('node_attributes', {}).items() if n in L}
+        edge_attributes = {
+            frozenset((s, t)): a for s, t, a in data['lhs'].get('edge_attributes', []) if L.has_edge(s, t)
+        }
+        nodes_to_add = tuple(n for n in R.nodes() if n not in K)
+        added_node_attributes = {n: a for n, a in data['rhs'].get('node_attributes', {}).items() if n in nodes_to_add}
+        order = compile_pattern(L, node_attributes=node_attributes).order
+        symmetry, symmetries = symmetry_breaking(L, K, R, order, node_attributes, edge_attributes,
+                                                 added_node_attributes)
+
+        nodes_to_remove = tuple(n for n in L.nodes() if n not in K)
+        return cls(
+            content_hash=hashlib.sha1(content.encode()).hexdigest(),
+            lhs_graph=L,
+            k_graph=K,
+            rhs_graph=R,
+            nodes_to_remove=nodes_to_remove,
+            edges_to_remove=tuple((s, t) for s, t in L.edges() if not K.has_edge(s, t)),
+            nodes_to_add=nodes_to_add,
+            edges_to_add=tuple((s, t) for s, t in R.edges() if not K.has_edge(s, t)),
+            gluing_checks=tuple((n, tuple(L.neighbors(n))) for n in nodes_to_remove),
+            pattern=compile_pattern(L, symmetry, node_attributes, edge_attributes),
+            lhs_invariants=GraphInvariants.from_graph(L),
+            symmetries=symmetries,
+            node_attributes=node_attributes,
+            edge_attributes=edge_attributes,
+            added_node_attributes=added_node_attributes,
+        )
+
+    def compile(self):
+        """Return the plan itself, so plans can be passed where rules are expected."""
+        return self
+
+@lru_cache(maxsize=1024)
+def _compile_content(content):
+    return RulePlan.from_content(content)
+
+def compile_rule(rule_data):
+    """
+    Get the compiled plan of a rule, reusing the plans of rules with the same content.
+
+    Parameters
+    ----------
+    rule_data : dict
+        The rule data, as produced by `RuleManager.to_dict`.
+
+    Returns
+    -------
+    RulePlan
+        The compiled rule.
+    """
+    return _compile_content(rule_content(rule_data))
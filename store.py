@@ -0,0 +1,423 @@
+from contextlib import contextmanager
+from datetime import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+from rule_plan import rule_content
+
+# Database the app keeps its saved rules and graphs in
+DEFAULT_STORE_PATH = 'dpo_store.sqlite3'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rules (
+    id TEXT PRIMARY KEY,
+    rule_index INTEGER NOT NULL UNIQUE,
+    name TEXT,
+    content_hash TEXT NOT NULL,
+    saved_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rules_by_name ON rules (name);
+
+CREATE TABLE IF NOT EXISTS graphs (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    created_at TEXT NOT NULL,
+    latest_version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS graphs_by_name ON graphs (name);
+
+CREATE TABLE IF NOT EXISTS graph_versions (
+    graph_id TEXT NOT NULL REFERENCES graphs (id) ON DELETE CASCADE,
+    version INTEGER NOT NULL,
+    label TEXT,
+    saved_at TEXT NOT NULL,
+    node_count INTEGER NOT NULL,
+    edge_count INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (graph_id, version)
+);
+
+CREATE TABLE IF NOT EXISTS imports (
+    source TEXT PRIMARY KEY,
+    imported_at TEXT NOT NULL
+);
+"""
+
+def _rule_summary(row):
+    rule_id, index, name, content_hash, saved_at = row
+    return {'id': rule_id, 'index': index, 'name': name, 'content_hash': content_hash, 'saved_at': saved_at}
+
+def _graph_summary(row):
+    graph_id, name, created_at, version, label, saved_at, node_count, edge_count = row
+    return {
+        'id': graph_id,
+        'name': name,
+        'created_at': created_at,
+        'version': version,
+        'label': label,
+        'saved_at': saved_at,
+        'node_count': node_count,
+        'edge_count': edge_count,
+    }
+
+_RULE_SUMMARY_COLUMNS = 'id, rule_index, name, content_hash, saved_at'
+_GRAPH_SUMMARY_QUERY = """
+    SELECT g.id, g.name, g.created_at, v.version, v.label, v.saved_at, v.node_count, v.edge_count
+    FROM graphs g JOIN graph_versions v ON v.graph_id = g.id AND v.version = g.latest_version
+"""
+
+class Store:
+    """Saved rules, graphs and graph versions in an embedded SQLite database.
+
+    Rules are looked up by ID, index or name through indexes of the database
+    instead of reading rule files. Every change is made in a transaction that
+    takes the write lock of the database at once, so app workers or batch
+    processes sharing the database never allocate the same rule index or
+    graph version. The database is in WAL mode, so readers are not blocked
+    by a writer.
+
+    Each thread uses its own connection to the database file. Used as a
+    context manager, the store closes the connection of the calling thread
+    on exit.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        """
+        Parameters
+        ----------
+        path : str, optional
+            Path to the database file, created if it does not exist.
+        """
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Transactions are opened explicitly by `_transaction`
+            connection = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA foreign_keys=ON')
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        """Close the connection of the calling thread."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @contextmanager
+    def _transaction(self):
+        """Run statements in a transaction holding the write lock from the start."""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    # Rules
+
+    def _put_rule(self, connection, rule_data, index):
+        rule_data['index'] = index
+        connection.execute(
+            'INSERT OR REPLACE INTO rules (id, rule_index, name, content_hash, saved_at, data) VALUES (?, ?, ?, ?, ?, ?)',
+            (
+                rule_data['id'],
+                index,
+                rule_data.get('name'),
+                # Same as the content_hash of the compiled rule
+                hashlib.sha1(rule_content(rule_data).encode()).hexdigest(),
+                datetime.now().isoformat(),
+                json.dumps(rule_data),
+            ),
+        )
+
+    def _next_rule_index(self, connection):
+        return connection.execute('SELECT COALESCE(MAX(rule_index), 0) + 1 FROM rules').fetchone()[0]
+
+    def save_rule(self, rule_data):
+        """
+        Save a rule.
+
+        The rule gets the index following the highest one, unless a rule with
+        the same ID is saved already; it then replaces that rule and keeps its
+        index. The index is also set in `rule_data`.
+
+        Parameters
+        ----------
+        rule_data : dict
+            The rule data.
+
+        Returns
+        -------
+        int
+            The index of the rule.
+        """
+        with self._transaction() as connection:
+            row = connection.execute('SELECT rule_index FROM rules WHERE id = ?', (rule_data['id'],)).fetchone()
+            index = row[0] if row is not None else self._next_rule_index(connection)
+            self._put_rule(connection, rule_data, index)
+        return index
+
+    def import_rules(self, rules, source=None):
+        """
+        Add rules, e.g. the rule files of a directory, keeping their IDs and indexes where possible.
+
+        Rules whose ID is saved already are skipped, and a rule whose index is
+        taken gets a new one.
+
+        Parameters
+        ----------
+        rules : iterable
+            The rule data dicts; they are not modified.
+        source : str, optional
+            A name of where the rules come from. Rules from the same source
+            are only imported once, even by several processes.
+
+        Returns
+        -------
+        int
+            The number of rules added.
+        """
+        count = 0
+        with self._transaction() as connection:
+            if source is not None:
+                if connection.execute('SELECT 1 FROM imports WHERE source = ?', (source,)).fetchone():
+                    return 0
+                connection.execute('INSERT INTO imports (source, imported_at) VALUES (?, ?)',
+                                   (source, datetime.now().isoformat()))
+            for rule_data in sorted(rules, key=lambda rule: rule.get('index') or 0):
+                if connection.execute('SELECT 1 FROM rules WHERE id = ?', (rule_data['id'],)).fetchone():
+                    continue
+                index = rule_data.get('index')
+                if not isinstance(index, int) or connection.execute(
+                        'SELECT 1 FROM rules WHERE rule_index = ?', (index,)).fetchone():
+                    index = self._next_rule_index(connection)
+                self._put_rule(connection, dict(rule_data), index)
+                count += 1
+        return count
+
+    def get_rule(self, rule_id):
+        """
+        Get a rule by its ID.
+
+        Returns
+        -------
+        dict or None
+            A new copy of the rule data, or None if there is no such rule.
+        """
+        row = self._connection().execute('SELECT data FROM rules WHERE id = ?', (rule_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def get_rule_by_index(self, index):
+        """Get a rule by its index, as `get_rule`."""
+        row = self._connection().execute('SELECT data FROM rules WHERE rule_index = ?', (index,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def find_rules(self, name):
+        """Get the rules with a name, ordered by index."""
+        rows = self._connection().execute(
+            'SELECT data FROM rules WHERE name = ? ORDER BY rule_index', (name,)).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def list_rules(self, offset=0, limit=None):
+        """
+        List rules ordered by index, without loading their data.
+
+        Parameters
+        ----------
+        offset : int, optional
+            The number of rules to skip.
+        limit : int, optional
+            The maximum number of rules to list; all by default.
+
+        Returns
+        -------
+        list
+            Dicts with the ``id``, ``index``, ``name``, ``content_hash`` and
+            ``saved_at`` of each rule.
+        """
+        rows = self._connection().execute(
+            f'SELECT {_RULE_SUMMARY_COLUMNS} FROM rules ORDER BY rule_index LIMIT ? OFFSET ?',
+            (-1 if limit is None else limit, offset)).fetchall()
+        return [_rule_summary(row) for row in rows]
+
+    def count_rules(self):
+        return self._connection().execute('SELECT COUNT(*) FROM rules').fetchone()[0]
+
+    def load_rules(self):
+        """Get all rules ordered by index, as `load_rules_from_directory` does for a directory."""
+        rows = self._connection().execute('SELECT data FROM rules ORDER BY rule_index').fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def delete_rule(self, rule_id):
+        """
+        Delete a rule.
+
+        Returns
+        -------
+        bool
+            False if there is no such rule.
+        """
+        with self._transaction() as connection:
+            return connection.execute('DELETE FROM rules WHERE id = ?', (rule_id,)).rowcount > 0
+
+    # Graphs
+
+    def save_graph(self, graph_data, graph_id=None, name=None, label=None):
+        """
+        Save a graph as a new version.
+
+        Parameters
+        ----------
+        graph_data : dict
+            The graph data, with the Cytoscape elements under ``elements``
+            as written by `save_graph_to_file`.
+        graph_id : str, optional
+            The ID of a saved graph the data is a new version of. A new graph
+            is created if it is not given or not saved.
+        name : str, optional
+            The name of the graph, replacing its previous name if given.
+        label : str, optional
+            Description of the version.
+
+        Returns
+        -------
+        Tuple[str, int]
+            The ID of the graph and the number of the version, starting at 1.
+        """
+        elements = graph_data.get('elements', [])
+        edge_count = sum(1 for element in elements if 'source' in element['data'])
+        now = datetime.now().isoformat()
+        with self._transaction() as connection:
+            row = None
+            if graph_id is not None:
+                row = connection.execute('SELECT latest_version FROM graphs WHERE id = ?', (graph_id,)).fetchone()
+            if row is None:
+                graph_id = graph_id or str(uuid.uuid4())
+                version = 1
+                connection.execute('INSERT INTO graphs (id, name, created_at, latest_version) VALUES (?, ?, ?, ?)',
+                                   (graph_id, name, now, version))
+            else:
+                version = row[0] + 1
+                connection.execute('UPDATE graphs SET latest_version = ?, name = COALESCE(?, name) WHERE id = ?',
+                                   (version, name, graph_id))
+            connection.execute(
+                'INSERT INTO graph_versions (graph_id, version, label, saved_at, node_count, edge_count, data) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (graph_id, version, label, now, len(elements) - edge_count, edge_count, json.dumps(graph_data)),
+            )
+        return graph_id, version
+
+    def get_graph(self, graph_id, version=None):
+        """
+        Get the data of a saved graph.
+
+        Parameters
+        ----------
+        graph_id : str
+            The ID of the graph.
+        version : int, optional
+            The version; the latest one by default.
+
+        Returns
+        -------
+        dict or None
+            The graph data, or None if there is no such graph or version.
+        """
+        connection = self._connection()
+        if version is None:
+            row = connection.execute(
+                'SELECT v.data FROM graphs g JOIN graph_versions v ON v.graph_id = g.id AND v.version = g.latest_version '
+                'WHERE g.id = ?', (graph_id,)).fetchone()
+        else:
+            row = connection.execute('SELECT data FROM graph_versions WHERE graph_id = ? AND version = ?',
+                                     (graph_id, version)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def find_graphs(self, name):
+        """List the graphs with a name, as `list_graphs`."""
+        rows = self._connection().execute(
+            _GRAPH_SUMMARY_QUERY + ' WHERE g.name = ? ORDER BY g.created_at', (name,)).fetchall()
+        return [_graph_summary(row) for row in rows]
+
+    def list_graphs(self, offset=0, limit=None):
+        """
+        List graphs ordered by creation, without loading their data.
+
+        Parameters
+        ----------
+        offset : int, optional
+            The number of graphs to skip.
+        limit : int, optional
+            The maximum number of graphs to list; all by default.
+
+        Returns
+        -------
+        list
+            Dicts with the ``id``, ``name`` and ``created_at`` of each graph,
+            and the ``version``, ``label``, ``saved_at``, ``node_count`` and
+            ``edge_count`` of its latest version.
+        """
+        rows = self._connection().execute(
+            _GRAPH_SUMMARY_QUERY + ' ORDER BY g.created_at LIMIT ? OFFSET ?',
+            (-1 if limit is None else limit, offset)).fetchall()
+        return [_graph_summary(row) for row in rows]
+
+    def count_graphs(self):
+        return self._connection().execute('SELECT COUNT(*) FROM graphs').fetchone()[0]
+
+    def list_versions(self, graph_id):
+        """
+        List the versions of a graph, oldest first.
+
+        Returns
+        -------
+        list
+            Dicts with the ``version``, ``label``, ``saved_at``,
+            ``node_count`` and ``edge_count`` of each version.
+        """
+        rows = self._connection().execute(
+            'SELECT version, label, saved_at, node_count, edge_count FROM graph_versions '
+            'WHERE graph_id = ? ORDER BY version', (graph_id,)).fetchall()
+        return [
+            {'version': version, 'label': label, 'saved_at': saved_at, 'node_count': node_count, 'edge_count': edge_count}
+            for version, label, saved_at, node_count, edge_count in rows
+        ]
+
+    def delete_graph(self, graph_id):
+        """
+        Delete a graph and all its versions.
+
+        Returns
+        -------
+        bool
+            False if there is no such graph.
+        """
+        with self._transaction() as connection:
+            return connection.execute('DELETE FROM graphs WHERE id = ?', (graph_id,)).rowcount > 0
+
+def is_store(path):
+    """Check whether a path is an SQLite database rather than, e.g., a rule directory."""
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(16) == b'SQLite format 3\0'
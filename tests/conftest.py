@@ -0,0 +1,47 @@
+import os
+import sys
+
+# The modules of the app are imported as top-level modules, as main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes import GraphManager
+
+# Element and rule builders shared by the tests, imported with ``from conftest import ...``
+
+def node(node_id, **data):
+    return {'data': dict(data, id=node_id)}
+
+def edge(source, target, edge_id=None, **data):
+    return {'data': dict(data, id=edge_id or f'{source}-{target}', source=source, target=target)}
+
+def rule(rule_id, lhs, k_nodes, k_edges, rhs):
+    return {'id': rule_id, 'lhs': lhs, 'k': {'nodes': list(k_nodes), 'edges': list(k_edges)}, 'rhs': rhs}
+
+PATH = [node('a'), node('b'), node('c'), edge('a', 'b'), edge('b', 'c')]
+TRIANGLE = PATH + [edge('a', 'c')]
+
+# Remove an edge
+CUT = rule('cut', [node('a'), node('b'), edge('a', 'b')], 'ab', [], [node('a'), node('b')])
+# Hang a new node on a node
+GROW = rule('grow', [node('a')], 'a', [], [node('a'), node('x'), edge('a', 'x')])
+# Remove a node
+DROP = rule('drop', [node('a')], [], [], [])
+# Close an induced path into a triangle
+CLOSE = rule('close', PATH, 'abc', ['a-b', 'b-c'], TRIANGLE)
+
+def random_graph(rng, size=10, edge_probability=0.3):
+    """A graph on the nodes "0" to "size - 1" with random edges, from a `random.Random`."""
+    elements = [node(str(i)) for i in range(size)]
+    elements.extend(edge(str(i), str(j)) for i in range(size) for j in range(i + 1, size)
+                    if rng.random() < edge_probability)
+    return GraphManager.from_elements(elements)
+
+def structure(graph_manager, edge_ids=False):
+    """The node IDs and the undirected edges of a graph, with their IDs if `edge_ids`."""
+    core = graph_manager.core
+    edges = {(frozenset((record.source, record.target)), record.edge_id if edge_ids else None)
+             for record in core.edge_records()}
+    return set(core.nodes()), edges
+
+def match_keys(matches):
+    return {frozenset(match.items()) for match in matches}
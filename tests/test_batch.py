@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from batch import collect_graph_files, main, run_batch
+from classes import GraphManager
+from graph_io import load_graph_binary, load_graph_manager, save_graph_manager
+from store import Store
+
+from conftest import CUT, PATH, structure
+
+@pytest.fixture
+def graphs_dir(tmp_path):
+    graphs_dir = tmp_path / 'graphs'
+    graphs_dir.mkdir()
+    save_graph_manager(GraphManager.from_elements(PATH), str(graphs_dir / 'path.json'))
+    save_graph_manager(GraphManager.from_elements(PATH), str(graphs_dir / 'copy.gbin'))
+    (graphs_dir / 'notes.txt').write_text('not a graph')
+    return graphs_dir
+
+def cut_path():
+    """The path with edge "a-b" cut, as left by the CUT rule."""
+    graph_manager = GraphManager.from_elements(PATH)
+    graph_manager.remove_edge('a', 'b')
+    return structure(graph_manager)
+
+def test_collect_graph_files(graphs_dir, tmp_path):
+    other = str(tmp_path / 'other.edgelist')
+    assert collect_graph_files([str(graphs_dir), other]) == [
+        str(graphs_dir / 'copy.gbin'), str(graphs_dir / 'path.json'), other]
+
+@pytest.mark.parametrize('output_format', ['json', 'binary'])
+def test_run_batch_writes_the_results(graphs_dir, tmp_path, output_format):
+    output_dir = tmp_path / 'output'
+    graph_files = collect_graph_files([str(graphs_dir)])
+    totals = run_batch(graph_files, [CUT], str(output_dir), workers=1, output_format=output_format)
+    assert (totals['graphs'], totals['failed'], totals['applications']) == (2, 0, 2)
+
+    extension = '.json' if output_format == 'json' else '.gbin'
+    for name in ('path', 'copy'):
+        output_path = str(output_dir / (name + extension))
+        if output_format == 'json':
+            with open(output_path) as f:
+                stats = json.load(f)['stats']
+            result = load_graph_manager(output_path)
+        else:
+            result, metadata = load_graph_binary(output_path)
+            stats = metadata['stats']
+        assert stats['steps'] == 1
+        assert structure(result) == cut_path()
+
+def test_rules_from_a_store_or_a_directory(graphs_dir, tmp_path):
+    store_path = str(tmp_path / 'rules.sqlite3')
+    with Store(store_path) as store:
+        store.save_rule(CUT)
+    rules_dir = tmp_path / 'rules'
+    rules_dir.mkdir()
+    (rules_dir / 'cut.json').write_text(json.dumps(CUT))
+
+    for kind, source in (('store', store_path), ('directory', str(rules_dir))):
+        output_dir = tmp_path / f'output-{kind}'
+        assert main([str(graphs_dir / 'path.json'), '--rules', source, '--output-dir', str(output_dir),
+                     '--workers', '1']) == 0
+        assert structure(load_graph_manager(str(output_dir / 'path.json'))) == cut_path()
+
+    # Graphs that cannot be read are reported as failed
+    (graphs_dir / 'broken.json').write_text('{')
+    assert main([str(graphs_dir), '--rules', store_path, '--output-dir', str(tmp_path / 'output'),
+                 '--workers', '1']) == 1
+    with pytest.raises(SystemExit):
+        main([str(graphs_dir), '--rules', str(tmp_path / 'missing')])
@@ -0,0 +1,135 @@
+import random
+
+import pytest
+
+import dpo
+from classes import GraphManager
+from dpo import apply_dpo_rule, are_matches_independent, iter_matches, schedule_independent_matches
+from rule_plan import compile_rule
+
+from conftest import CLOSE, CUT, GROW, edge, match_keys, node, random_graph, rule
+
+# Join the end of an edge to a node that is adjacent to neither of its ends
+ATTACH = rule('attach', [node('a'), node('b'), node('c'), edge('a', 'b')], 'abc', ['a-b'],
+              [node('a'), node('b'), node('c'), edge('a', 'b'), edge('b', 'c')])
+
+def test_added_edges_conflict_with_matches_needing_their_ends_non_adjacent():
+    graph_manager = GraphManager.from_elements([node('1'), node('2'), node('3'), edge('1', '2')])
+    plan = compile_rule(ATTACH)
+    matches = list(iter_matches(graph_manager.core, plan.lhs_graph, persist_node_id=False, pattern=plan.pattern))
+    # Joining 2 to 3 leaves no match joining 1 to 3, which needs 2 and 3 non-adjacent, and the other way round
+    assert match_keys(matches) == match_keys([{'a': '1', 'b': '2', 'c': '3'}, {'a': '2', 'b': '1', 'c': '3'}])
+    assert not are_matches_independent(graph_manager.core, *matches, plan=plan)
+    assert len(schedule_independent_matches(plan, matches)) == 1
+    assert len(schedule_independent_matches(plan, matches, limit=2)) == 1
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('rule_data', [ATTACH, CLOSE, CUT, GROW], ids=['attach', 'close', 'cut', 'grow'])
+@pytest.mark.parametrize('limit', [None, 5])
+def test_scheduled_matches_can_be_applied_one_after_the_other(seed, rule_data, limit):
+    graph_manager = random_graph(random.Random(seed), size=8, edge_probability=0.4)
+    plan = compile_rule(rule_data)
+    matches = list(iter_matches(graph_manager.core, plan.lhs_graph, persist_node_id=False, pattern=plan.pattern))
+    selected = schedule_independent_matches(plan, matches, limit)
+    assert selected or not matches
+    for match in selected:
+        # Each match is still a match after the ones before it were applied
+        assert frozenset(match.items()) in match_keys(
+            iter_matches(graph_manager.core, plan.lhs_graph, persist_node_id=False))
+        assert apply_dpo_rule(graph_manager, plan, match)
+
+@pytest.fixture
+def searched(monkeypatch):
+    """The number of matches the backtracking search produced, to check that enumerations stop early."""
+    counts = []
+    search = dpo._search
+
+    def counting_search(*args, **kwargs):
+        counts.append(0)
+        for match in search(*args, **kwargs):
+            counts[-1] += 1
+            yield match
+
+    monkeypatch.setattr(dpo, '_search', counting_search)
+    return counts
+
+def test_limit_and_first_only_stop_the_search_early(searched):
+    graph_manager = random_graph(random.Random(0), size=12, edge_probability=0.5)
+    plan = compile_rule(CLOSE)
+    everything = list(iter_matches(graph_manager.core, plan.lhs_graph))
+    assert len(everything) > 10 and searched == [len(everything)]
+    assert len(list(iter_matches(graph_manager.core, plan.lhs_graph, limit=3))) == 3
+    assert list(iter_matches(graph_manager.core, plan.lhs_graph, first_only=True)) == everything[:1]
+    assert list(iter_matches(graph_manager.core, plan.lhs_graph, limit=5, first_only=True)) == everything[:1]
+    assert list(iter_matches(graph_manager.core, plan.lhs_graph, limit=0)) == []
+    assert searched == [len(everything), 3, 1, 1]
+
+def test_deterministic_order_does_not_depend_on_insertion_order():
+    elements = random_graph(random.Random(1), size=10, edge_probability=0.4).elements
+    plan = compile_rule(CLOSE)
+    orders = []
+    for seed in range(4):
+        shuffled = list(elements)
+        random.Random(seed).shuffle(shuffled)
+        # Edges are given both ways round too
+        shuffled = [edge(e['data']['target'], e['data']['source']) if 'source' in e['data'] and seed % 2 else e
+                    for e in shuffled]
+        core = GraphManager.from_elements(shuffled).core
+        orders.append(list(iter_matches(core, plan.lhs_graph, deterministic=True, pattern=plan.pattern)))
+    assert orders[0] and all(order == orders[0] for order in orders)
+
+def test_timeout_stops_the_search():
+    graph_manager = random_graph(random.Random(2), size=60, edge_probability=0.3)
+    plan = compile_rule(CLOSE)
+    everything = list(iter_matches(graph_manager.core, plan.lhs_graph))
+    assert len(list(iter_matches(graph_manager.core, plan.lhs_graph, timeout=0.0))) < len(everything)
+    assert len(list(iter_matches(graph_manager.core, plan.lhs_graph, timeout=60.0))) == len(everything)
+
+def test_fallback_searches_when_the_rule_does_not_occur_under_its_ids(searched):
+    graph_manager = GraphManager.from_elements([node('1'), node('2'), node('3'), edge('1', '2'), edge('2', '3')])
+    plan = compile_rule(CLOSE)
+    assert list(iter_matches(graph_manager.core, plan.lhs_graph, persist_node_id=True, pattern=plan.pattern)) == []
+    fallback = list(iter_matches(graph_manager.core, plan.lhs_graph, persist_node_id=True, fallback=True,
+                                 pattern=plan.pattern))
+    assert searched == [1]
+    assert len(fallback) == 1 and fallback[0]['b'] == '2'
+    assert match_keys(fallback) <= match_keys(iter_matches(graph_manager.core, plan.lhs_graph))
+    # The identity match is used when it exists, without a search
+    graph_manager.add_node('a')
+    graph_manager.add_node('b')
+    graph_manager.add_node('c')
+    graph_manager.add_edge('a', 'b')
+    graph_manager.add_edge('b', 'c')
+    assert list(iter_matches(graph_manager.core, plan.lhs_graph, persist_node_id=True, fallback=True)) == [
+        {'a': 'a', 'b': 'b', 'c': 'c'}]
+    assert len(searched) == 2
+
+@pytest.mark.parametrize('seed', range(20))
+def test_identity_fast_path_equals_the_search(seed):
+    rng = random.Random(seed)
+    graph_manager = random_graph(rng, size=8, edge_probability=0.4)
+    core = graph_manager.core
+    nodes = rng.sample(sorted(core.nodes()), rng.randrange(1, 5))
+    lhs = [node(node_id) for node_id in nodes]
+    lhs.extend(edge(s, t) for i, s in enumerate(nodes) for t in nodes[i + 1:] if core.has_edge(s, t))
+    # Drop or add an edge, so L is not the induced subgraph on its nodes
+    pairs = [(s, t) for i, s in enumerate(nodes) for t in nodes[i + 1:]]
+    if pairs and seed % 3:
+        s, t = rng.choice(pairs)
+        lhs = [element for element in lhs if {element['data'].get('source'), element['data'].get('target')} != {s, t}]
+        if seed % 3 == 2:
+            lhs.append(edge(s, t))
+    lhs_graph = compile_rule(rule('identity', lhs, nodes, [], lhs)).lhs_graph
+
+    searched = [match for match in iter_matches(core, lhs_graph) if all(k == v for k, v in match.items())]
+    assert list(iter_matches(core, lhs_graph, persist_node_id=True)) == searched
+
+def test_identity_fast_path_needs_induced_non_adjacency():
+    graph_manager = GraphManager.from_elements([node('a'), node('b'), node('c'), edge('a', 'b'), edge('b', 'c'),
+                                                edge('a', 'c')])
+    plan = compile_rule(CLOSE)
+    # The LHS path needs a and c non-adjacent, which they are not in the host
+    assert list(iter_matches(graph_manager.core, plan.lhs_graph, persist_node_id=True)) == []
+    graph_manager.remove_edge('a', 'c')
+    assert list(iter_matches(graph_manager.core, plan.lhs_graph, persist_node_id=True)) == [
+        {'a': 'a', 'b': 'b', 'c': 'c'}]
@@ -0,0 +1,37 @@
+import pytest
+
+from classes import GraphManager
+from dpo import new_delta
+from engine import rewrite_to_fixpoint
+
+from conftest import CUT, PATH, edge, node, rule
+
+@pytest.mark.parametrize('strategy', ['sequential', 'parallel', 'priority'])
+def test_delta_records_applied_step(strategy):
+    graph_manager = GraphManager.from_elements([node('a'), node('b'), edge('a', 'b')])
+    delta = new_delta()
+    stats = rewrite_to_fixpoint(graph_manager, [CUT], strategy=strategy, delta=delta)
+    assert stats['steps'] == 1
+    assert graph_manager.core.number_of_edges() == 0
+    assert delta['removed_edges'] == {('a', 'b')}
+    assert not delta['removed_nodes'] and not delta['added_nodes'] and not delta['added_edges']
+
+def test_delta_collects_all_steps():
+    elements = [node(str(i)) for i in range(6)] + [edge(str(i), str(i + 1)) for i in range(5)]
+    graph_manager = GraphManager.from_elements(elements)
+    delta = new_delta()
+    stats = rewrite_to_fixpoint(graph_manager, [CUT], strategy='sequential', persist_node_id=False, delta=delta)
+    assert stats['steps'] == 5
+    assert {frozenset(pair) for pair in delta['removed_edges']} == {frozenset((str(i), str(i + 1))) for i in range(5)}
+
+# Rewrites a path into itself
+KEEP = rule('keep', PATH, 'abc', ['a-b', 'b-c'], PATH)
+
+@pytest.mark.parametrize('strategy', ['sequential', 'parallel', 'priority'])
+def test_rules_changing_nothing_reach_a_fixpoint(strategy):
+    graph_manager = GraphManager.from_elements(PATH)
+    stats = rewrite_to_fixpoint(graph_manager, [KEEP, CUT], strategy=strategy, persist_node_id=False, max_steps=100)
+    assert stats['stopped'] == 'fixpoint'
+    # Only the cuts count as steps
+    assert stats['steps'] == 2
+    assert graph_manager.core.number_of_edges() == 0
@@ -0,0 +1,37 @@
+import json
+import os
+
+from utils import file_operations
+from utils.file_operations import load_rules, load_rules_from_directory
+
+from conftest import CUT, GROW
+
+def write_rule(rules_dir, filename, rule_data):
+    with open(os.path.join(rules_dir, filename), 'w') as f:
+        json.dump(rule_data, f)
+
+def test_directory_rules_are_cached_until_files_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_operations, 'RULE_CACHE_POLL_INTERVAL', 3600.0)
+    rules_dir = str(tmp_path)
+    write_rule(rules_dir, 'cut.json', dict(CUT, index=2))
+    first = load_rules_from_directory(rules_dir)
+    assert [rule_data['id'] for rule_data in first] == ['cut']
+    # Served from memory: the same parsed rule
+    assert load_rules_from_directory(rules_dir)[0] is first[0]
+
+    # Added and removed files change the directory and are seen at once
+    write_rule(rules_dir, 'grow.json', dict(GROW, index=1))
+    second = load_rules_from_directory(rules_dir)
+    assert sorted(rule_data['id'] for rule_data in second) == ['cut', 'grow']
+    assert next(rule_data for rule_data in second if rule_data['id'] == 'cut') is first[0]
+    assert [rule_data['id'] for rule_data in load_rules(rules_dir)] == ['grow', 'cut']
+    os.remove(os.path.join(rules_dir, 'grow.json'))
+    assert [rule_data['id'] for rule_data in load_rules_from_directory(rules_dir)] == ['cut']
+
+    # Files rewritten in place are checked once the poll interval passed
+    write_rule(rules_dir, 'cut.json', dict(CUT, index=2, name='renamed'))
+    monkeypatch.setattr(file_operations, 'RULE_CACHE_POLL_INTERVAL', 0.0)
+    assert load_rules_from_directory(rules_dir)[0]['name'] == 'renamed'
+
+def test_missing_directory_has_no_rules(tmp_path):
+    assert load_rules_from_directory(str(tmp_path / 'missing')) == []
@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from classes import GraphManager
+from dpo import iter_matches, rule_may_apply
+from graph_core import GraphCore, GraphInvariants
+from graph_io import load_graph_manager
+from rule_plan import compile_rule
+
+from conftest import CLOSE, TRIANGLE, edge, node, random_graph, rule
+
+def invariants_of(invariants):
+    return (invariants.node_count, invariants.edge_count, invariants.self_loops, invariants.degree_counts,
+            invariants.triangles)
+
+def test_bulk_additions_update_computed_invariants():
+    rng = random.Random(0)
+    core = GraphCore()
+    core.add_nodes_from(str(i) for i in range(10))
+    # Computed, with the triangle count, before the rest of the graph is added in batches
+    invariants = core.invariants
+    invariants.triangles
+    for batch in range(5):
+        nodes = [str(rng.randrange(20)) for _ in range(5)]
+        core.add_nodes_from(nodes)
+        core.add_edges_from((str(rng.randrange(20)), str(rng.randrange(20))) for _ in range(15))
+        # Updated rather than computed again
+        assert core.invariants is invariants
+        assert invariants_of(invariants) == invariants_of(GraphInvariants.from_graph(core))
+    assert invariants.self_loops > 0
+
+def test_pre_filter_of_a_graph_loaded_from_a_file(tmp_path):
+    # A star has no triangle, and no two nodes of degree 2
+    path = tmp_path / 'star.edgelist'
+    path.write_text(''.join(f'hub leaf{i}\n' for i in range(6)) + 'alone\n')
+    core = load_graph_manager(str(path)).core
+    assert invariants_of(core.invariants) == invariants_of(GraphInvariants.from_graph(core))
+    close = compile_rule(CLOSE)
+    triangle = compile_rule(rule('triangle', TRIANGLE, 'abc', [], TRIANGLE))
+    two_paths = [node(node_id) for node_id in 'abcdef'] + [edge('a', 'b'), edge('b', 'c'), edge('d', 'e'), edge('e', 'f')]
+    two_paths = compile_rule(rule('two paths', two_paths, [], [], []))
+    assert rule_may_apply(core, close)
+    assert not rule_may_apply(core, triangle)
+    assert not rule_may_apply(core, two_paths)
+    core.add_edges_from([('leaf0', 'leaf1')])
+    assert rule_may_apply(core, triangle)
+
+def test_mutations_keep_the_invariants_up_to_date():
+    rng = random.Random(1)
+    core = GraphCore()
+    core.add_nodes_from(str(i) for i in range(8))
+    invariants = core.invariants
+    invariants.triangles
+    for step in range(300):
+        node_ids = list(core.nodes())
+        choice = rng.random()
+        if choice < 0.1 and node_ids:
+            core.remove_node(rng.choice(node_ids))
+        elif choice < 0.2:
+            core.add_node(f'n{step}')
+        elif choice < 0.5 and core.number_of_edges():
+            core.remove_edge(*rng.choice(list(core.edges())))
+        elif node_ids:
+            source, target = rng.choice(node_ids), rng.choice(node_ids)
+            if not core.has_edge(source, target):
+                core.add_edge(source, target)
+        assert invariants_of(invariants) == invariants_of(GraphInvariants.from_graph(core))
+    assert core.invariants is invariants
+
+def cycle(size):
+    return [node(str(i)) for i in range(size)] + [edge(str(i), str((i + 1) % size)) for i in range(size)]
+
+def pattern(elements):
+    return compile_rule(rule('pattern', elements, [], [], []))
+
+@pytest.mark.parametrize('lhs', [
+    # More nodes than the host
+    [node(str(i)) for i in range(7)],
+    [node('a'), edge('a', 'a')],
+    # A node of degree 3
+    [node('a'), node('b'), node('c'), node('d'), edge('a', 'b'), edge('a', 'c'), edge('a', 'd')],
+    TRIANGLE,
+], ids=['nodes', 'self-loop', 'degree', 'triangle'])
+def test_pre_filter_rejects_rules_that_cannot_match(lhs):
+    core = GraphManager.from_elements(cycle(6)).core
+    plan = pattern(lhs)
+    assert not rule_may_apply(core, plan)
+    assert not list(iter_matches(core, plan.lhs_graph))
+
+@pytest.mark.parametrize('seed', range(3))
+def test_pre_filter_keeps_rules_that_match(seed):
+    rng = random.Random(seed)
+    for _ in range(30):
+        core = random_graph(rng, size=rng.randrange(3, 8), edge_probability=0.4).core
+        plan = pattern(random_graph(rng, size=rng.randrange(2, 5), edge_probability=0.5).elements)
+        if next(iter_matches(core, plan.lhs_graph), None) is not None:
+            assert rule_may_apply(core, plan)
@@ -0,0 +1,139 @@
+import base64
+import json
+
+import pytest
+
+from classes import GraphManager
+from graph_io import (iter_json_elements, load_graph_binary, load_graph_manager, read_elements_stream,
+                      read_graph_upload, save_graph_binary, save_graph_manager)
+
+from conftest import structure
+
+def graph_data(graph_manager):
+    return sorted((element['data'] for element in graph_manager.elements), key=lambda data: data['id'])
+
+def round_trip(graph_manager, tmp_path, name):
+    filepath = str(tmp_path / name)
+    save_graph_manager(graph_manager, filepath)
+    return load_graph_manager(filepath)
+
+def test_graphml_keeps_labels_of_nodes_with_attributes(tmp_path):
+    graph_manager = GraphManager.from_elements([
+        {'data': {'id': 'a', 'label': 'a', 'color': 'red'}},
+        {'data': {'id': 'b', 'label': 'b'}},
+        {'data': {'id': 'c', 'label': 'C', 'size': 2}},
+        {'data': {'id': 'a-b', 'source': 'a', 'target': 'b', 'weight': 1.5}},
+    ])
+    loaded = round_trip(graph_manager, tmp_path, 'graph.graphml')
+    assert graph_data(loaded) == graph_data(graph_manager)
+
+def mixed_graph():
+    elements = [{'data': {'id': str(i), 'label': str(i)}} for i in range(50)]
+    elements += [
+        {'data': {'id': 'named', 'label': 'A name'}},
+        {'data': {'id': 'bare'}},
+        {'data': {'id': 'typed', 'label': 'Person', 'age': 3}, 'classes': 'selected'},
+        {'data': {'id': 'named-bare', 'source': 'named', 'target': 'bare'}},
+        {'data': {'id': 'custom', 'source': 'bare', 'target': 'typed'}},
+        {'data': {'id': 'typed-0', 'source': 'typed', 'target': '0', 'weight': 2}},
+    ]
+    elements += [{'data': {'id': f'{i}-{i + 1}', 'source': str(i), 'target': str(i + 1)}} for i in range(49)]
+    return GraphManager.from_elements(elements)
+
+def test_binary_round_trip(tmp_path):
+    graph_manager = mixed_graph()
+    filepath = str(tmp_path / 'graph.gbin')
+    save_graph_binary(graph_manager, filepath, metadata={'saved': 'today'})
+    loaded, metadata = load_graph_binary(filepath)
+    assert metadata == {'saved': 'today'}
+    assert loaded.elements == graph_manager.elements
+    assert loaded.core.find_edge('custom') is not None
+    # Uploads of the binary format are recognized by their content
+    with open(filepath, 'rb') as f:
+        contents = 'data:application/octet-stream;base64,' + base64.b64encode(f.read()).decode()
+    assert read_graph_upload(contents)[0].elements == graph_manager.elements
+
+def test_plain_graph_binary_round_trip(tmp_path):
+    graph_manager = GraphManager.from_elements(
+        [{'data': {'id': f'n{i}'}} for i in range(10)]
+        + [{'data': {'id': f'n{i}-n{i * 3 % 10}', 'source': f'n{i}', 'target': f'n{i * 3 % 10}'}} for i in range(1, 10)])
+    loaded = round_trip(graph_manager, tmp_path, 'graph.gbin')
+    assert graph_data(loaded) == graph_data(graph_manager)
+
+def test_json_round_trip(tmp_path):
+    graph_manager = mixed_graph()
+    loaded = round_trip(graph_manager, tmp_path, 'graph.json')
+    assert loaded.elements == graph_manager.elements
+
+def test_json_elements_parse_in_any_chunks():
+    elements = mixed_graph().elements
+    text = json.dumps({'name': 'g', 'elements': elements, 'meta': {'list': [1, '}]\\"', None]}})
+    for size in (1, 7, len(text)):
+        chunks = (text[start:start + size] for start in range(0, len(text), size))
+        assert list(iter_json_elements(chunks)) == elements
+    assert list(iter_json_elements(iter([json.dumps(elements)]))) == elements
+    with pytest.raises(ValueError):
+        list(iter_json_elements(iter([json.dumps(elements) + ' []'])))
+
+def test_streamed_upload_skips_bad_edges():
+    elements = [
+        {'data': {'id': 'a-b', 'source': 'a', 'target': 'b'}},
+        {'data': {'id': 'a'}},
+        {'data': {'id': 'b', 'label': 'B'}},
+        {'data': {'id': 'b-a', 'source': 'b', 'target': 'a'}},
+        {'data': {'id': 'a-x', 'source': 'a', 'target': 'x'}},
+    ]
+    contents = 'data:application/json;base64,' + base64.b64encode(json.dumps({'elements': elements}).encode()).decode()
+    reports = []
+    graph_manager, stats = read_elements_stream(iter(elements), batch_size=2)
+    assert stats == {'nodes': 2, 'edges': 1, 'dangling_edges': 1, 'duplicate_edges': 1}
+    uploaded, upload_stats = read_graph_upload(contents, lambda **report: reports.append(report))
+    assert upload_stats == stats
+    for graph in (graph_manager, uploaded):
+        assert graph.elements[:2] == elements[1:3]
+        assert list(graph.core.edges()) in ([('a', 'b')], [('b', 'a')])
+    assert reports[-1]['bytes_read'] == reports[-1]['bytes_total']
+
+def test_edge_and_adjacency_list_round_trips(tmp_path):
+    graph_manager = mixed_graph()
+    graph_manager.add_node('alone')
+    loaded = round_trip(graph_manager, tmp_path, 'graph.edgelist')
+    assert structure(loaded, edge_ids=True) == structure(graph_manager, edge_ids=True)
+    # Adjacency lists do not keep edge IDs
+    assert structure(round_trip(graph_manager, tmp_path, 'graph.adjlist')) == structure(graph_manager)
+
+def test_graphml_from_other_tools(tmp_path):
+    filepath = tmp_path / 'graph.graphml'
+    filepath.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+        '  <key id="k0" for="node" attr.name="size" attr.type="int"><default>1</default></key>\n'
+        '  <key id="k1" for="edge" attr.name="weight" attr.type="double"/>\n'
+        '  <graph edgedefault="directed">\n'
+        '    <node id="a"><data key="k0">5</data></node>\n'
+        '    <node id="b"/>\n'
+        '    <edge source="a" target="b"><data key="k1">0.5</data></edge>\n'
+        '    <edge source="b" target="a"/>\n'
+        '    <edge source="a" target="missing"/>\n'
+        '  </graph>\n'
+        '</graphml>\n', encoding='utf-8')
+    assert graph_data(load_graph_manager(str(filepath))) == [
+        {'id': 'a', 'label': 'a', 'size': 5},
+        {'id': 'a-b', 'source': 'a', 'target': 'b', 'weight': 0.5},
+        {'id': 'b', 'label': 'b', 'size': 1},
+    ]
+
+def upload(filepath):
+    with open(filepath, 'rb') as f:
+        return 'data:application/octet-stream;base64,' + base64.b64encode(f.read()).decode()
+
+@pytest.mark.parametrize('name', ['graph.graphml', 'graph.edgelist', 'graph.adjlist'])
+def test_text_format_uploads(tmp_path, name):
+    graph_manager = mixed_graph()
+    filepath = str(tmp_path / name)
+    save_graph_manager(graph_manager, filepath)
+    reports = []
+    uploaded, stats = read_graph_upload(upload(filepath), lambda **report: reports.append(report), filename=name)
+    assert structure(uploaded) == structure(load_graph_manager(filepath)) == structure(graph_manager)
+    assert (stats['nodes'], stats['edges']) == (len(graph_manager.core), graph_manager.core.number_of_edges())
+    assert reports[-1]['bytes_read'] == reports[-1]['bytes_total']
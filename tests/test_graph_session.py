@@ -0,0 +1,63 @@
+import dash
+
+from classes import GraphManager
+from callbacks.rule import _apply_rules, _apply_rules_to_fixpoint, _rewrite_main_graph
+import graph_session
+from jobs import RewriteJob
+
+from conftest import CUT, DROP, GROW, PATH, structure
+
+def apply_rules(state, rules):
+    """Run an "Apply Rules" click in the current thread, returning the new state of the page."""
+    return _rewrite_main_graph(RewriteJob(), state, 'Apply Rules', _apply_rules, rules)[2]
+
+def new_session():
+    session = graph_session.get_session(None, create=True)
+    with session.lock:
+        return session, session.load(GraphManager.from_elements(PATH))
+
+def test_match_indexes_are_kept_per_session_while_the_graph_is_unchanged():
+    first, first_state = new_session()
+    second, second_state = new_session()
+    first_state = apply_rules(first_state, [GROW])
+    index = first.match_indexes['grow']
+    # Another page applying the same rule does not drop the indexes of this one
+    apply_rules(second_state, [GROW, CUT])
+    assert first.match_indexes == {'grow': index}
+    assert set(second.match_indexes) == {'grow', 'cut'}
+
+    first_state = apply_rules(first_state, [GROW])
+    assert first.match_indexes['grow'] is index
+    # Each click hangs a new node on node "a"
+    assert len(first.history.graph_manager.core) == 5
+
+    # Any other change of the graph drops them
+    with first.lock:
+        first.history.undo()
+        first.changed()
+    assert first.match_indexes == {}
+
+def test_derivations_record_a_version_per_round():
+    session, state = new_session()
+    _rewrite_main_graph(RewriteJob(), state, 'Apply Until Done', _apply_rules_to_fixpoint, [DROP, CUT])
+    history = session.history
+    # Cutting edge "a-b", then dropping node "a" in the next round
+    assert [version.label for version in history.versions] == [
+        'Load graph', 'Apply Until Done (round 1)', 'Apply Until Done (round 2)']
+    assert set(history.graph_manager.core.nodes()) == {'b', 'c'}
+
+class CancelledJob(RewriteJob):
+    """A job cancelled as soon as it reports progress, so after it made changes."""
+
+    def report(self, **progress):
+        super().report(**progress)
+        self.cancel()
+
+def test_cancelled_clicks_leave_the_history_unchanged():
+    session, state = new_session()
+    for rewrite in (_apply_rules, _apply_rules_to_fixpoint):
+        update, alert, new_state, _ = _rewrite_main_graph(CancelledJob(), state, 'Apply', rewrite, [CUT, DROP])
+        assert alert['message'].startswith('Cancelled')
+        assert new_state is dash.no_update
+        assert len(session.history) == 1
+        assert structure(session.history.graph_manager) == structure(GraphManager.from_elements(PATH))
@@ -0,0 +1,83 @@
+from classes import GraphManager
+from history import GraphHistory
+
+from conftest import edge, node, structure
+
+def test_checkpoints_keep_their_edge_elements():
+    graph_manager = GraphManager.from_elements([node('a'), node('b'), node('c'), edge('a', 'b')])
+    history = GraphHistory(graph_manager)
+    # Handing out the elements fills in the edge element of the current graph
+    assert edge('a', 'b') in graph_manager.elements
+    selected = dict(edge('a', 'b'), classes='selected')
+    assert history.sync([node('a'), node('b'), node('c'), selected, edge('b', 'c')])
+    assert selected in graph_manager.elements
+    assert history.versions[0].checkpoint.edge('a', 'b').element is None
+    elements = history.graph_at(0).elements
+    assert edge('a', 'b') in elements and selected not in elements
+
+def graph_state(graph_manager):
+    return structure(graph_manager, edge_ids=True)
+
+def test_every_version_can_be_rebuilt():
+    graph_manager = GraphManager.from_elements([node(str(i)) for i in range(4)])
+    history = GraphHistory(graph_manager)
+    states = [graph_state(graph_manager)]
+    for step in range(30):
+        with graph_manager.begin(f'step {step}'):
+            node_ids = sorted(graph_manager.core.nodes())
+            if step % 5 == 4:
+                graph_manager.remove_node(node_ids.pop(0))
+            new_id = graph_manager.new_node_id()
+            graph_manager.add_node(new_id)
+            graph_manager.add_edge(new_id, node_ids[step % len(node_ids)])
+            if step % 3 == 2:
+                graph_manager.remove_edge(*next(iter(graph_manager.core.edges())))
+        states.append(graph_state(graph_manager))
+    assert len(history) == len(states)
+    assert any(version.checkpoint is not None for version in history.versions[1:])
+
+    for position, state in enumerate(states):
+        assert graph_state(history.graph_at(position)) == state
+    for position in reversed(range(len(states) - 1)):
+        assert history.undo()
+        assert graph_state(graph_manager) == states[position]
+    assert not history.undo()
+    history.checkout(len(states) - 1)
+    assert graph_state(graph_manager) == states[-1]
+    assert not history.redo()
+
+def grow(graph_manager, steps):
+    states = []
+    for step in range(steps):
+        with graph_manager.begin(f'step {step}'):
+            new_id = graph_manager.new_node_id()
+            graph_manager.add_node(new_id)
+            graph_manager.add_edge(new_id, '0')
+        states.append(graph_state(graph_manager))
+    return states
+
+def test_oldest_versions_are_forgotten():
+    graph_manager = GraphManager.from_elements([node('0')])
+    history = GraphHistory(graph_manager, max_versions=10)
+    states = [graph_state(graph_manager)] + grow(graph_manager, 25)
+    assert 5 <= len(history) <= 10
+    assert history.position == len(history) - 1
+    kept = states[-len(history):]
+    for position, state in enumerate(kept):
+        assert graph_state(history.graph_at(position)) == state
+    while history.undo():
+        pass
+    assert graph_state(graph_manager) == kept[0]
+
+def test_revert_keeps_the_versions_it_drops():
+    graph_manager = GraphManager.from_elements([node('0')])
+    history = GraphHistory(graph_manager, max_versions=4)
+    grow(graph_manager, 2)
+    start_state = graph_state(graph_manager)
+    with history.keeping_versions() as start:
+        grow(graph_manager, 10)
+        assert len(history) == start + 11
+        history.revert(start)
+    assert graph_state(graph_manager) == start_state
+    assert len(history) == start + 1
+    assert not history.redo()
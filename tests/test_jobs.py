@@ -0,0 +1,46 @@
+import threading
+import time
+
+from jobs import get_job, pop_job, start_job
+
+def wait(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not job.is_finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.is_finished
+    pop_job(job.id)
+    return job
+
+def test_jobs_of_a_queue_run_in_order_while_other_queues_proceed():
+    release = threading.Event()
+    order = []
+
+    def blocked(job, name):
+        release.wait(5.0)
+        order.append(name)
+
+    def quick(job, name):
+        order.append(name)
+        return name
+
+    first = start_job(blocked, 'first', queue='page')
+    second = start_job(quick, 'second', queue='page')
+    # A job of another page does not wait for the blocked one
+    other = start_job(quick, 'other', queue='other page')
+    assert wait(other).result == 'other'
+    assert get_job(second.id).status == 'queued'
+    release.set()
+    wait(first)
+    assert wait(second).result == 'second'
+    assert order == ['other', 'first', 'second']
+
+def test_cancelled_queued_job_does_not_block_its_queue():
+    release = threading.Event()
+    first = start_job(lambda job: release.wait(5.0), queue='page')
+    second = start_job(lambda job: 'second', queue='page')
+    third = start_job(lambda job: 'third', queue='page')
+    second.cancel()
+    release.set()
+    assert wait(second).status == 'cancelled'
+    assert wait(third).result == 'third'
+    wait(first)
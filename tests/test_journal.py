@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+import journal
+from classes import GraphManager
+from engine import rewrite_to_fixpoint
+from history import GraphHistory
+from journal import DerivationJournal, JournalReader
+
+from conftest import CUT, DROP, GROW, edge, node, structure
+
+RULES = [CUT, GROW, DROP]
+
+def random_graph_manager(seed, size=30, edges=60):
+    rng = random.Random(seed)
+    elements = [node(f'v{i}') for i in range(size)]
+    pairs = set()
+    while len(pairs) < edges:
+        pairs.add(tuple(sorted(rng.sample(range(size), 2))))
+    elements.extend(edge(f'v{s}', f'v{t}') for s, t in sorted(pairs))
+    return GraphManager.from_elements(elements)
+
+@pytest.fixture
+def small_frames(monkeypatch):
+    # Several frames and checkpoints even for a short derivation
+    monkeypatch.setattr(journal, 'JOURNAL_FRAME_STEPS', 7)
+
+@pytest.mark.parametrize('strategy', ['sequential', 'parallel'])
+def test_replay_equals_the_derivation(tmp_path, small_frames, strategy):
+    graph_manager = random_graph_manager(0)
+    history = GraphHistory(graph_manager)
+    path = str(tmp_path / 'derivation.journal')
+    with DerivationJournal(path, graph_manager) as derivation:
+        stats = rewrite_to_fixpoint(graph_manager, RULES, strategy=strategy, max_steps=150,
+                                    persist_node_id=False, journal=derivation)
+
+    reader = JournalReader(path)
+    assert len(reader) == stats['steps'] == len(history) - 1 > 0
+    assert len(reader.checkpoints) > 1
+    assert set(reader.rules) <= {'cut', 'grow', 'drop'}
+    assert structure(reader.graph_at()) == structure(graph_manager)
+    for step in range(len(reader) + 1):
+        assert structure(reader.graph_at(step)) == structure(history.graph_at(step))
+    steps = list(reader.iter_steps(5, 9))
+    assert len(steps) == 5 and all(step['rule'] in reader.rules for step in steps)
+    with pytest.raises(IndexError):
+        reader.graph_at(len(reader) + 1)
+
+def test_cut_off_journal_keeps_its_complete_frames(tmp_path, small_frames):
+    graph_manager = random_graph_manager(1)
+    history = GraphHistory(graph_manager)
+    path = tmp_path / 'derivation.journal'
+    with DerivationJournal(str(path), graph_manager) as derivation:
+        rewrite_to_fixpoint(graph_manager, RULES, max_steps=50, persist_node_id=False, journal=derivation)
+    complete = len(JournalReader(str(path)))
+
+    data = path.read_bytes()
+    path.write_bytes(data[:-5])
+    reader = JournalReader(str(path))
+    assert 0 < len(reader) < complete
+    assert structure(reader.graph_at()) == structure(history.graph_at(len(reader)))
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'graph.json'
+    path.write_text('{"elements": []}')
+    with pytest.raises(ValueError):
+        JournalReader(str(path))
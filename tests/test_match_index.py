@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from classes import GraphManager, RuleManager
+from dpo import apply_dpo_rule, iter_matches, new_delta
+from match_index import MatchIndex
+
+from conftest import CLOSE, CUT, GROW, PATH, match_keys, random_graph
+
+RULES = [CLOSE, CUT, GROW]
+
+def searched(graph_manager, index):
+    return match_keys(iter_matches(graph_manager.core, index.plan.lhs_graph,
+                                   persist_node_id=index.persist_node_id, pattern=index.plan.pattern))
+
+@pytest.mark.parametrize('seed', range(5))
+def test_index_equals_full_search_after_random_rewrites(seed):
+    rng = random.Random(seed)
+    graph_manager = random_graph(rng)
+    rules = [RuleManager.from_dict(rule) for rule in RULES]
+    indexes = [MatchIndex(graph_manager, rule, persist_node_id=False) for rule in rules]
+    steps = 0
+    for _ in range(40):
+        index = rng.choice(indexes)
+        matches = index.get_matches()
+        if not matches:
+            continue
+        delta = new_delta()
+        if apply_dpo_rule(graph_manager, index.rule_manager, rng.choice(matches), delta=delta):
+            steps += 1
+        for other in indexes:
+            other.update(delta)
+            assert match_keys(other) == searched(graph_manager, other)
+    assert steps > 0
+
+def test_identity_index_follows_rewrites():
+    graph_manager = GraphManager.from_elements(PATH)
+    close, cut = (RuleManager.from_dict(rule) for rule in RULES[:2])
+    close_index = MatchIndex(graph_manager, close)
+    cut_index = MatchIndex(graph_manager, cut)
+    assert len(close_index) == 1 and len(cut_index) == 1
+
+    delta = new_delta()
+    assert apply_dpo_rule(graph_manager, close, close_index.get_matches()[0], delta=delta)
+    close_index.update(delta)
+    cut_index.update(delta)
+    # The path a-b-c is no longer induced once a-c is added
+    assert len(close_index) == 0
+    assert match_keys(cut_index) == searched(graph_manager, cut_index)
+
+    delta = new_delta()
+    assert apply_dpo_rule(graph_manager, cut, cut_index.get_matches()[0], delta=delta)
+    close_index.update(delta)
+    cut_index.update(delta)
+    assert len(cut_index) == 0
+    assert match_keys(close_index) == searched(graph_manager, close_index) == set()
@@ -0,0 +1,116 @@
+import copy
+import random
+
+import pytest
+
+from history import GraphHistory
+from utils.patch import PATCH_MAX_REMOVALS, element_keys, graph_update, rule_patch
+
+from conftest import CLOSE, GROW, edge, node, random_graph
+
+def apply_patch(data, update):
+    """Apply an update of a callback output to the data in the browser, as Dash does."""
+    if isinstance(update, (list, dict)) and '__dash_patch_update' not in update:
+        return copy.deepcopy(update)
+    for operation in update.to_plotly_json()['operations']:
+        *path, last = operation['location'] or [None]
+        target = data
+        for key in path:
+            target = target[key]
+        value = operation['params'].get('value')
+        if operation['operation'] == 'Assign':
+            target[last] = copy.deepcopy(value)
+        elif operation['operation'] == 'Delete':
+            del target[last]
+        else:
+            target = target if last is None else target[last]
+            if operation['operation'] == 'Extend':
+                target.extend(copy.deepcopy(value))
+            else:
+                assert operation['operation'] == 'Remove'
+                target.remove(value)
+    return data
+
+def keyed(elements):
+    return sorted((element['data'].get('source') is not None, element['data']['id'], repr(element['data']))
+                  for element in elements)
+
+def random_edits(graph_manager, rng):
+    for _ in range(rng.randrange(1, 6)):
+        node_ids = list(graph_manager.core.nodes())
+        kind = rng.random()
+        if kind < 0.3 or len(node_ids) < 2:
+            graph_manager.add_node(graph_manager.new_node_id())
+        elif kind < 0.6:
+            graph_manager.add_edge(*rng.sample(node_ids, 2))
+        elif kind < 0.8:
+            records = list(graph_manager.core.edge_records())
+            if records:
+                record = rng.choice(records)
+                graph_manager.remove_edge(record.source, record.target)
+        else:
+            graph_manager.remove_node(rng.choice(node_ids))
+
+@pytest.mark.parametrize('seed', range(10))
+def test_graph_update_keeps_the_browser_in_sync(seed):
+    rng = random.Random(seed)
+    graph_manager = random_graph(rng)
+    history = GraphHistory(graph_manager)
+    # The browser holds its own order and adds the positions of nodes
+    browser = copy.deepcopy(graph_manager.elements)
+    rng.shuffle(browser)
+    for element in browser:
+        if 'source' not in element['data']:
+            element['position'] = {'x': 0, 'y': 0}
+    keys = element_keys(browser)
+    for _ in range(20):
+        if rng.random() < 0.3 and history.undo():
+            changes, undone = history.versions[history.position + 1].changes, True
+        else:
+            with graph_manager.begin('Edit') as transaction:
+                random_edits(graph_manager, rng)
+            changes, undone = transaction.changes, False
+        update = graph_update(graph_manager, changes, undone, element_keys=keys)
+        browser = apply_patch(browser, update)
+        assert keyed(browser) == keyed(graph_manager.elements)
+        assert keys == element_keys(browser)
+
+def test_graph_update_sends_all_elements_for_many_removals_or_unknown_order():
+    graph_manager = random_graph(random.Random(0), size=PATCH_MAX_REMOVALS + 2, edge_probability=0)
+    keys = element_keys(graph_manager.elements)
+    with graph_manager.begin() as transaction:
+        graph_manager.remove_node('0')
+    assert graph_update(graph_manager, transaction.changes) == graph_manager.elements
+    assert graph_update(graph_manager, transaction.changes, element_keys=keys).to_plotly_json()['operations'] == [
+        {'operation': 'Delete', 'location': [0], 'params': {}},
+        {'operation': 'Extend', 'location': [], 'params': {'value': []}},
+    ]
+    with graph_manager.begin() as transaction:
+        for node_id in list(graph_manager.core.nodes()):
+            graph_manager.remove_node(node_id)
+    assert graph_update(graph_manager, transaction.changes, element_keys=keys) == []
+    assert keys == []
+
+def test_rule_patch_turns_the_old_rule_into_the_new():
+    old_rule = dict(copy.deepcopy(CLOSE), name='close')
+    new_rule = copy.deepcopy(CLOSE)
+    new_rule['lhs'] = new_rule['lhs'][:2] + [node('c', label='Person'), edge('a', 'b'), edge('a', 'd'), node('d')]
+    new_rule['k'] = {'nodes': ['a', 'b'], 'edges': ['a-b']}
+    new_rule['rhs'] = new_rule['rhs'] + [node('x')]
+    assert rule_patch(None, new_rule) is new_rule
+    browser = apply_patch(copy.deepcopy(old_rule), rule_patch(old_rule, new_rule))
+    assert set(browser) == set(new_rule)
+    for key, value in new_rule.items():
+        if key in ('lhs', 'rhs'):
+            assert keyed(browser[key]) == keyed(value)
+            # Edges come after the nodes they join
+            positions = {element['data']['id']: position for position, element in enumerate(browser[key])
+                         if 'source' not in element['data']}
+            for position, element in enumerate(browser[key]):
+                if 'source' in element['data']:
+                    assert positions[element['data']['source']] < position
+                    assert positions[element['data']['target']] < position
+        else:
+            assert browser[key] == value
+    # Unchanged rules need no operations
+    assert rule_patch(GROW, copy.deepcopy(GROW)).to_plotly_json()['operations'] == []
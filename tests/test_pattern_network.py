@@ -0,0 +1,41 @@
+import random
+
+import pytest
+
+from classes import RuleManager
+from dpo import apply_dpo_rule, iter_matches, new_delta
+from pattern_network import PatternNetwork
+
+from conftest import CLOSE, CUT, GROW, PATH, edge, match_keys, node, random_graph, rule
+
+# Rules sharing the edge and path prefixes of their search orders
+RULES = [
+    CUT,
+    CLOSE,
+    rule('shortcut', PATH, 'ac', [], [node('a'), node('c'), edge('a', 'c')]),
+    GROW,
+]
+
+@pytest.mark.parametrize('seed', range(5))
+def test_network_equals_full_search_after_random_rewrites(seed):
+    rng = random.Random(seed)
+    graph_manager = random_graph(rng)
+    rules = [RuleManager.from_dict(rule_data) for rule_data in RULES]
+    network = PatternNetwork(graph_manager, rules, persist_node_id=False)
+    assert len(network.nodes) < network.pattern_size
+
+    def check():
+        for position, plan in enumerate(network.plans):
+            assert match_keys(network.get_matches(position)) == match_keys(
+                iter_matches(graph_manager.core, plan.lhs_graph, pattern=plan.pattern))
+
+    check()
+    for _ in range(40):
+        position = rng.randrange(len(rules))
+        matches = network.get_matches(position)
+        if not matches:
+            continue
+        delta = new_delta()
+        if apply_dpo_rule(graph_manager, rules[position], rng.choice(matches), delta=delta):
+            network.update(delta)
+        check()
@@ -0,0 +1,42 @@
+from rule_analysis import analyze_rules
+
+from conftest import CLOSE, CUT, DROP, GROW, edge, node, rule
+
+# Cuts an edge between other node IDs than CUT
+FAR = rule('far', [node('x'), node('y'), edge('x', 'y')], 'xy', [], [node('x'), node('y')])
+# Needs a node with the form of the IDs given to added nodes
+GENERATED = rule('generated', [node('n1')], ['n1'], [], [node('n1')])
+
+RULES = [CUT, GROW, DROP, CLOSE, FAR, GENERATED]
+
+def affected(triggers, rule_id):
+    position = triggers.rule_ids.index(rule_id)
+    return {triggers.rule_ids[other] for other in triggers.affected_by(position)}
+
+def test_identity_relations_follow_shared_node_ids():
+    triggers = analyze_rules(RULES, persist_node_id=True)
+    # Removing edge a-b invalidates the matches needing it, but not those of other nodes
+    assert affected(triggers, 'cut') == {'cut', 'close'}
+    assert affected(triggers, 'far') == {'far'}
+    # Removing node a invalidates every rule matching it
+    assert affected(triggers, 'drop') == {'cut', 'grow', 'drop', 'close'}
+    # Added nodes can only be matched by LHS nodes that may have their IDs
+    assert affected(triggers, 'grow') == {'generated'}
+    # Closing the path adds edge a-c, which the induced path must not have
+    assert 'close' in affected(triggers, 'close')
+
+def test_structural_relations_follow_the_kinds_of_changes():
+    triggers = analyze_rules(RULES, persist_node_id=False)
+    # Any edge removal can invalidate any rule needing an edge
+    assert affected(triggers, 'far') == affected(triggers, 'cut') == {'cut', 'close', 'far'}
+    # Added nodes can be matched by any LHS node
+    assert affected(triggers, 'grow') == set(triggers.rule_ids)
+    # Every rule matching by structure is affected at least as much as by node ID
+    identity = analyze_rules(RULES, persist_node_id=True)
+    for rule_id in triggers.rule_ids:
+        assert affected(identity, rule_id) <= affected(triggers, rule_id)
+
+def test_removing_an_edge_unblocks_the_removal_of_its_nodes():
+    triggers = analyze_rules([CUT, DROP], persist_node_id=True)
+    assert triggers.enabled_by(0) == {1}
+    assert triggers.to_networkx().edges['cut', 'drop'] == {'creates': False, 'invalidates': False, 'unblocks': True}
@@ -0,0 +1,38 @@
+from classes import RuleManager
+from rule_plan import compile_rule, rule_content
+
+from conftest import PATH, edge, node, rule
+
+# Replace the edge of a path a-b-c by a new node between a and b, and drop c
+SPLIT = rule('split', PATH, 'ab', [], [node('a'), node('b'), node('x'), edge('a', 'x'), edge('x', 'b')])
+
+def test_plan_lists_removed_and_added_elements():
+    plan = compile_rule(SPLIT)
+    assert set(plan.nodes_to_remove) == {'c'}
+    assert {frozenset(e) for e in plan.edges_to_remove} == {frozenset('ab'), frozenset('bc')}
+    assert set(plan.nodes_to_add) == {'x'}
+    assert {frozenset(e) for e in plan.edges_to_add} == {frozenset('ax'), frozenset('bx')}
+    assert plan.gluing_checks == (('c', ('b',)),)
+
+def test_plans_are_shared_by_rules_with_the_same_content():
+    renamed = dict(SPLIT, id='other', index=3)
+    renamed['lhs'] = [dict(element, classes='selected') for element in reversed(SPLIT['lhs'])]
+    assert rule_content(renamed) == rule_content(SPLIT)
+    assert compile_rule(renamed) is compile_rule(SPLIT)
+
+def test_typed_and_changed_rules_get_their_own_plan():
+    typed = dict(SPLIT, lhs=[node('a', label='Person')] + SPLIT['lhs'][1:])
+    plan = compile_rule(typed)
+    assert plan is not compile_rule(SPLIT)
+    assert plan.node_attributes == {'a': {'label': 'Person'}}
+    # A label equal to the node ID does not type it
+    untyped = dict(SPLIT, lhs=[node('a', label='a')] + SPLIT['lhs'][1:])
+    assert compile_rule(untyped) is compile_rule(SPLIT)
+
+def test_rule_manager_compiles_its_current_rule():
+    rule_manager = RuleManager.from_dict(SPLIT)
+    plan = rule_manager.compile()
+    assert plan is compile_rule(SPLIT)
+    rule_manager.rhs.remove_node('x')
+    assert rule_manager.compile() is not plan
+    assert rule_manager.compile().nodes_to_add == ()
@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+from store import Store, is_store
+from utils.file_operations import load_rules
+
+from conftest import GROW
+
+def rule(rule_id, name=None):
+    return dict(GROW, id=rule_id, name=name)
+
+def graph(size):
+    nodes = [{'data': {'id': str(i), 'label': str(i)}} for i in range(size)]
+    edges = [{'data': {'id': f'{i}-{i + 1}', 'source': str(i), 'target': str(i + 1)}} for i in range(size - 1)]
+    return {'elements': nodes + edges}
+
+@pytest.fixture
+def store(tmp_path):
+    with Store(str(tmp_path / 'store.sqlite3')) as store:
+        yield store
+
+def test_rules_keep_their_index(store):
+    assert store.save_rule(rule('r1', 'first')) == 1
+    assert store.save_rule(rule('r2')) == 2
+    # Saving a rule again replaces it in place
+    assert store.save_rule(rule('r1', 'renamed')) == 1
+    assert store.get_rule('r1')['name'] == 'renamed'
+    assert store.get_rule_by_index(2)['id'] == 'r2'
+    assert [summary['id'] for summary in store.list_rules(offset=1)] == ['r2']
+    assert store.delete_rule('r1') and not store.delete_rule('r1')
+    assert store.save_rule(rule('r3')) == 3
+    assert [r['id'] for r in store.load_rules()] == ['r2', 'r3']
+
+def test_imports_skip_known_rules_and_taken_indexes(store):
+    store.save_rule(rule('r1'))
+    imported = [dict(rule('r1'), index=5), dict(rule('r2'), index=1), dict(rule('r3'), index=7)]
+    assert store.import_rules(imported, source='saved_rules') == 2
+    assert store.import_rules(imported, source='saved_rules') == 0
+    assert {r['id']: r['index'] for r in store.load_rules()} == {'r1': 1, 'r2': 2, 'r3': 7}
+    # The given rules are not modified
+    assert imported[1]['index'] == 1
+
+def test_graph_versions(store, tmp_path):
+    graph_id, version = store.save_graph(graph(3), name='path', label='first')
+    assert version == 1
+    assert store.save_graph(graph(5), graph_id, label='longer') == (graph_id, 2)
+    assert store.get_graph(graph_id) == graph(5)
+    assert store.get_graph(graph_id, 1) == graph(3)
+    assert store.get_graph(graph_id, 3) is None
+    assert [(v['version'], v['node_count'], v['edge_count']) for v in store.list_versions(graph_id)] == [(1, 3, 2), (2, 5, 4)]
+    assert [g['version'] for g in store.find_graphs('path')] == [2]
+    assert store.delete_graph(graph_id)
+    assert store.get_graph(graph_id, 1) is None and store.list_versions(graph_id) == []
+    assert is_store(store.path) and not is_store(str(tmp_path))
+
+def test_concurrent_saves_get_distinct_indexes(store):
+    def save(start):
+        worker_store = Store(store.path)
+        for i in range(start, start + 20):
+            worker_store.save_rule(rule(f'r{i}'))
+        worker_store.close()
+
+    threads = [threading.Thread(target=save, args=(start,)) for start in range(0, 80, 20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(summary['index'] for summary in store.list_rules()) == list(range(1, 81))
+
+def test_loading_rules_closes_the_store(store, monkeypatch):
+    store.save_rule(rule('r1'))
+    store.save_rule(rule('r2'))
+    closed = []
+    monkeypatch.setattr(Store, 'close', lambda self: closed.append(self.path))
+    assert [rule_data['id'] for rule_data in load_rules(store.path)] == ['r1', 'r2']
+    assert closed == [store.path]
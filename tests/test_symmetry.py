@@ -0,0 +1,53 @@
+from classes import GraphManager
+from dpo import iter_matches
+from pattern_network import PatternNetwork
+from rule_plan import compile_rule
+
+from conftest import TRIANGLE, edge, node, rule
+
+def complete_graph(size, node_ids=None):
+    node_ids = node_ids or [str(i) for i in range(size)]
+    return GraphManager.from_elements(
+        [node(n) for n in node_ids] + [edge(s, t) for i, s in enumerate(node_ids) for t in node_ids[i + 1:]])
+
+def test_one_match_per_symmetry_class():
+    plan = compile_rule(rule('keep', TRIANGLE, 'abc', ['a-b', 'b-c', 'a-c'], TRIANGLE))
+    assert plan.symmetries == 6
+    host = complete_graph(5).core
+    every = list(iter_matches(host, plan.lhs_graph))
+    assert len(every) == 60
+    found = list(iter_matches(host, plan.lhs_graph, pattern=plan.pattern))
+    # A kept triangle is only matched once per host triangle
+    triangles = [frozenset(match.values()) for match in found]
+    assert len(triangles) == len(set(triangles)) == 10
+    assert set(triangles) == {frozenset(match.values()) for match in every}
+
+def test_symmetries_respect_the_effect_of_the_rule():
+    # Removing a-b tells a and b from c
+    cut = compile_rule(rule('cut', TRIANGLE, 'abc', ['b-c', 'a-c'],
+                            [node('a'), node('b'), node('c'), edge('b', 'c'), edge('a', 'c')]))
+    assert cut.symmetries == 2
+    host = complete_graph(4).core
+    found = list(iter_matches(host, cut.lhs_graph, pattern=cut.pattern))
+    # One match per removed host edge
+    assert sorted(tuple(sorted((match['a'], match['b']))) for match in found) == sorted(
+        tuple(sorted(pair)) for pair in host.edges() for _ in range(2))
+    assert len({(frozenset((match['a'], match['b'])), match['c']) for match in found}) == len(found) == 12
+
+    # A new node hung on a only leaves swapping b and c
+    grow = compile_rule(rule('grow', TRIANGLE, 'abc', ['a-b', 'b-c', 'a-c'], TRIANGLE + [node('x'), edge('a', 'x')]))
+    assert grow.symmetries == 2
+
+    typed = compile_rule(rule('typed', [node('a', label='Person')] + TRIANGLE[1:], 'abc', ['a-b', 'b-c', 'a-c'], TRIANGLE))
+    assert typed.symmetries == 2
+
+def test_symmetries_of_hosts_with_mixed_node_id_types():
+    plan = compile_rule(rule('keep', TRIANGLE, 'abc', ['a-b', 'b-c', 'a-c'], TRIANGLE))
+    graph_manager = complete_graph(5, [0, 1, 2, '3', '4'])
+    expected = {frozenset(match.values()) for match in iter_matches(graph_manager.core, plan.lhs_graph)}
+    network = PatternNetwork(graph_manager, [plan], persist_node_id=False)
+    for found in (list(iter_matches(graph_manager.core, plan.lhs_graph, pattern=plan.pattern)),
+                  network.get_matches(0)):
+        triangles = [frozenset(match.values()) for match in found]
+        assert len(triangles) == len(set(triangles)) == 10
+        assert set(triangles) == expected
@@ -0,0 +1,98 @@
+import json
+import random
+
+import pytest
+
+from classes import GraphManager
+from graph_core import GraphInvariants
+
+from conftest import edge, node
+
+def snapshot(graph_manager):
+    core = graph_manager.core
+    invariants = core.invariants
+    return {
+        'elements': sorted(json.dumps(element, sort_keys=True) for element in graph_manager.elements),
+        'nodes': set(core.nodes()),
+        'edges': {(frozenset((r.source, r.target)), r.edge_id) for r in core.edge_records()},
+        'edge_count': core.number_of_edges(),
+        'custom_edge_ids': set(core.custom_edge_ids),
+        'invariants': (invariants.node_count, invariants.edge_count, invariants.self_loops, invariants.degree_counts),
+        'graph': (set(graph_manager.graph.nodes()), {frozenset(e) for e in graph_manager.graph.edges()}),
+    }
+
+def random_graph_manager(rng):
+    elements = [node('a', label='A'), node('b', color='red')] + [node(f'n{i}') for i in range(8)]
+    node_ids = [element['data']['id'] for element in elements]
+    for i, source in enumerate(node_ids):
+        for target in node_ids[i + 1:]:
+            if rng.random() < 0.3:
+                elements.append(edge(source, target, f'e{len(elements)}' if rng.random() < 0.3 else None))
+    graph_manager = GraphManager.from_elements(elements)
+    # Materialize the indexes, so the rollback has to maintain them too
+    graph_manager.core.invariants
+    graph_manager.graph
+    return graph_manager
+
+def random_changes(graph_manager, rng, count):
+    for _ in range(count):
+        node_ids = list(graph_manager.core.nodes())
+        kind = rng.random()
+        if kind < 0.3:
+            graph_manager.add_node(graph_manager.new_node_id())
+        elif kind < 0.6 and len(node_ids) > 1:
+            source, target = rng.sample(node_ids, 2)
+            graph_manager.add_edge(source, target, f'x{rng.randrange(1000)}' if rng.random() < 0.3 else None)
+        elif kind < 0.85:
+            records = list(graph_manager.core.edge_records())
+            if records:
+                record = rng.choice(records)
+                graph_manager.remove_edge(record.target, record.source)
+        elif node_ids:
+            graph_manager.remove_node(rng.choice(node_ids))
+        if rng.random() < 0.2:
+            # Hand out the elements in between, as the callbacks do
+            graph_manager.elements
+
+@pytest.mark.parametrize('seed', range(10))
+def test_rollback_restores_the_graph_exactly(seed):
+    rng = random.Random(seed)
+    graph_manager = random_graph_manager(rng)
+    before = snapshot(graph_manager)
+    with pytest.raises(RuntimeError):
+        with graph_manager.begin():
+            random_changes(graph_manager, rng, 30)
+            assert snapshot(graph_manager) != before
+            raise RuntimeError
+    assert snapshot(graph_manager) == before
+    assert graph_manager._undo_log is None
+    fresh = GraphInvariants.from_graph(graph_manager.core)
+    assert fresh.degree_counts == graph_manager.core.invariants.degree_counts
+
+def test_nested_rollback_only_undoes_its_own_changes():
+    rng = random.Random(0)
+    graph_manager = random_graph_manager(rng)
+    with graph_manager.begin() as outer:
+        random_changes(graph_manager, rng, 10)
+        middle = snapshot(graph_manager)
+        inner = graph_manager.begin()
+        random_changes(graph_manager, rng, 10)
+        inner.rollback()
+        assert snapshot(graph_manager) == middle
+        recorded = len(outer)
+    assert outer.changes is not None and len(outer.changes) == recorded
+    assert snapshot(graph_manager) == middle
+
+def test_committed_changes_replay_and_undo():
+    rng = random.Random(1)
+    graph_manager = random_graph_manager(rng)
+    before = snapshot(graph_manager)
+    with graph_manager.begin() as transaction:
+        random_changes(graph_manager, rng, 30)
+    after = snapshot(graph_manager)
+    for operation in reversed(transaction.changes):
+        graph_manager._undo(operation)
+    assert snapshot(graph_manager) == before
+    for operation in transaction.changes:
+        graph_manager._redo(operation)
+    assert snapshot(graph_manager) == after
@@ -0,0 +1,126 @@
+import random
+
+import pytest
+
+from classes import GraphManager, RuleManager
+from dpo import apply_dpo_rule, has_attributes, iter_matches
+from journal import DerivationJournal, JournalReader
+from pattern_network import PatternNetwork
+from rule_plan import compile_rule
+
+from conftest import GROW, PATH, edge, match_keys, node, rule
+
+LABELS = ['Person', 'Company', None]
+
+def typed_graph(rng, size=12, edge_probability=0.35):
+    """A random graph whose nodes are labelled with `LABELS` and whose edges have a random weight."""
+    elements = []
+    for i in range(size):
+        label = rng.choice(LABELS)
+        elements.append(node(f'v{i}', label=label) if label else node(f'v{i}'))
+    elements.extend(edge(f'v{i}', f'v{j}', weight=rng.randrange(2)) for i in range(size) for j in range(i + 1, size)
+                    if rng.random() < edge_probability)
+    return GraphManager.from_elements(elements)
+
+# A person employed by a company, and a path through a person over a heavy edge
+EMPLOYS = rule('employs', [node('a', label='Person'), node('b', label='Company'), edge('a', 'b')],
+               'ab', [], [node('a', label='Person'), node('b', label='Company')])
+HEAVY = rule('heavy', [node('a'), node('b', label='Person'), node('c'), edge('a', 'b', weight=1), edge('b', 'c')],
+             'abc', ['a-b', 'b-c'], [node('a'), node('b', label='Person'), node('c'), edge('a', 'b'), edge('b', 'c')])
+
+def typed_matches(graph_manager, rule_data):
+    """The matches of the structure of a rule whose images have the data of its typed elements, by brute force."""
+    plan = compile_rule(rule_data)
+    untyped = compile_rule(dict(rule_data, lhs=[{'data': {key: value for key, value in element['data'].items()
+                                                          if key in ('id', 'source', 'target')}}
+                                                for element in rule_data['lhs']]))
+    core = graph_manager.core
+    matches = []
+    for match in iter_matches(core, untyped.lhs_graph, persist_node_id=False):
+        if all(has_attributes(core.node_data(match[n]), a) for n, a in plan.node_attributes.items()) and \
+                all(has_attributes(core.edge_data(*(match[n] for n in pair)), a)
+                    for pair, a in plan.edge_attributes.items()):
+            matches.append(match)
+    return matches
+
+def test_attribute_index_follows_the_graph():
+    graph_manager = GraphManager.from_elements([node('a', label='Person'), node('b', label='Person', age=3),
+                                                node('c', tags=['x']), node('d')])
+    index = graph_manager.core.attribute_index
+    assert index.nodes_with({'label': 'Person'}) >= {'a', 'b'}
+    assert index.nodes_with({'label': 'Person', 'age': 3}) == {'b'}
+    assert index.nodes_with({'label': 'Robot'}) == set()
+    # Unhashable values are not indexed, so the graph is scanned for them
+    assert index.nodes_with({'tags': ['x']}) is None
+    assert graph_manager.find_nodes({'tags': ['x']}) == {'c'}
+    # Nodes added without data are labelled with their ID
+    graph_manager.add_node('e')
+    assert graph_manager.find_nodes({'label': 'e'}) == {'e'}
+
+    transaction = graph_manager.begin()
+    graph_manager.add_node('f', node('f', label='Person'))
+    graph_manager.remove_node('a')
+    assert graph_manager.find_nodes({'label': 'Person'}) == {'b', 'f'}
+    transaction.rollback()
+    assert graph_manager.find_nodes({'label': 'Person'}) == {'a', 'b'}
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('rule_data', [EMPLOYS, HEAVY], ids=['employs', 'heavy'])
+def test_typed_search_equals_filtered_structural_search(seed, rule_data):
+    graph_manager = typed_graph(random.Random(seed))
+    plan = compile_rule(rule_data)
+    expected = match_keys(typed_matches(graph_manager, rule_data))
+    found = list(iter_matches(graph_manager.core, plan.lhs_graph, persist_node_id=False, pattern=plan.pattern))
+    # Typed rules have fewer symmetries, so every kept match is one of the expected ones
+    assert match_keys(found) <= expected
+    assert len(found) * plan.symmetries == len(expected)
+
+@pytest.mark.parametrize('seed', range(3))
+def test_network_of_typed_rules_equals_the_search(seed):
+    rng = random.Random(seed)
+    graph_manager = typed_graph(rng)
+    rules = [RuleManager.from_dict(rule_data) for rule_data in (EMPLOYS, HEAVY, GROW)]
+    network = PatternNetwork(graph_manager, rules, persist_node_id=False)
+    for position, plan in enumerate(network.plans):
+        assert match_keys(network.get_matches(position)) == match_keys(
+            iter_matches(graph_manager.core, plan.lhs_graph, persist_node_id=False, pattern=plan.pattern))
+
+def test_rule_manager_keeps_the_data_of_rule_elements():
+    rule_manager = RuleManager.from_dict(HEAVY)
+    data = rule_manager.to_dict()
+    assert {element['data']['id']: element['data'] for element in data['lhs']} == {
+        element['data']['id']: element['data'] for element in HEAVY['lhs']}
+    assert compile_rule(data) is compile_rule(HEAVY)
+    # The elements are copied, so editing the rule leaves the given data alone
+    rule_manager.lhs.elements[0]['data']['label'] = 'Changed'
+    assert HEAVY['lhs'][0]['data'].get('label') != 'Changed'
+
+def test_created_nodes_get_the_data_of_their_rhs_node(tmp_path):
+    hire = rule('hire', [node('a', label='Company')], 'a', [],
+                [node('a', label='Company'), node('x', label='Person', age=30), edge('a', 'x')])
+    plan = compile_rule(hire)
+    assert plan.added_node_attributes == {'x': {'label': 'Person', 'age': 30}}
+    graph_manager = GraphManager.from_elements([node('a', label='Company')] + PATH[1:])
+    path = str(tmp_path / 'hire.journal')
+    with DerivationJournal(path, graph_manager) as derivation:
+        assert apply_dpo_rule(graph_manager, plan, {'a': 'a'}, journal=derivation)
+    (new_node,) = set(graph_manager.core.nodes()) - {'a', 'b', 'c'}
+    assert graph_manager.core.node_data(new_node) == {'id': new_node, 'label': 'Person', 'age': 30}
+    assert graph_manager.find_nodes({'label': 'Person'}) == {new_node}
+    # Replays and undo/redo keep the data
+    assert JournalReader(path).graph_at().core.node_data(new_node) == graph_manager.core.node_data(new_node)
+    with graph_manager.begin() as transaction:
+        apply_dpo_rule(graph_manager, plan, {'a': 'a'})
+    for operation in reversed(transaction.changes):
+        graph_manager._undo(operation)
+    for operation in transaction.changes:
+        graph_manager._redo(operation)
+    assert len(graph_manager.find_nodes({'label': 'Person', 'age': 30})) == 2
+
+def test_created_nodes_with_different_data_break_symmetries():
+    # Swapping a and b swaps the nodes hung on them, so it is only a symmetry if they get the same data
+    def hang(rule_id, x_data, y_data):
+        return rule(rule_id, [node('a'), node('b')], 'ab', [],
+                    [node('a'), node('b'), node('x', **x_data), node('y', **y_data), edge('a', 'x'), edge('b', 'y')])
+    assert compile_rule(hang('same', {'label': 'X'}, {'label': 'X'})).symmetries == 2
+    assert compile_rule(hang('different', {'label': 'X'}, {'label': 'Y'})).symmetries == 1
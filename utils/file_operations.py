@@ -1,58 +1,89 @@
 import os
 import json
+import threading
+import time
 from datetime import datetime
 import dash
 from dash import html
 
-def save_rule_to_file(rule_data, rules_dir="saved_rules"):
+from store import DEFAULT_STORE_PATH, Store, is_store
+
+# Number of rules per page of the saved rules list
+SAVED_RULES_PAGE_SIZE = 50
+
+# Seconds the rule files of a directory are served from the cache before
+# they are checked for changes made by other processes
+RULE_CACHE_POLL_INTERVAL = 2.0
+
+# The parsed rule files of each rule directory, with the mtime of the
+# directory and the time they were checked, see `load_rules_from_directory`
+_rule_cache = {}
+_rule_cache_lock = threading.Lock()
+
+# The stores opened by `get_store`, by path
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(path=DEFAULT_STORE_PATH, rules_dir="saved_rules"):
     """
-    Save a rule to a JSON file in the specified directory.
-    
+    Get the store the app saves its rules and graphs in.
+
+    The store is opened once per process. When it is first opened, the rule
+    files of `rules_dir` saved by earlier versions of the app are imported
+    into it, once per database.
+
     Parameters
     ----------
-    rule_data : dict
-        The rule data to save
+    path : str, optional
+        Path to the database
     rules_dir : str, optional
-        Directory where rules should be saved
-    
+        Directory of rule files to import
+
     Returns
     -------
-    str
-        Path to the saved file
+    Store
+        The store
     """
-    # Create directory if it doesn't exist
-    if not os.path.exists(rules_dir):
-        os.makedirs(rules_dir)
-    
-    # Get current highest index
-    current_index = 0
-    for filename in os.listdir(rules_dir):
-        if filename.endswith('.json'):
-            try:
-                with open(os.path.join(rules_dir, filename), 'r') as f:
-                    file_data = json.load(f)
-                    if 'index' in file_data and file_data['index'] > current_index:
-                        current_index = file_data['index']
-            except:
-                continue
-    
-    # Add index to rule data
-    rule_data['index'] = current_index + 1
-    
-    # Generate filename using timestamp and rule ID
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"rule_{timestamp}_{rule_data['id'][:8]}.json"
-    filepath = os.path.join(rules_dir, filename)
-    
-    # Save rule to file
-    with open(filepath, 'w') as f:
-        json.dump(rule_data, f, indent=2)
-    
-    return filepath
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = Store(path)
+            if os.path.isdir(rules_dir):
+                imported = store.import_rules(load_rules_from_directory(rules_dir), source=os.path.abspath(rules_dir))
+                if imported:
+                    print(f"Imported {imported} rules from {rules_dir} into {path}")
+            _stores[path] = store
+    return store
+
+def load_rules(source=DEFAULT_STORE_PATH):
+    """
+    Load all saved rules from a store or a rule directory, ordered by index.
+
+    Parameters
+    ----------
+    source : str, optional
+        Path to a store database or to a directory of rule files
+
+    Returns
+    -------
+    list
+        List of rule data dictionaries
+    """
+    if is_store(source):
+        with Store(source) as store:
+            return store.load_rules()
+    return sorted(load_rules_from_directory(source), key=lambda rule: rule.get('index') or 0)
 
 def load_rules_from_directory(rules_dir="saved_rules"):
     """
     Load all rules from the specified directory.
+
+    Rules are served from a process-wide cache. Files added or removed are
+    noticed at once through the mtime of the directory, and the files are
+    checked for changes at most every `RULE_CACHE_POLL_INTERVAL` seconds, so
+    rule files written by other processes are picked up. Only files whose
+    mtime or size changed are parsed again. The returned rule dicts are
+    shared with the cache; copy a rule before modifying it.
     
     Parameters
     ----------
@@ -64,31 +95,78 @@ def load_rules_from_directory(rules_dir="saved_rules"):
     list
         List of rule data dictionaries
     """
-    rules = []
-    
-    if not os.path.exists(rules_dir):
-        return rules
-        
-    for filename in os.listdir(rules_dir):
-        if filename.endswith('.json'):
-            filepath = os.path.join(rules_dir, filename)
-            with open(filepath, 'r') as f:
-                rule_data = json.load(f)
-                rules.append(rule_data)
-    
-    return rules
-    
-def load_saved_rules_list():
-    """Load the list of saved rules from the directory."""
-    rules = load_rules_from_directory()
-    print(rules)
+    directory = os.path.abspath(rules_dir)
+    try:
+        directory_mtime = os.stat(directory).st_mtime_ns
+    except OSError:
+        with _rule_cache_lock:
+            _rule_cache.pop(directory, None)
+        return []
+
+    now = time.monotonic()
+    with _rule_cache_lock:
+        cached = _rule_cache.get(directory)
+    if cached is not None and cached[0] == directory_mtime and now - cached[1] < RULE_CACHE_POLL_INTERVAL:
+        return [rule_data for _, rule_data in cached[2].values()]
+
+    previous = cached[2] if cached is not None else {}
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                stat = entry.stat()
+                key = (stat.st_mtime_ns, stat.st_size)
+                known = previous.get(entry.name)
+                if known is not None and known[0] == key:
+                    files[entry.name] = known
+                    continue
+                with open(entry.path, 'r') as f:
+                    files[entry.name] = (key, json.load(f))
+            except FileNotFoundError:
+                # Removed since the directory was listed
+                continue
+    with _rule_cache_lock:
+        _rule_cache[directory] = (directory_mtime, now, files)
+    return [rule_data for _, rule_data in files.values()]
+
+def saved_rules_page_count(store=None):
+    """The number of pages of the saved rules list, at least 1."""
+    store = store or get_store()
+    return max(1, -(-store.count_rules() // SAVED_RULES_PAGE_SIZE))
+
+def load_saved_rules_list(page=0, store=None):
+    """
+    Build a page of the list of saved rules.
+
+    Only the rules of the page are read from the store, followed by buttons
+    to the previous and next pages if there are several.
+
+    Parameters
+    ----------
+    page : int, optional
+        The page number, from 0; clamped to the existing pages
+    store : Store, optional
+        The store; the one of `get_store` by default
+
+    Returns
+    -------
+    list
+        The children of the saved rules list
+    """
+    store = store or get_store()
+    page_count = saved_rules_page_count(store)
+    page = min(max(page or 0, 0), page_count - 1)
+    rules = store.list_rules(page * SAVED_RULES_PAGE_SIZE, SAVED_RULES_PAGE_SIZE)
     rule_buttons = []
-    for rule in rules:
-        rule_index = rule.get('index', '?')
+    for entry in rules:
+        rule_id = entry['id']
+        rule_index = entry['index']
         rule_container = html.Div([
             html.Button(
                 f"Load Rule {rule_index}",
-                id={'type': 'load-saved-rule-button', 'index': rule['id']},
+                id={'type': 'load-saved-rule-button', 'index': rule_id},
                 style={
                     'margin': '5px',
                     'padding': '5px 10px',
@@ -101,7 +179,7 @@ def load_saved_rules_list():
             ),
             html.Button(
                 "✕",
-                id={'type': 'delete-saved-rule-button', 'index': rule['id']},
+                id={'type': 'delete-saved-rule-button', 'index': rule_id},
                 style={
                     'margin': '5px',
                     'padding': '5px 10px',
@@ -114,6 +192,24 @@ def load_saved_rules_list():
             )
         ], style={'display': 'block'})
         rule_buttons.append(rule_container)
+
+    if page_count > 1:
+        page_button_style = {'margin': '5px', 'padding': '2px 8px', 'cursor': 'pointer'}
+        rule_buttons.append(html.Div([
+            html.Button(
+                "‹",
+                id={'type': 'saved-rules-page-button', 'index': page - 1},
+                disabled=page == 0,
+                style=page_button_style
+            ),
+            html.Span(f"Page {page + 1} of {page_count}"),
+            html.Button(
+                "›",
+                id={'type': 'saved-rules-page-button', 'index': page + 1},
+                disabled=page == page_count - 1,
+                style=page_button_style
+            ),
+        ], style={'textAlign': 'center', 'marginTop': '10px'}))
     return rule_buttons
 
 def save_graph_to_file(graph_data, graphs_dir="saved_graphs"):
@@ -164,33 +260,3 @@ def load_graph_from_file(filepath):
     with open(filepath, 'r') as f:
         graph_data = json.load(f)
     return graph_data
-
-def delete_rule_file(rule_id, rules_dir="saved_rules"):
-    """Delete a rule file based on the rule ID."""
-    if not os.path.exists(rules_dir):
-        return False
-        
-    target_file = None
-    # First find the file without opening it
-    for filename in os.listdir(rules_dir):
-        if filename.endswith('.json'):
-            filepath = os.path.join(rules_dir, filename)
-            try:
-                with open(filepath, 'r') as f:
-                    rule_data = json.load(f)
-                    if rule_data['id'] == rule_id:
-                        target_file = filepath
-                        break
-            except Exception:
-                continue
-
-    # If we found the file, try to delete it
-    if target_file:
-        try:
-            os.remove(target_file)
-            return True
-        except Exception as e:
-            print(f"Error deleting file {target_file}: {str(e)}")
-            return False
-            
-    return False
\ No newline at end of file
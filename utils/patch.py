@@ -0,0 +1,146 @@
+from dash import Patch
+
+# Each removal filters or splices the whole element list in the browser, so
+# beyond this many removals sending the whole list is cheaper than a patch
+PATCH_MAX_REMOVALS = 200
+
+def _element_key(element):
+    data = element['data']
+    return ('source' in data, data['id'])
+
+def element_keys(elements):
+    """
+    Get the keys identifying Cytoscape elements, in the order of the list.
+
+    Parameters
+    ----------
+    elements : list
+        The Cytoscape elements.
+
+    Returns
+    -------
+    list
+        The keys, for the `element_keys` of `graph_update`.
+    """
+    return [_element_key(element) for element in elements]
+
+def elements_patch(removed, added, size, patch=None):
+    """
+    Build the update of a list of Cytoscape elements that removes and adds some of them.
+
+    Removals match elements by value, so this is only for lists the browser
+    does not rewrite, such as the rule data in a store.
+
+    Parameters
+    ----------
+    removed : list
+        The removed elements, equal to the ones in the list.
+    added : list
+        The added elements, nodes before edges.
+    size : int
+        The number of elements in the list after the update.
+    patch : Patch, optional
+        The patch of the list to add the operations to, e.g. ``Patch()['lhs']``.
+
+    Returns
+    -------
+    Patch or None
+        The patch, or None if sending the whole list is cheaper.
+    """
+    if len(removed) > PATCH_MAX_REMOVALS or len(removed) + len(added) > size:
+        return None
+    patch = Patch() if patch is None else patch
+    for element in removed:
+        patch.remove(element)
+    if added:
+        patch.extend(added)
+    return patch
+
+def graph_update(graph_manager, changes, undone=False, element_keys=None):
+    """
+    Get the update of the elements of a graph in the browser after changes to the graph.
+
+    Cytoscape rewrites its elements in the browser, e.g. adding the position
+    of dragged nodes, so removed elements cannot be matched there by value.
+    They are deleted by their position instead, found in the keys of the
+    elements in the order the browser holds them.
+
+    Parameters
+    ----------
+    graph_manager : GraphManager
+        The graph manager, after the changes.
+    changes : list
+        The undo log entries of the changes, see `GraphManager.element_changes`.
+    undone : bool, optional
+        Whether the changes were undone.
+    element_keys : list, optional
+        The `element_keys` of the elements in the browser, updated for the
+        returned update. Without them, removals are sent as all the elements.
+
+    Returns
+    -------
+    Patch or list
+        A patch deleting the removed elements and appending the added ones,
+        or all the elements if that is cheaper or the keys are not known.
+    """
+    removed, added = graph_manager.element_changes(changes, undone)
+    if removed:
+        removed_keys = {_element_key(element) for element in removed}
+        positions = [] if element_keys is None or len(removed) > PATCH_MAX_REMOVALS else \
+            [position for position, key in enumerate(element_keys) if key in removed_keys]
+        if len(positions) != len(removed_keys):
+            elements = graph_manager.elements
+            if element_keys is not None:
+                element_keys[:] = [_element_key(element) for element in elements]
+            return list(elements)
+        element_keys[:] = [key for key in element_keys if key not in removed_keys]
+    patch = Patch()
+    if removed:
+        # From the back, so each deletion leaves the positions of the others in place
+        for position in reversed(positions):
+            del patch[position]
+    patch.extend(added)
+    if element_keys is not None:
+        element_keys.extend(_element_key(element) for element in added)
+    return patch
+
+def rule_patch(old_rule, new_rule):
+    """
+    Build the update of rule data in the browser from its old and new data.
+
+    The LHS and RHS element lists are patched element by element, and other
+    entries are replaced if they changed.
+
+    Parameters
+    ----------
+    old_rule : dict
+        The rule data the browser holds.
+    new_rule : dict
+        The new rule data.
+
+    Returns
+    -------
+    Patch or dict
+        The patch, or the new rule data if the browser holds no rule.
+    """
+    if not old_rule:
+        return new_rule
+    patch = Patch()
+    for key, value in new_rule.items():
+        if key not in ('lhs', 'rhs'):
+            if old_rule.get(key) != value:
+                patch[key] = value
+            continue
+        old_elements = {_element_key(element): element for element in old_rule.get(key, [])}
+        new_elements = {_element_key(element): element for element in value}
+        removed = [element for element_key, element in old_elements.items()
+                   if new_elements.get(element_key) != element]
+        added = [element for element_key, element in new_elements.items()
+                 if old_elements.get(element_key) != element]
+        # Nodes first, so added edges never refer to missing nodes
+        added.sort(key=lambda element: 'source' in element['data'])
+        if elements_patch(removed, added, len(value), patch[key]) is None:
+            patch[key] = value
+    for key in old_rule.keys() - new_rule.keys():
+        del patch[key]
+    return patch